@@ -0,0 +1,432 @@
+"""
+Scalability benchmarks for split_notebooks.py.
+
+Generates synthetic courses trees of increasing size and times the discovery,
+splitting and navigation stages on each. Results are written to a JSON file
+so runs from different commits can be compared with --compare.
+
+Only public entry points are timed, and options or functions that older
+versions of split_notebooks.py lack (the tree index, streaming splits,
+write_toc_yml_from_courses) are detected and their benchmarks skipped, so
+the script runs against any commit, including the original one.
+
+Example:
+    python benchmark_split_notebooks.py --sizes 10 100 1000 --output bench.json
+    python benchmark_split_notebooks.py --compare bench.json --output bench_new.json
+"""
+
+import os
+import json
+import time
+import random
+import shutil
+import base64
+import platform
+import inspect
+import argparse
+import tempfile
+import contextlib
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+import split_notebooks
+
+DEFAULT_SIZES = [10, 100, 1000]
+DEFAULT_OUTPUT = "benchmark_results.json"
+
+# Category directories used to nest courses; "learning_paths" and
+# "extra_courses" are not split_notebooks.CATEGORY_DIRS, so they exercise the
+# nested (non-category) course detection path
+SYNTHETIC_CATEGORIES = ["foundations", "workloads", "learning_paths", "extra_courses"]
+
+# Directories that every stage must skip
+NOISE_DIRS = ["sources", "outputs", "output", "01_lesson"]
+
+
+def make_cell(cell_type, source, outputs=None):
+    """Build a minimal nbformat 4 cell."""
+    cell = {"cell_type": cell_type, "metadata": {}, "source": source}
+    if cell_type == "code":
+        cell["execution_count"] = None
+        cell["outputs"] = outputs or []
+    return cell
+
+
+def make_synthetic_notebook(rng, sections, big_output_bytes=0):
+    """
+    Build a notebook dict with a title, the given number of '##' sections
+    (each with '###' subsections, image references and code cells) and,
+    optionally, one embedded PNG output of roughly big_output_bytes.
+    """
+    cells = [make_cell("markdown", ["# Synthetic notebook\n", "\n", "Intro text."])]
+    for section in range(sections):
+        cells.append(
+            make_cell(
+                "markdown",
+                [
+                    f"## Section {section}\n",
+                    "\n",
+                    "Some explanation with an image:\n",
+                    f"![diagram](images/diagram_{section}.png)\n",
+                    f'<img src="./images/figure_{section}.png" width="400">\n',
+                ],
+            )
+        )
+        for sub in range(rng.randint(1, 3)):
+            cells.append(make_cell("markdown", [f"### Step {section}.{sub}\n", "text"]))
+            cells.append(
+                make_cell(
+                    "code",
+                    [f"result = compute({section}, {sub})\n", "print(result)"],
+                    [{"output_type": "stream", "name": "stdout", "text": ["42\n"]}],
+                )
+            )
+    if big_output_bytes:
+        payload = base64.b64encode(rng.randbytes(big_output_bytes * 3 // 4)).decode()
+        cells.append(
+            make_cell(
+                "code",
+                ["plot()"],
+                [
+                    {
+                        "output_type": "display_data",
+                        "metadata": {},
+                        "data": {"image/png": payload, "text/plain": ["<Figure>"]},
+                    }
+                ],
+            )
+        )
+    return {
+        "cells": cells,
+        "metadata": {"kernelspec": {"name": "python3", "display_name": "Python 3"}},
+        "nbformat": 4,
+        "nbformat_minor": 5,
+    }
+
+
+def write_notebook(path, nb):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(nb, f, indent=1)
+
+
+def generate_synthetic_courses(
+    root,
+    num_courses,
+    seed=0,
+    sections=6,
+    big_output_every=10,
+    big_output_bytes=256 * 1024,
+):
+    """
+    Generate a synthetic courses tree under root with num_courses courses.
+
+    Courses are spread over nested categories. About half are flat
+    (notebooks directly in the course folder), the rest have numbered module
+    subdirectories. Every course also contains noise directories (sources/,
+    outputs/, output/, *_lesson/) holding notebooks that must be ignored.
+    Every big_output_every-th notebook embeds an image output of about
+    big_output_bytes. Returns the number of source notebooks written.
+    """
+    rng = random.Random(seed)
+    notebook_count = 0
+    for course in range(num_courses):
+        category = SYNTHETIC_CATEGORIES[course % len(SYNTHETIC_CATEGORIES)]
+        course_dir = os.path.join(root, category, f"Course_{course:04d}")
+        if course % 2 == 0:
+            notebook_dirs = [course_dir]
+        else:
+            notebook_dirs = [
+                os.path.join(course_dir, f"{module:02d}_Module_{module}")
+                for module in range(rng.randint(2, 4))
+            ]
+        for notebook_dir in notebook_dirs:
+            for nb_index in range(rng.randint(1, 3)):
+                notebook_count += 1
+                big = big_output_bytes if notebook_count % big_output_every == 0 else 0
+                nb = make_synthetic_notebook(rng, rng.randint(2, sections), big)
+                write_notebook(
+                    os.path.join(notebook_dir, f"{nb_index:02d}_Lesson.ipynb"), nb
+                )
+            os.makedirs(os.path.join(notebook_dir, "images"), exist_ok=True)
+        for noise in NOISE_DIRS:
+            write_notebook(
+                os.path.join(course_dir, noise, "ignored.ipynb"),
+                make_synthetic_notebook(rng, 1),
+            )
+    return notebook_count
+
+
+def time_call(func, repeat):
+    """
+    Run func repeat times with its progress output discarded; return
+    (timings in seconds, last result).
+    """
+    timings = []
+    result = None
+    with open(os.devnull, "w") as devnull:
+        for _ in range(repeat):
+            with contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                result = func()
+                timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def accepted_kwargs(func, **kwargs):
+    """The kwargs that func accepts, so newer options can be passed to older versions."""
+    parameters = inspect.signature(func).parameters
+    return {name: value for name, value in kwargs.items() if name in parameters}
+
+
+def summarize(timings):
+    return {
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "max_s": max(timings),
+        "runs": len(timings),
+    }
+
+
+def split_all(courses_notebooks, **options):
+    """
+    Split every notebook of every course with the given split_notebook_by_h2
+    options (e.g. stream=True); returns courses_data like main().
+    """
+    courses_data = {}
+    for course_folder, notebooks in courses_notebooks.items():
+        parts = []
+        for nb_path in notebooks:
+            output_dir = os.path.join(os.path.dirname(nb_path), "output")
+            parts.extend(
+                split_notebooks.split_notebook_by_h2(
+                    nb_path, output_dir, force=True, **options
+                )
+            )
+        if parts:
+            courses_data[course_folder] = parts
+    return courses_data
+
+
+def run_benchmarks_for_size(num_courses, repeat, seed, workdir):
+    """Generate a tree with num_courses courses in workdir and time every stage."""
+    courses_root = "courses"
+    tree_dir = os.path.join(workdir, f"courses_{num_courses}")
+    os.makedirs(tree_dir, exist_ok=True)
+    previous_cwd = os.getcwd()
+    os.chdir(tree_dir)
+    try:
+        start = time.perf_counter()
+        notebook_count = generate_synthetic_courses(courses_root, num_courses, seed)
+        generate_s = time.perf_counter() - start
+        print(
+            f"Generated {num_courses} courses, {notebook_count} notebooks "
+            f"in {generate_s:.2f}s"
+        )
+
+        results = {}
+
+        def record(name, timings):
+            results[name] = summarize(timings)
+            print(f"  {name:<32} median {results[name]['median_s'] * 1000:10.2f} ms")
+
+        def skip(name):
+            print(f"  {name:<32} skipped (not in this version)")
+
+        # Older versions have no tree index and walk the filesystem instead
+        has_index = hasattr(split_notebooks, "build_tree_index")
+
+        def tree_index():
+            return split_notebooks.build_tree_index(courses_root) if has_index else None
+
+        if has_index:
+            timings, _ = time_call(tree_index, repeat)
+            record("build_tree_index", timings)
+        else:
+            skip("build_tree_index")
+
+        # Includes building the index, which replaces part of the walk
+        timings, courses_notebooks = time_call(
+            lambda: split_notebooks.find_notebooks_by_course(
+                courses_root,
+                **accepted_kwargs(
+                    split_notebooks.find_notebooks_by_course, index=tree_index()
+                ),
+            ),
+            repeat,
+        )
+        record("find_notebooks_by_course", timings)
+
+        timings, courses_data = time_call(lambda: split_all(courses_notebooks), repeat)
+        record("split_notebook_by_h2", timings)
+
+        if (
+            "stream"
+            in inspect.signature(split_notebooks.split_notebook_by_h2).parameters
+        ):
+            timings, _ = time_call(
+                lambda: split_all(courses_notebooks, stream=True), repeat
+            )
+            record("split_notebook_by_h2_stream", timings)
+        else:
+            skip("split_notebook_by_h2_stream")
+
+        # Pick up the split outputs, as main() does after the split stage
+        index = tree_index()
+
+        timings, _ = time_call(
+            lambda: split_notebooks.group_courses_by_category(courses_data), repeat
+        )
+        record("group_courses_by_category", timings)
+
+        # Older versions write _toc.yml inline in main()
+        if hasattr(split_notebooks, "write_toc_yml_from_courses"):
+            timings, _ = time_call(
+                lambda: split_notebooks.write_toc_yml_from_courses(
+                    courses_data,
+                    {},
+                    "_toc.yml",
+                    courses_root,
+                    **accepted_kwargs(
+                        split_notebooks.write_toc_yml_from_courses, index=index
+                    ),
+                ),
+                repeat,
+            )
+            record("write_toc_yml_from_courses", timings)
+        else:
+            skip("write_toc_yml_from_courses")
+
+        timings, _ = time_call(
+            lambda: split_notebooks.write_index_md_from_courses(
+                courses_data,
+                {},
+                "index.md",
+                courses_root,
+                **accepted_kwargs(
+                    split_notebooks.write_index_md_from_courses, index=index
+                ),
+            ),
+            repeat,
+        )
+        record("write_index_md_from_courses", timings)
+
+        return {
+            "courses": num_courses,
+            "notebooks": notebook_count,
+            "split_parts": sum(len(parts) for parts in courses_data.values()),
+            "benchmarks": results,
+        }
+    finally:
+        os.chdir(previous_cwd)
+
+
+def git_revision():
+    """
+    Git commit of the checkout split_notebooks was imported from (which may
+    not be this script's), or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(split_notebooks.__file__)),
+        ).stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+def compare_results(baseline, current):
+    """Print the median-time ratio current/baseline for every shared benchmark."""
+    print("\n" + "=" * 78)
+    print(f"Comparison against {baseline.get('git_revision') or 'baseline'}")
+    print("=" * 78)
+    print(
+        f"{'courses':>8}  {'benchmark':<32} {'before ms':>11} {'after ms':>11} {'ratio':>7}"
+    )
+    baseline_runs = {run["courses"]: run for run in baseline.get("runs", [])}
+    for run in current["runs"]:
+        before_run = baseline_runs.get(run["courses"])
+        if before_run is None:
+            continue
+        for name, stats in run["benchmarks"].items():
+            before = before_run["benchmarks"].get(name)
+            if before is None:
+                continue
+            ratio = stats["median_s"] / before["median_s"] if before["median_s"] else 0
+            print(
+                f"{run['courses']:>8}  {name:<32} {before['median_s'] * 1000:>11.2f} "
+                f"{stats['median_s'] * 1000:>11.2f} {ratio:>6.2f}x"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark split_notebooks.py on synthetic courses trees"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help=f"Numbers of courses to generate (default: {DEFAULT_SIZES})",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Timed runs per benchmark (default: 3)"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Random seed for the generator"
+    )
+    parser.add_argument(
+        "--output",
+        default=DEFAULT_OUTPUT,
+        help=f"JSON file to write results to (default: {DEFAULT_OUTPUT})",
+    )
+    parser.add_argument(
+        "--compare", help="Previous results JSON file to compare against"
+    )
+    parser.add_argument(
+        "--keep",
+        help="Generate trees in this directory and keep them instead of a temp dir",
+    )
+    args = parser.parse_args()
+
+    workdir = args.keep or tempfile.mkdtemp(prefix="split_notebooks_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    output_path = os.path.abspath(args.output)
+
+    runs = []
+    try:
+        for num_courses in args.sizes:
+            print(f"\nBenchmarking {num_courses} courses...")
+            runs.append(
+                run_benchmarks_for_size(num_courses, args.repeat, args.seed, workdir)
+            )
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "git_revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "runs": runs,
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+        f.write("\n")
+    print(f"\nWrote benchmark results to {output_path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare_results(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Compare the Parquet layouts of main.py: bytes on disk and write throughput
+of the tensor layout (fixed-shape tensor column, file-level metadata) against
+the legacy one (per-row metadata struct), for each codec and row-group size.
+
+Each layout's dataset is materialized once before the timed writes, so the
+numbers cover conversion, encoding, compression and I/O but not image
+generation. Uniformly random pixels barely compress; the codec columns show
+the CPU cost rather than the savings real images would get.
+
+Example:
+    python benchmark_image_writer.py --num-images 2000 \
+        --compressions none snappy zstd --row-group-sizes 32 128
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import itertools
+import tempfile
+
+import ray
+
+from main import (
+    COMPRESSIONS,
+    DEFAULT_COMPRESSION,
+    DEFAULT_ROW_GROUP_SIZE,
+    LAYOUTS,
+    build_dataset,
+    write_images,
+)
+
+DEFAULT_NUM_IMAGES = 1000
+DEFAULT_OUTPUT = "image_writer_benchmark.json"
+
+
+def directory_size(path):
+    """Total size in bytes of the files under path."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def run_write(ds, workdir, layout, compression, row_group_size, num_images):
+    """Time one write of ds and return its measurements."""
+    output_path = tempfile.mkdtemp(prefix="out_", dir=workdir)
+    try:
+        start = time.perf_counter()
+        write_images(ds, output_path, layout, compression, row_group_size)
+        wall_s = time.perf_counter() - start
+        output_bytes = directory_size(output_path)
+    finally:
+        shutil.rmtree(output_path, ignore_errors=True)
+    return {
+        "layout": layout,
+        "compression": compression,
+        "row_group_size": row_group_size,
+        "wall_s": round(wall_s, 4),
+        "images_per_s": round(num_images / wall_s, 1),
+        "output_bytes": output_bytes,
+    }
+
+
+def print_results(results, reference="legacy"):
+    """One line per write, with size and throughput relative to the reference layout."""
+    baseline = {
+        (r["compression"], r["row_group_size"]): r
+        for r in results
+        if r["layout"] == reference
+    }
+    print(
+        f"\n{'layout':<8} {'codec':<8} {'rg rows':>8} {'wall s':>8} "
+        f"{'images/s':>10} {'MB on disk':>11} {'size':>7} {'speed':>7}"
+    )
+    for r in results:
+        base = baseline.get((r["compression"], r["row_group_size"]))
+        size = speed = "-"
+        if base and r["layout"] != reference:
+            size = f"{r['output_bytes'] / base['output_bytes']:.2f}x"
+            speed = f"{r['images_per_s'] / base['images_per_s']:.2f}x"
+        print(
+            f"{r['layout']:<8} {r['compression']:<8} {r['row_group_size']:>8} "
+            f"{r['wall_s']:>8.2f} {r['images_per_s']:>10,.1f} "
+            f"{r['output_bytes'] / 1e6:>11.1f} {size:>7} {speed:>7}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare bytes on disk and write throughput of the image layouts"
+    )
+    parser.add_argument(
+        "--num-images",
+        type=int,
+        default=DEFAULT_NUM_IMAGES,
+        help=f"Images per dataset, about 1MB each (default: {DEFAULT_NUM_IMAGES})",
+    )
+    parser.add_argument(
+        "--layouts",
+        nargs="+",
+        choices=LAYOUTS,
+        default=list(LAYOUTS),
+        help="Layouts to write (default: all)",
+    )
+    parser.add_argument(
+        "--compressions",
+        nargs="+",
+        choices=COMPRESSIONS,
+        default=[DEFAULT_COMPRESSION],
+        help=f"Parquet codecs (default: {DEFAULT_COMPRESSION})",
+    )
+    parser.add_argument(
+        "--row-group-sizes",
+        nargs="+",
+        type=int,
+        default=[DEFAULT_ROW_GROUP_SIZE],
+        help=f"Images per row group (default: {DEFAULT_ROW_GROUP_SIZE})",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="Writes per configuration (default: 1)"
+    )
+    parser.add_argument(
+        "--num-cpus", type=int, help="CPUs for a local Ray instance (default: all)"
+    )
+    parser.add_argument(
+        "--output",
+        default=DEFAULT_OUTPUT,
+        help=f"JSON file to write results to (default: {DEFAULT_OUTPUT})",
+    )
+    args = parser.parse_args()
+
+    ray.init(num_cpus=args.num_cpus, ignore_reinit_error=True)
+    workdir = tempfile.mkdtemp(prefix="image_writer_bench_")
+    results = []
+    try:
+        for layout in args.layouts:
+            start = time.perf_counter()
+            ds = build_dataset(args.num_images, layout=layout).materialize()
+            print(
+                f"Generated {args.num_images:,} images ({layout}) "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+            for compression, row_group_size in itertools.product(
+                args.compressions, args.row_group_sizes
+            ):
+                for _ in range(args.repeat):
+                    print(f"Writing {layout} {compression} {row_group_size}...")
+                    results.append(
+                        run_write(
+                            ds,
+                            workdir,
+                            layout,
+                            compression,
+                            row_group_size,
+                            args.num_images,
+                        )
+                    )
+            del ds
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"num_images": args.num_images, "results": results}, f, indent=1)
+        f.write("\n")
+    print(f"\nWrote results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,38 +2,266 @@ import ray
 import numpy as np
 import os
 import time
-from typing import Dict, Any
-
+import argparse
+import resource
+import json
+import pyarrow as pa
+from typing import Dict
 
 """
 Each image is about 1MB. (HxWxC = 580x580x3 = 1MB)
 So 1 billion images would be 1 PB. (10^9 * 1MB = 1PB)
+
+Image ids come from ray.data.range, so the driver never holds the id list,
+and images are generated a batch at a time in map_batches. Every image is
+drawn from a numpy Generator seeded with (SEED, image id), so its pixels do
+not depend on how ray.data.range splits the ids into blocks, which varies
+with the cluster's CPU count.
+
+The default "tensor" layout stores each image in a fixed-shape tensor
+extension column (arrow.fixed_shape_tensor), and the dtype, shape and
+generator are written once as file-level key/value metadata instead of a
+per-row struct. --layout legacy writes the original per-row layout.
+
+Local test run (writes to ./synthetic_image_output):
+    python main.py --local --num-images 100000
 """
 NUM_IMAGES = 10**9
+LOCAL_NUM_IMAGES = 10**5
 IMAGE_WIDTH = 580
 IMAGE_HEIGHT = 580
 CHANNELS = 3
+# About 100MB of images per map_batches call
+IMAGES_PER_BATCH = 100
+SEED = 0
+GENERATED_BY = "ray_data_synthetic"
+
+LAYOUTS = ("tensor", "legacy")
+COMPRESSIONS = ("none", "snappy", "zstd", "lz4", "gzip", "brotli")
+DEFAULT_COMPRESSION = "snappy"
+# About 128MB per row group; pyarrow's default (1M rows) would be 1TB of images
+DEFAULT_ROW_GROUP_SIZE = 128
+METADATA_PREFIX = "synthetic_image."
 
 
-def generate_synthetic_image(image_id: int, width: int = 580, height: int = 580, channels: int = 3) -> Dict[str, Any]:
-    image_array = np.random.randint(0, 256, size=(height, width, channels), dtype=np.uint8)
+def draw_images(
+    image_ids: np.ndarray, width: int, height: int, channels: int, seed: int
+) -> np.ndarray:
+    """
+    The images of a batch as one (n, height, width, channels) uint8 array.
+    Each image is one bulk draw of random bytes from a Generator seeded with
+    (seed, image id), written straight into the batch array.
+    """
+    image_size = height * width * channels
+    images = np.empty((len(image_ids), height, width, channels), dtype=np.uint8)
+    rows = images.reshape(len(image_ids), image_size)
+    for row, image_id in zip(rows, image_ids):
+        rng = np.random.default_rng([seed, int(image_id)])
+        row[:] = np.frombuffer(rng.bytes(image_size), dtype=np.uint8)
+    return images
+
+
+def generate_synthetic_images(
+    batch: Dict[str, np.ndarray],
+    width: int = IMAGE_WIDTH,
+    height: int = IMAGE_HEIGHT,
+    channels: int = CHANNELS,
+    seed: int = SEED,
+) -> Dict[str, np.ndarray]:
+    """
+    Synthetic images with per-row metadata for map_batches: batch["id"]
+    holds the image ids from ray.data.range.
+    """
+    image_ids = batch["id"]
+    images = draw_images(image_ids, width, height, channels, seed)
+    metadata = {
+        "dtype": str(images.dtype),
+        "shape": (height, width, channels),
+        "generated_by": GENERATED_BY,
+    }
     return {
-        "image_id": image_id,
-        "image_array": image_array,
-        "metadata": {
-            "dtype": str(image_array.dtype),
-            "shape": image_array.shape,
-            "generated_by": "ray_data_synthetic"
-        }
+        "image_id": image_ids,
+        "image_array": images,
+        "metadata": np.array([metadata] * len(image_ids), dtype=object),
     }
 
 
+def generate_synthetic_image_table(
+    batch: Dict[str, np.ndarray],
+    width: int = IMAGE_WIDTH,
+    height: int = IMAGE_HEIGHT,
+    channels: int = CHANNELS,
+    seed: int = SEED,
+) -> pa.Table:
+    """
+    generate_synthetic_images for the tensor layout: the images go into one
+    fixed-shape tensor column (a single contiguous uint8 buffer) and there
+    is no per-row metadata.
+    """
+    image_ids = batch["id"]
+    images = draw_images(image_ids, width, height, channels, seed)
+    return pa.table(
+        {
+            "image_id": pa.array(image_ids, type=pa.int64()),
+            "image_array": pa.FixedShapeTensorArray.from_numpy_ndarray(images),
+        }
+    )
+
+
+def tensor_schema(
+    width: int = IMAGE_WIDTH, height: int = IMAGE_HEIGHT, channels: int = CHANNELS
+) -> pa.Schema:
+    """Schema of the tensor layout, with the constant image metadata attached."""
+    shape = (height, width, channels)
+    return pa.schema(
+        [
+            ("image_id", pa.int64()),
+            ("image_array", pa.fixed_shape_tensor(pa.uint8(), shape)),
+        ],
+        metadata={
+            METADATA_PREFIX + "dtype": "uint8",
+            METADATA_PREFIX + "shape": json.dumps(shape),
+            METADATA_PREFIX + "generated_by": GENERATED_BY,
+        },
+    )
+
+
+def build_dataset(
+    num_images: int,
+    width: int = IMAGE_WIDTH,
+    height: int = IMAGE_HEIGHT,
+    channels: int = CHANNELS,
+    images_per_batch: int = IMAGES_PER_BATCH,
+    seed: int = SEED,
+    layout: str = "tensor",
+) -> ray.data.Dataset:
+    ds = ray.data.range(num_images)
+    return ds.map_batches(
+        (
+            generate_synthetic_image_table
+            if layout == "tensor"
+            else generate_synthetic_images
+        ),
+        batch_size=images_per_batch,
+        batch_format="numpy",
+        fn_kwargs={
+            "width": width,
+            "height": height,
+            "channels": channels,
+            "seed": seed,
+        },
+    )
+
+
+def write_images(
+    ds: ray.data.Dataset,
+    output_path: str,
+    layout: str = "tensor",
+    compression: str = DEFAULT_COMPRESSION,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    width: int = IMAGE_WIDTH,
+    height: int = IMAGE_HEIGHT,
+    channels: int = CHANNELS,
+) -> None:
+    """
+    Write ds to Parquet with the given codec and rows per row group. For the
+    tensor layout the schema carries the file-level key/value metadata.
+    Ray 2.48 (the job image) turns row_group_size into pyarrow's
+    min/max_rows_per_group and casts every block to the given schema; check
+    with pyarrow.parquet.read_metadata(file).num_row_groups / .metadata.
+    """
+    write_kwargs = {"compression": compression, "row_group_size": row_group_size}
+    if layout == "tensor":
+        write_kwargs["schema"] = tensor_schema(width, height, channels)
+    ds.write_parquet(output_path, **write_kwargs)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic images with Ray Data and write them to Parquet"
+    )
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="Run on a local Ray instance and write to local disk "
+        f"(default --num-images: {LOCAL_NUM_IMAGES})",
+    )
+    parser.add_argument(
+        "--num-images",
+        type=int,
+        help=f"Images to generate (default: {NUM_IMAGES}, or {LOCAL_NUM_IMAGES} with --local)",
+    )
+    parser.add_argument(
+        "--output-path",
+        help="Where to write the Parquet files (default: "
+        "$ANYSCALE_ARTIFACT_STORAGE/rkn/synthetic_image_output, or "
+        "./synthetic_image_output with --local)",
+    )
+    parser.add_argument(
+        "--images-per-batch",
+        type=int,
+        default=IMAGES_PER_BATCH,
+        help=f"Images per map_batches call (default: {IMAGES_PER_BATCH})",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=LAYOUTS,
+        default="tensor",
+        help="tensor: fixed-shape tensor column and file-level metadata; "
+        "legacy: per-row metadata struct (default: tensor)",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSIONS,
+        default=DEFAULT_COMPRESSION,
+        help=f"Parquet codec (default: {DEFAULT_COMPRESSION})",
+    )
+    parser.add_argument(
+        "--row-group-size",
+        type=int,
+        default=DEFAULT_ROW_GROUP_SIZE,
+        help=f"Images per Parquet row group (default: {DEFAULT_ROW_GROUP_SIZE})",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=SEED, help=f"Base seed (default: {SEED})"
+    )
+    parser.add_argument(
+        "--num-cpus", type=int, help="CPUs for the local Ray instance (default: all)"
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    image_ids = list(range(NUM_IMAGES))
-    output_path = os.path.join(os.environ["ANYSCALE_ARTIFACT_STORAGE"], "rkn/synthetic_image_output")
+    args = parse_args()
+    if args.local:
+        ray.init(num_cpus=args.num_cpus)
+        num_images = args.num_images or LOCAL_NUM_IMAGES
+        output_path = args.output_path or os.path.abspath("synthetic_image_output")
+    else:
+        num_images = args.num_images or NUM_IMAGES
+        output_path = args.output_path or os.path.join(
+            os.environ["ANYSCALE_ARTIFACT_STORAGE"], "rkn/synthetic_image_output"
+        )
 
-    ds = ray.data.from_items(image_ids)
-    ds = ds.repartition(target_num_rows_per_block=1000)
-    ds = ds.map(lambda x: generate_synthetic_image(x["item"], IMAGE_WIDTH, IMAGE_HEIGHT, CHANNELS))
-    ds.write_parquet(output_path)
+    start = time.perf_counter()
+    ds = build_dataset(
+        num_images,
+        images_per_batch=args.images_per_batch,
+        seed=args.seed,
+        layout=args.layout,
+    )
+    write_images(
+        ds,
+        output_path,
+        layout=args.layout,
+        compression=args.compression,
+        row_group_size=args.row_group_size,
+    )
+    elapsed = time.perf_counter() - start
 
+    # ru_maxrss is in KB on Linux
+    driver_peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"Wrote {num_images:,} images to {output_path} in {elapsed:.1f}s "
+        f"({num_images / elapsed:,.0f} images/s, driver peak RSS {driver_peak_mb:.0f} MB)"
+    )
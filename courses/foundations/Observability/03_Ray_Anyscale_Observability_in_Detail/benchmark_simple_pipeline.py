@@ -0,0 +1,408 @@
+"""
+Throughput sweep for the simple_pipeline.py Ray Data job.
+
+simple_pipeline.py reads one NYC taxi parquet file from S3, runs
+slow_adjust_total_amount with default map_batches settings and writes to a
+fixed path. This script calls its run_pipeline against a generated local
+parquet stand-in of configurable size and sweeps batch_size, concurrency and
+the target block size. For each configuration it captures ds.stats() and
+reports rows/s, bytes/s, per-operator wall time and object store spilling.
+The artificial time.sleep(10) is off by default (--sleep-seconds 10
+reproduces the original).
+
+--pipelines baseline optimized also runs simple_pipeline_optimized.py on
+the same grid and prints its throughput, peak worker heap memory and output
+size next to the baseline's.
+
+Example:
+    python benchmark_simple_pipeline.py --rows 5000000 \
+        --batch-sizes 1024 8192 default --concurrency 2 4 --block-sizes-mb 16 128
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import argparse
+import itertools
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import ray
+
+from simple_pipeline import run_pipeline
+from simple_pipeline_optimized import run_optimized_pipeline
+
+DEFAULT_ROWS = 1_000_000
+DEFAULT_FILES = 8
+DEFAULT_OUTPUT = "simple_pipeline_benchmark.json"
+# Written into the stand-in's info file; only directories carrying it are
+# ever deleted and regenerated
+STAND_IN_MARKER = "benchmark_simple_pipeline stand-in"
+
+# "Operator 1 ReadParquet->MapBatches(...): 8 tasks executed, 8 blocks produced in 2.05s"
+OPERATOR_STATS_PATTERN = re.compile(
+    r"^Operator \d+ (?P<name>.+?): .*? in (?P<seconds>[\d.]+)s", re.MULTILINE
+)
+SPILLED_PATTERN = re.compile(r"Spilled to disk: (?P<mb>[\d.]+)\s*MB")
+# "* Peak heap memory usage (MiB): 310.5 min, 402.25 max, 377 mean"
+PEAK_HEAP_PATTERN = re.compile(
+    r"Peak heap memory usage \(MiB\): [\d.]+ min, (?P<max>[\d.]+) max"
+)
+
+
+def generate_taxi_parquet(path, num_rows=DEFAULT_ROWS, num_files=DEFAULT_FILES, seed=0):
+    """
+    Write a local stand-in for the yellow_tripdata_2011-05 parquet file:
+    num_rows rows with the same column names and types, split over num_files
+    files. Returns {"rows", "files", "bytes"} (bytes: in-memory Arrow size)
+    and also stores it, with STAND_IN_MARKER, in path + ".json", so an
+    existing stand-in is reused.
+
+    A stand-in of another size is deleted and regenerated only if its info
+    file carries the marker; any other non-empty directory at path raises
+    FileExistsError rather than being deleted.
+    """
+    info_path = os.path.normpath(path) + ".json"
+    info = None
+    if os.path.exists(info_path):
+        with open(info_path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+    if not isinstance(info, dict) or info.get("marker") != STAND_IN_MARKER:
+        if os.path.isdir(path) and os.listdir(path):
+            raise FileExistsError(
+                f"{path} is not empty and was not generated by this script; "
+                "pass an empty or new --data-dir"
+            )
+    elif info["rows"] == num_rows and info["files"] == num_files:
+        return info
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2011-05-01T00:00:00", "s")
+    total_bytes = 0
+    for i, rows in enumerate(np.array_split(np.arange(num_rows), num_files)):
+        n = len(rows)
+        pickup = start + rng.integers(0, 31 * 24 * 3600, n).astype("timedelta64[s]")
+        fare = np.round(rng.gamma(2.0, 5.0, n), 2)
+        tip = np.round(fare * rng.choice([0.0, 0.1, 0.15, 0.2], n), 2)
+        tolls = np.where(rng.random(n) < 0.05, 5.5, 0.0)
+        table = pa.table(
+            {
+                "vendor_id": pa.array(rng.choice(["CMT", "VTS"], n)),
+                "pickup_at": pa.array(pickup),
+                "dropoff_at": pa.array(
+                    pickup + rng.integers(60, 3600, n).astype("timedelta64[s]")
+                ),
+                "passenger_count": pa.array(rng.integers(1, 7, n).astype(np.int8)),
+                "trip_distance": pa.array(
+                    np.round(rng.exponential(3.0, n), 2).astype(np.float32)
+                ),
+                "pickup_longitude": pa.array(rng.normal(-73.98, 0.05, n)),
+                "pickup_latitude": pa.array(rng.normal(40.75, 0.05, n)),
+                "rate_code_id": pa.array(rng.integers(1, 7, n).astype(np.int8)),
+                "store_and_fwd_flag": pa.array(
+                    rng.choice(["N", "Y"], n, p=[0.99, 0.01])
+                ),
+                "dropoff_longitude": pa.array(rng.normal(-73.98, 0.05, n)),
+                "dropoff_latitude": pa.array(rng.normal(40.75, 0.05, n)),
+                "payment_type": pa.array(rng.choice(["CRD", "CSH"], n)),
+                "fare_amount": pa.array(fare.astype(np.float32)),
+                "extra": pa.array(rng.choice([0.0, 0.5, 1.0], n).astype(np.float32)),
+                "mta_tax": pa.array(np.full(n, 0.5, dtype=np.float32)),
+                "tip_amount": pa.array(tip.astype(np.float32)),
+                "tolls_amount": pa.array(tolls.astype(np.float32)),
+                "total_amount": pa.array((fare + tip + tolls + 0.5).astype(np.float32)),
+            }
+        )
+        total_bytes += table.nbytes
+        pq.write_table(table, os.path.join(path, f"part-{i:05d}.parquet"))
+    info = {
+        "marker": STAND_IN_MARKER,
+        "rows": num_rows,
+        "files": num_files,
+        "bytes": total_bytes,
+    }
+    with open(info_path, "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    return info
+
+
+# Pipeline variants that can be swept, by name
+PIPELINES = {
+    "baseline": run_pipeline,
+    "optimized": run_optimized_pipeline,
+}
+
+
+def parse_operator_times(stats):
+    """{operator name: wall seconds} from the text of ds.stats()."""
+    times = {}
+    for match in OPERATOR_STATS_PATTERN.finditer(stats):
+        times[match["name"]] = times.get(match["name"], 0.0) + float(match["seconds"])
+    return times
+
+
+def parse_spilled_mb(stats):
+    """Megabytes spilled to disk according to ds.stats(), or None if not reported."""
+    match = SPILLED_PATTERN.search(stats)
+    return float(match["mb"]) if match else None
+
+
+def parse_peak_heap_mb(stats):
+    """Largest per-task peak heap (MiB) over all operators in ds.stats(), or None."""
+    peaks = [float(match["max"]) for match in PEAK_HEAP_PATTERN.finditer(stats)]
+    return max(peaks) if peaks else None
+
+
+def directory_size(path):
+    """Total size in bytes of the files under path."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def optional_int(value):
+    """argparse type for sweep values: an integer, or "default" for None."""
+    return None if value == "default" else int(value)
+
+
+def run_configuration(pipeline, info, input_path, workdir, config, sleep_seconds):
+    """Run one sweep configuration and return its measurements."""
+    context = ray.data.DataContext.get_current()
+    previous_block_size = context.target_max_block_size
+    if config["block_size_mb"] is not None:
+        context.target_max_block_size = config["block_size_mb"] * 1024 * 1024
+    output_path = tempfile.mkdtemp(prefix="out_", dir=workdir)
+    try:
+        start = time.perf_counter()
+        ds = PIPELINES[pipeline](
+            input_path,
+            output_path,
+            config["batch_size"],
+            config["concurrency"],
+            sleep_seconds,
+        )
+        wall_s = time.perf_counter() - start
+        stats = ds.stats()
+        output_bytes = directory_size(output_path)
+    finally:
+        context.target_max_block_size = previous_block_size
+        shutil.rmtree(output_path, ignore_errors=True)
+    return {
+        "pipeline": pipeline,
+        **config,
+        "wall_s": round(wall_s, 4),
+        "rows_per_s": round(info["rows"] / wall_s, 1),
+        "bytes_per_s": round(info["bytes"] / wall_s, 1),
+        "operator_s": parse_operator_times(stats),
+        "spilled_mb": parse_spilled_mb(stats),
+        "peak_heap_mb": parse_peak_heap_mb(stats),
+        "output_bytes": output_bytes,
+        "stats": stats,
+    }
+
+
+def format_optional(value, spec=".1f"):
+    """value formatted with spec, or "-" if ds.stats() did not report it."""
+    return "-" if value is None else format(value, spec)
+
+
+def print_results(results):
+    print(
+        f"\n{'pipeline':<10} {'batch':>8} {'conc':>7} {'block MB':>9} "
+        f"{'wall s':>8} {'rows/s':>12} {'MB/s':>8} {'spill MB':>9} "
+        f"{'heap MB':>8} {'out MB':>8}"
+    )
+    for r in results:
+        print(
+            f"{r['pipeline']:<10} {str(r['batch_size'] or 'default'):>8} "
+            f"{str(r['concurrency'] or 'default'):>7} "
+            f"{str(r['block_size_mb'] or 'default'):>9} {r['wall_s']:>8.2f} "
+            f"{r['rows_per_s']:>12,.0f} {r['bytes_per_s'] / 1e6:>8.1f} "
+            f"{format_optional(r['spilled_mb']):>9} "
+            f"{format_optional(r['peak_heap_mb']):>8} "
+            f"{r['output_bytes'] / 1e6:>8.1f}"
+        )
+        for name, seconds in r["operator_s"].items():
+            print(f"{'':>12}{name}: {seconds:.2f}s")
+
+
+def mean_of(runs, key):
+    """Mean of runs[i][key], ignoring runs where it was not reported."""
+    values = [run[key] for run in runs if run[key] is not None]
+    return sum(values) / len(values) if values else None
+
+
+def print_comparison(results, reference="baseline"):
+    """
+    For every configuration that ran both the reference and another
+    pipeline, print throughput, peak heap and output size of each (averaged
+    over --repeat) with the ratio to the reference.
+    """
+    by_config = {}
+    for r in results:
+        key = (r["batch_size"], r["concurrency"], r["block_size_mb"])
+        by_config.setdefault(key, {}).setdefault(r["pipeline"], []).append(r)
+    metrics = (
+        ("rows/s", "rows_per_s", 1),
+        ("peak heap MB", "peak_heap_mb", 1),
+        ("output MB", "output_bytes", 1e6),
+    )
+    for (batch_size, concurrency, block_size_mb), runs in by_config.items():
+        if reference not in runs or len(runs) == 1:
+            continue
+        print(
+            f"\nbatch={batch_size or 'default'} concurrency={concurrency or 'default'} "
+            f"block MB={block_size_mb or 'default'}"
+        )
+        print(f"  {'':<14}" + "".join(f"{name:>20}" for name in runs))
+        for label, key, scale in metrics:
+            base = mean_of(runs[reference], key)
+            row = f"  {label:<14}"
+            for name, pipeline_runs in runs.items():
+                value = mean_of(pipeline_runs, key)
+                if value is None:
+                    row += f"{'-':>20}"
+                elif name == reference or not base:
+                    row += f"{value / scale:>20,.1f}"
+                else:
+                    row += f"{f'{value / scale:,.1f} ({value / base:.2f}x)':>20}"
+            print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sweep map_batches and block size settings of simple_pipeline.py "
+        "and its optimized variant"
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        default=DEFAULT_ROWS,
+        help=f"Rows in the generated stand-in (default: {DEFAULT_ROWS})",
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=DEFAULT_FILES,
+        help=f"Parquet files in the stand-in (default: {DEFAULT_FILES})",
+    )
+    parser.add_argument(
+        "--data-dir",
+        help="Where to generate (and reuse) the stand-in; a non-empty directory "
+        "this script did not generate is refused (default: a temp dir)",
+    )
+    parser.add_argument(
+        "--pipelines",
+        nargs="+",
+        choices=sorted(PIPELINES),
+        default=["baseline"],
+        help="Pipeline variants to run",
+    )
+    parser.add_argument(
+        "--batch-sizes",
+        nargs="+",
+        type=optional_int,
+        default=[None],
+        help='map_batches batch_size values, or "default"',
+    )
+    parser.add_argument(
+        "--concurrency",
+        nargs="+",
+        type=optional_int,
+        default=[None],
+        help='map_batches concurrency values, or "default"',
+    )
+    parser.add_argument(
+        "--block-sizes-mb",
+        nargs="+",
+        type=optional_int,
+        default=[None],
+        help='DataContext.target_max_block_size values in MB, or "default"',
+    )
+    parser.add_argument(
+        "--sleep-seconds",
+        type=float,
+        default=0.0,
+        help="Sleep per batch, like simple_pipeline.py's time.sleep(10) (default: 0)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="Runs per configuration (default: 1)"
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=1,
+        help="Untimed runs before the sweep, so the first configuration does not "
+        "pay for starting the Ray workers (default: 1)",
+    )
+    parser.add_argument(
+        "--num-cpus", type=int, help="CPUs for a local Ray instance (default: all)"
+    )
+    parser.add_argument(
+        "--output",
+        default=DEFAULT_OUTPUT,
+        help=f"JSON file to write results to (default: {DEFAULT_OUTPUT})",
+    )
+    args = parser.parse_args()
+
+    ray.init(num_cpus=args.num_cpus, ignore_reinit_error=True)
+    workdir = tempfile.mkdtemp(prefix="simple_pipeline_bench_")
+    data_dir = args.data_dir or os.path.join(workdir, "taxi")
+    try:
+        start = time.perf_counter()
+        try:
+            info = generate_taxi_parquet(data_dir, args.rows, args.files)
+        except FileExistsError as e:
+            parser.error(str(e))
+        print(
+            f"Stand-in: {info['rows']:,} rows, {info['bytes'] / 1e6:.1f} MB in memory "
+            f"({time.perf_counter() - start:.1f}s)"
+        )
+        default_config = {
+            "batch_size": None,
+            "concurrency": None,
+            "block_size_mb": None,
+        }
+        for _ in range(args.warmup):
+            print("Warm-up run...")
+            run_configuration(
+                args.pipelines[0], info, data_dir, workdir, default_config, 0.0
+            )
+        results = []
+        for pipeline, batch_size, concurrency, block_size_mb in itertools.product(
+            args.pipelines, args.batch_sizes, args.concurrency, args.block_sizes_mb
+        ):
+            config = {
+                "batch_size": batch_size,
+                "concurrency": concurrency,
+                "block_size_mb": block_size_mb,
+            }
+            for _ in range(args.repeat):
+                print(f"Running {pipeline} {config}...")
+                results.append(
+                    run_configuration(
+                        pipeline, info, data_dir, workdir, config, args.sleep_seconds
+                    )
+                )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results)
+    print_comparison(results)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"stand_in": info, "results": results}, f, indent=1)
+        f.write("\n")
+    print(f"\nWrote results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,24 +2,47 @@ import ray
 import time
 import pyarrow.fs as fs
 
-
 default_cluster_storage = "/mnt/cluster_storage/observed_data/"
 
-"""
-s3://anyscale-public-materials/nyc-taxi-cab/yellow_tripdata_2011-05.parquet
-"""
-s3_fs = fs.S3FileSystem(anonymous=True)
-ds = ray.data.read_parquet(
-    "s3://anyscale-public-materials/nyc-taxi-cab/yellow_tripdata_2011-05.parquet",
-    filesystem=s3_fs
+INPUT_PATH = (
+    "s3://anyscale-public-materials/nyc-taxi-cab/yellow_tripdata_2011-05.parquet"
 )
 
-def slow_adjust_total_amount(batch):
-    time.sleep(10)
+
+def slow_adjust_total_amount(batch, sleep_seconds=10):
+    time.sleep(sleep_seconds)
     batch["adjusted_total_amount"] = batch["total_amount"] - batch["tip_amount"]
     return batch
 
-ds = ds.map_batches(slow_adjust_total_amount)
-ds.write_parquet(default_cluster_storage)
 
-print("Done!")
+def run_pipeline(
+    input_path,
+    output_path,
+    batch_size=None,
+    concurrency=None,
+    sleep_seconds=10,
+    filesystem=None,
+):
+    """
+    Read the parquet data, adjust every batch and write it back out.
+    batch_size / concurrency of None keep the map_batches defaults.
+    Returns the dataset, for its stats().
+    """
+    map_kwargs = {"fn_kwargs": {"sleep_seconds": sleep_seconds}}
+    if batch_size is not None:
+        map_kwargs["batch_size"] = batch_size
+    if concurrency is not None:
+        map_kwargs["concurrency"] = concurrency
+    ds = ray.data.read_parquet(input_path, filesystem=filesystem)
+    ds = ds.map_batches(slow_adjust_total_amount, **map_kwargs)
+    ds.write_parquet(output_path)
+    return ds
+
+
+if __name__ == "__main__":
+    run_pipeline(
+        INPUT_PATH,
+        default_cluster_storage,
+        filesystem=fs.S3FileSystem(anonymous=True),
+    )
+    print("Done!")
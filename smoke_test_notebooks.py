@@ -0,0 +1,522 @@
+"""
+Smoke-execute course notebooks on a local CPU-only Ray instance.
+
+Notebooks are run in parallel, one Jupyter kernel per worker, with a
+parameter cell injected so they can shrink their workloads. Every code cell
+is keyed by a hash of its source and all code cells above it; a notebook
+whose cells all have cached successful results is skipped. Per-cell
+timings are written to a results file, and cells that became much slower
+than in the previous recorded run are flagged.
+
+Example:
+    python smoke_test_notebooks.py --course foundations/Ray_Core --jobs 4
+    python smoke_test_notebooks.py --course workloads/Train_Tabular \
+        --param NUM_BOOST_ROUND=2
+"""
+
+import os
+import ast
+import json
+import time
+import signal
+import socket
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+import split_notebooks
+
+DEFAULT_CACHE_PATH = ".smoke_cache.json"
+DEFAULT_RESULTS_PATH = "smoke_results.json"
+DEFAULT_CELL_TIMEOUT = 600
+# A cell regressed if it got this much slower and at least this many seconds slower
+DEFAULT_REGRESSION_FACTOR = 1.5
+DEFAULT_REGRESSION_MIN_SECONDS = 1.0
+CACHE_VERSION = 1
+RAY_START_TIMEOUT = 120
+RAY_STOP_TIMEOUT = 60
+# Printed by ray start once the head node is up
+RAY_STARTED_MESSAGE = "Ray runtime started"
+
+PARAMETERS_TAG = "parameters"
+INJECTED_PARAMETERS_TAG = "injected-parameters"
+
+
+def cell_source(cell):
+    source = cell.get("source", "")
+    return "".join(source) if isinstance(source, list) else source
+
+
+def parse_param(text):
+    """Parse a NAME=VALUE option; VALUE is a Python literal or else a string."""
+    name, sep, value = text.partition("=")
+    if not sep or not name.isidentifier():
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {text!r}")
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return name, value
+
+
+def parameter_cell_source(params):
+    """Source of the injected parameter cell: SMOKE_TEST plus --param values."""
+    lines = ["# Parameters injected by smoke_test_notebooks.py", "SMOKE_TEST = True"]
+    lines.extend(f"{name} = {value!r}" for name, value in params.items())
+    return "\n".join(lines) + "\n"
+
+
+def parameters_cell_index(cells):
+    """Index of the first cell tagged "parameters", or None."""
+    for i, cell in enumerate(cells):
+        if PARAMETERS_TAG in cell.get("metadata", {}).get("tags", []):
+            return i
+    return None
+
+
+def inject_parameters(nb, params):
+    """
+    Insert the parameter cell right after the cell tagged "parameters"
+    (as papermill does), or before the first code cell if there is none.
+    """
+    cells = nb["cells"]
+    position = parameters_cell_index(cells)
+    if position is not None:
+        position += 1
+    else:
+        position = next(
+            (i for i, cell in enumerate(cells) if cell.get("cell_type") == "code"),
+            len(cells),
+        )
+    cell = {
+        "cell_type": "code",
+        "execution_count": None,
+        "metadata": {"tags": [INJECTED_PARAMETERS_TAG]},
+        "outputs": [],
+        "source": parameter_cell_source(params),
+    }
+    if nb.get("nbformat_minor", 0) >= 5:
+        cell["id"] = "injected-parameters"
+    cells.insert(position, cell)
+    return nb
+
+
+def cell_cache_keys(cells, seed):
+    """
+    Cache key of every code cell (None for other cells): a hash chained over
+    seed and the sources of all code cells up to and including it, so a key
+    changes whenever the cell or anything that ran before it changes.
+    """
+    keys = []
+    previous = split_notebooks.hash_bytes(seed)
+    for cell in cells:
+        if cell.get("cell_type") != "code":
+            keys.append(None)
+            continue
+        previous = split_notebooks.hash_bytes(previous + "\0" + cell_source(cell))
+        keys.append(previous)
+    return keys
+
+
+def load_cell_cache(cache_path=DEFAULT_CACHE_PATH):
+    """Load {cell key: {"seconds": ...}} of cells that ran successfully before."""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache.get("cells", {})
+
+
+def save_cell_cache(cells, cache_path=DEFAULT_CACHE_PATH):
+    split_notebooks.write_if_changed(
+        cache_path,
+        json.dumps({"version": CACHE_VERSION, "cells": cells}, indent=1, sort_keys=True)
+        + "\n",
+    )
+
+
+def execute_notebook(notebook_path, params, kernel_name, timeout, env, cell_cache):
+    """
+    Execute a notebook with the parameter cell injected, in its own
+    directory. Skipped (status "cached") if every code cell's key is in
+    cell_cache. Returns a result with the status, the failing cell's error,
+    and the key, source hash and seconds of each executed code cell.
+    """
+    import nbformat
+    from nbclient import NotebookClient
+    from nbclient.exceptions import CellExecutionError
+
+    nb = nbformat.from_dict(
+        inject_parameters(nbformat.read(notebook_path, as_version=4), params)
+    )
+    seed = json.dumps([kernel_name, sorted(params.items())], default=repr)
+    keys = cell_cache_keys(nb.cells, seed)
+    cells = [
+        {
+            "index": index,
+            "key": key,
+            "source_hash": split_notebooks.hash_bytes(cell_source(cell)),
+            "seconds": None,
+        }
+        for index, (cell, key) in enumerate(zip(nb.cells, keys))
+        if key is not None
+    ]
+    result = {"path": notebook_path, "status": "ok", "error": None, "cells": cells}
+    if all(cell["key"] in cell_cache for cell in cells):
+        for cell in cells:
+            cell["seconds"] = cell_cache[cell["key"]]["seconds"]
+        result["status"] = "cached"
+        result["wall_s"] = 0.0
+        print(f"Cached: {notebook_path}")
+        return result
+
+    by_index = {cell["index"]: cell for cell in cells}
+    starts = {}
+
+    def on_cell_execute(cell, cell_index):
+        starts[cell_index] = time.perf_counter()
+
+    def on_cell_executed(cell, cell_index, execute_reply):
+        # Only successful cells get a time, and only those are cached
+        if cell_index in by_index and execute_reply["content"]["status"] == "ok":
+            by_index[cell_index]["seconds"] = round(
+                time.perf_counter() - starts[cell_index], 4
+            )
+
+    client = NotebookClient(
+        nb,
+        timeout=timeout,
+        kernel_name=kernel_name or nb.metadata.get("kernelspec", {}).get("name", ""),
+        resources={"metadata": {"path": os.path.dirname(notebook_path) or "."}},
+        on_cell_execute=on_cell_execute,
+        on_cell_executed=on_cell_executed,
+    )
+    start = time.perf_counter()
+    try:
+        client.execute(env=env)
+    except CellExecutionError as e:
+        result["status"] = "failed"
+        result["error"] = str(e).strip().splitlines()[-1] if str(e).strip() else "error"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["wall_s"] = round(time.perf_counter() - start, 4)
+    status = "✓" if result["status"] == "ok" else "✗"
+    print(f"{status} Executed {notebook_path} in {result['wall_s']:.1f}s")
+    return result
+
+
+def execute_notebook_task(notebook_path, params, kernel_name, timeout, env, cache):
+    """
+    Process-pool entry point wrapping execute_notebook.
+    Returns (result, log, error).
+    """
+    return split_notebooks.call_with_captured_output(
+        execute_notebook, notebook_path, params, kernel_name, timeout, env, cache
+    )
+
+
+def find_regressions(
+    result,
+    previous,
+    factor=DEFAULT_REGRESSION_FACTOR,
+    min_seconds=DEFAULT_REGRESSION_MIN_SECONDS,
+):
+    """
+    Cells of result that got slower than the cell with the same source in
+    the previous recorded run of the notebook, by more than factor and by at
+    least min_seconds.
+    """
+    if not previous:
+        return []
+    before = {}
+    for cell in previous.get("cells", []):
+        if cell.get("seconds") is not None:
+            before.setdefault(cell["source_hash"], cell["seconds"])
+    regressions = []
+    for cell in result["cells"]:
+        old = before.get(cell["source_hash"])
+        new = cell["seconds"]
+        if old is None or new is None:
+            continue
+        if new > old * factor and new - old >= min_seconds:
+            regressions.append(
+                {"index": cell["index"], "before_s": old, "after_s": new}
+            )
+    return regressions
+
+
+def find_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_local_ray(num_cpus):
+    """
+    Start a local CPU-only Ray head node for the notebooks to share. The head
+    gets its own temp dir and runs in the foreground (--block) of a child
+    process, so stop_local_ray shuts down exactly this head and leaves any
+    other Ray instance on the machine alone.
+    Returns (address, head), or None if the ray CLI is not installed or the
+    head does not come up within RAY_START_TIMEOUT seconds.
+    """
+    if shutil.which("ray") is None:
+        print("ray is not installed; notebooks will start Ray themselves, if at all.")
+        return None
+    port = find_free_port()
+    temp_dir = tempfile.mkdtemp(prefix="smoke_ray_")
+    log_path = os.path.join(temp_dir, "ray_start.log")
+    cmd = [
+        "ray",
+        "start",
+        "--head",
+        f"--port={port}",
+        f"--num-cpus={num_cpus}",
+        "--num-gpus=0",
+        "--include-dashboard=false",
+        "--disable-usage-stats",
+        f"--temp-dir={temp_dir}",
+        "--block",
+    ]
+    print(f"Running: {' '.join(cmd)}")
+    with open(log_path, "w", encoding="utf-8") as log:
+        process = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+    head = {"process": process, "temp_dir": temp_dir, "log": log_path}
+    deadline = time.monotonic() + RAY_START_TIMEOUT
+    while time.monotonic() < deadline and process.poll() is None:
+        with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+            if RAY_STARTED_MESSAGE in f.read():
+                return f"127.0.0.1:{port}", head
+        time.sleep(0.5)
+    print(f"✗ Failed to start a local Ray instance; see {log_path}")
+    stop_local_ray(head)
+    return None
+
+
+def stop_local_ray(head):
+    """
+    Stop the head started by start_local_ray by terminating its blocking
+    ray start process, which shuts down the processes it launched.
+    Returns True if it exited cleanly; otherwise its log is kept.
+    """
+    process = head["process"]
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=RAY_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    # ray start --block exits with 0 or the signal number once its processes are down
+    if process.returncode not in (0, signal.SIGTERM, -signal.SIGTERM):
+        print(
+            f"✗ Local Ray head exited with code {process.returncode}; "
+            f"see {head['log']}"
+        )
+        return False
+    shutil.rmtree(head["temp_dir"], ignore_errors=True)
+    return True
+
+
+def find_target_notebooks(root="courses", course=None, parts=False):
+    """Source notebooks (or, with parts, split parts) of all or one course."""
+    index = split_notebooks.build_tree_index(root)
+    if parts:
+        course_root = os.path.join(root, course) if course else root
+        return split_notebooks.find_all_split_notebooks(course_root, index)
+    courses = split_notebooks.find_notebooks_by_course(root, course, index)
+    return [
+        nb_path
+        for _, notebooks in split_notebooks.active_course_items(courses)
+        for nb_path in notebooks
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Smoke-execute course notebooks on a local CPU-only Ray instance"
+    )
+    parser.add_argument("--course", help="Only run notebooks of this course folder")
+    parser.add_argument(
+        "--parts",
+        action="store_true",
+        help="Run the split parts instead of the source notebooks",
+    )
+    parser.add_argument(
+        "notebooks", nargs="*", help="Run these notebooks instead of a course tree"
+    )
+    parser.add_argument(
+        "--param",
+        action="append",
+        type=parse_param,
+        default=[],
+        metavar="NAME=VALUE",
+        help="Value for the injected parameter cell (repeatable); "
+        "SMOKE_TEST = True is always set",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=split_notebooks.default_job_count(),
+        help="Notebooks (kernels) to run in parallel (default: one per CPU)",
+    )
+    parser.add_argument("--kernel", help="Kernel name (default: from the notebook)")
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=DEFAULT_CELL_TIMEOUT,
+        help=f"Per-cell timeout in seconds (default: {DEFAULT_CELL_TIMEOUT})",
+    )
+    parser.add_argument(
+        "--ray-address",
+        help="Use this Ray cluster instead of starting a local CPU-only one",
+    )
+    parser.add_argument(
+        "--ray-cpus",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="CPUs of the local Ray instance (default: all)",
+    )
+    parser.add_argument(
+        "--no-ray", action="store_true", help="Don't start a local Ray instance"
+    )
+    parser.add_argument(
+        "--cache",
+        default=DEFAULT_CACHE_PATH,
+        help=f"Per-cell result cache (default: {DEFAULT_CACHE_PATH})",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Run notebooks even if cached"
+    )
+    parser.add_argument(
+        "--results",
+        default=DEFAULT_RESULTS_PATH,
+        help="Per-notebook and per-cell timings; the previous file is the "
+        f"baseline for regressions (default: {DEFAULT_RESULTS_PATH})",
+    )
+    parser.add_argument(
+        "--regression-factor",
+        type=float,
+        default=DEFAULT_REGRESSION_FACTOR,
+        help=f"Slowdown ratio that flags a cell (default: {DEFAULT_REGRESSION_FACTOR})",
+    )
+    parser.add_argument(
+        "--regression-min-seconds",
+        type=float,
+        default=DEFAULT_REGRESSION_MIN_SECONDS,
+        help="Minimum slowdown in seconds that flags a cell "
+        f"(default: {DEFAULT_REGRESSION_MIN_SECONDS})",
+    )
+    args = parser.parse_args()
+
+    notebooks = args.notebooks or find_target_notebooks(
+        "courses", args.course, args.parts
+    )
+    if not notebooks:
+        print("No notebooks to run.")
+        return 0
+    params = dict(args.param)
+    if params:
+        # Without a tagged cell the values land before the first code cell,
+        # where the notebook's own assignments overwrite them
+        for nb_path in notebooks:
+            try:
+                with open(nb_path, "r", encoding="utf-8") as f:
+                    cells = json.load(f).get("cells", [])
+            except (OSError, ValueError):
+                continue  # Reported when the notebook is executed
+            if parameters_cell_index(cells) is None:
+                print(
+                    f"⚠ {nb_path} has no cell tagged {PARAMETERS_TAG!r}; "
+                    f"--param values may be overwritten by the notebook"
+                )
+    cache = {} if args.force else load_cell_cache(args.cache)
+    try:
+        with open(args.results, "r", encoding="utf-8") as f:
+            previous_results = json.load(f).get("notebooks", {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        previous_results = {}
+
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES="", SMOKE_TEST="1")
+    head = None
+    if args.ray_address:
+        env["RAY_ADDRESS"] = args.ray_address
+    elif not args.no_ray:
+        started = start_local_ray(args.ray_cpus)
+        if started is not None:
+            env["RAY_ADDRESS"], head = started
+
+    print(f"Running {len(notebooks)} notebook(s) with {args.jobs} kernel(s)...")
+    tasks = [
+        (nb_path, params, args.kernel, args.timeout, env, cache)
+        for nb_path in notebooks
+    ]
+    try:
+        outcomes = split_notebooks.run_tasks(execute_notebook_task, tasks, args.jobs)
+    finally:
+        if head is not None:
+            stop_local_ray(head)
+
+    results = {}
+    failures = []
+    regressed = []
+    for nb_path, (result, log, error) in zip(notebooks, outcomes):
+        print(log, end="")
+        if error is not None:
+            failures.append((nb_path, error))
+            continue
+        key = split_notebooks.manifest_key(nb_path)
+        if result["status"] == "failed":
+            failures.append((nb_path, result["error"]))
+        for cell in result["cells"]:
+            if cell["seconds"] is not None:
+                cache[cell["key"]] = {"seconds": cell["seconds"]}
+        result["regressions"] = find_regressions(
+            result,
+            previous_results.get(key),
+            args.regression_factor,
+            args.regression_min_seconds,
+        )
+        if result["regressions"]:
+            regressed.append((nb_path, result["regressions"]))
+        results[key] = result
+    save_cell_cache(cache, args.cache)
+    with open(args.results, "w", encoding="utf-8") as f:
+        json.dump(
+            {"params": params, "notebooks": dict(previous_results, **results)},
+            f,
+            indent=1,
+            sort_keys=True,
+            default=repr,
+        )
+        f.write("\n")
+
+    counts = {}
+    for result in results.values():
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    print(
+        "\n"
+        + ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+        + f"; results written to {args.results}"
+    )
+    if regressed:
+        print(
+            f"\n⚠ Slower cells than the previous run in {len(regressed)} notebook(s):"
+        )
+        for nb_path, regressions in regressed:
+            for cell in regressions:
+                print(
+                    f"  - {nb_path} cell {cell['index']}: "
+                    f"{cell['before_s']:.1f}s -> {cell['after_s']:.1f}s"
+                )
+    split_notebooks.report_failures("Execution", failures)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
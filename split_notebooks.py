@@ -5,617 +5,3977 @@ import yaml
 import re
 import subprocess
 import argparse
+import hashlib
+import io
+import contextlib
+import tempfile
+import shutil
+import base64
+import html
+import urllib.parse
+import struct
+import textwrap
+import gzip
+import select
+import sys
+import time
+import cProfile
+import pstats
+from concurrent.futures import ProcessPoolExecutor
 
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
-def fix_image_paths_in_cell(cell, notebook_path):
-    """
-    Fix relative image paths in markdown cells to use GitHub raw content URLs.
-    Supports both flat and nested course structures.
-    """
-    if cell.get("cell_type") != "markdown":
-        return cell
+# Bump when the manifest layout or the split output format changes so that
+# stale manifests from older script versions are discarded instead of trusted.
+MANIFEST_VERSION = 5
+DEFAULT_MANIFEST_PATH = ".split_manifest.json"
 
-    # Extract course folder path from notebook path (relative to courses/)
-    # e.g., "courses/anyscale_101/file.ipynb" -> "anyscale_101"
-    # e.g., "courses/workloads/anyscale_101/file.ipynb" -> "courses/anyscale_101"
-    # e.g., "courses/level1/level2/course/file.ipynb" -> "level1/level2/course"
-    path_parts = notebook_path.split(os.sep)
 
-    # Find the index of 'courses' in the path
-    courses_index = None
-    for i, part in enumerate(path_parts):
-        if part == "courses":
-            courses_index = i
-            break
-
-    if courses_index is None or courses_index + 1 >= len(path_parts):
-        return cell  # Can't determine course folder, return unchanged
-
-    # Get the directory containing the notebook (everything after 'courses' up to the filename)
-    notebook_dir_parts = path_parts[courses_index + 1 : -1]
-    if notebook_dir_parts:
-        # Join all parts to get the full course path (supports nested structures)
-        # Use forward slashes for GitHub URLs (works on all platforms)
-        course_folder = "/".join(notebook_dir_parts)
-    else:
-        return cell  # Notebook is directly in courses/, can't determine course folder
+def hash_bytes(data):
+    """Return the SHA-256 hex digest of a bytes or str payload."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
 
-    # Process source content
-    source = cell.get("source", [])
-    if isinstance(source, list):
-        source_str = "".join(source)
-    else:
-        source_str = source
 
-    # GitHub raw content base URL
-    github_base = "https://raw.githubusercontent.com/ray-project/enablement-content/refs/heads/main"
+def hash_file(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents, or None if it is missing."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
 
-    # Pattern to match relative image paths in markdown
-    # Matches: ![alt](./images/file.png), ![alt](images/file.png), <img src="./images/file.png", etc.
-    patterns = [
-        (
-            r"!\[([^\]]*)\]\(\./images/([^)]+)\)",
-            rf"![\1]({github_base}/courses/{course_folder}/images/\2)",
-        ),
-        (
-            r"!\[([^\]]*)\]\(images/([^)]+)\)",
-            rf"![\1]({github_base}/courses/{course_folder}/images/\2)",
-        ),
-        (
-            r'<img\s+src="\.\/images\/([^"]+)"',
-            rf'<img src="{github_base}/courses/{course_folder}/images/\1"',
-        ),
-        (
-            r'<img\s+src="images\/([^"]+)"',
-            rf'<img src="{github_base}/courses/{course_folder}/images/\1"',
-        ),
-    ]
 
-    # Apply all patterns
-    modified_source = source_str
-    for pattern, replacement in patterns:
-        modified_source = re.sub(pattern, replacement, modified_source)
+def write_file_atomic(path, data):
+    """
+    Write bytes to path through a temporary file in the same directory and a
+    rename, so readers and interrupted runs never see a truncated file.
+    """
+    directory = os.path.dirname(path) or os.curdir
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
-    # Update the cell if changes were made
-    if modified_source != source_str:
-        if isinstance(source, list):
-            # Split back into list format if original was a list
-            cell["source"] = [modified_source]
-        else:
-            cell["source"] = modified_source
 
-    return cell
+def write_if_changed(path, content):
+    """
+    Write generated output only if it differs from the file on disk.
+
+    content (str or bytes) is compared with the current file first. Identical
+    output leaves the file and its mtime untouched, so Sphinx/jupyter-book
+    does not treat the page as dirty. Changed output is written atomically.
+    Returns True if the file was written.
+    """
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    return False
+    except OSError:
+        pass
+    write_file_atomic(path, data)
+    return True
+
 
+def manifest_key(path):
+    """Normalize a path for use as a manifest key (relative, forward slashes)."""
+    return os.path.normpath(path).replace(os.sep, "/")
 
-def split_notebook_by_h2(notebook_path, output_dir, force=False, dry_run=False):
+
+def load_build_manifest(manifest_path=DEFAULT_MANIFEST_PATH):
     """
-    Splits a notebook into parts at each '##' (second-level markdown header).
-    Returns a list of output notebook paths (relative to repo root).
+    Load the build manifest recording content hashes of sources, split parts,
+    HTML files and generated navigation files from the previous run.
+    Returns a fresh manifest if the file is missing, invalid or from another version.
     """
-    with open(notebook_path, "r", encoding="utf-8") as f:
-        nb = json.load(f)
+    empty = {"version": MANIFEST_VERSION, "notebooks": {}, "html": {}, "outputs": {}}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return empty
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return empty
+    for section in ("notebooks", "html", "outputs"):
+        manifest.setdefault(section, {})
+    return manifest
 
-    cells = nb.get("cells", [])
-    parts = []
-    current_part = []
-    for i, cell in enumerate(cells):
-        # Fix image paths in the cell
-        cell = fix_image_paths_in_cell(cell, notebook_path)
-
-        if cell.get("cell_type") == "markdown":
-            # Check if this is a second-level header
-            src = cell.get("source", [])
-            if isinstance(src, list):
-                src_str = "".join(src)
-            else:
-                src_str = src
-            if src_str.lstrip().startswith("## "):
-                # Start a new part at each '##', but keep the first part from the top
-                if current_part:
-                    parts.append(current_part)
-                    current_part = []
-        current_part.append(cell)
-    if current_part:
-        parts.append(current_part)
 
-    # Write each part as a new notebook
-    output_paths = []
-    base = os.path.splitext(os.path.basename(notebook_path))[0]
-    for idx, part_cells in enumerate(parts):
-        part_nb = dict(nb)  # shallow copy
-        part_nb["cells"] = part_cells
-        part_nb["metadata"] = nb.get("metadata", {})
-        part_nb["nbformat"] = nb.get("nbformat", 4)
-        part_nb["nbformat_minor"] = nb.get("nbformat_minor", 2)
-        out_name = f"{base}_{idx + 1:02d}.ipynb"
-        out_path = os.path.join(output_dir, out_name)
+def save_build_manifest(manifest, manifest_path=DEFAULT_MANIFEST_PATH):
+    """Write the build manifest to disk with stable key ordering."""
+    write_if_changed(
+        manifest_path, json.dumps(manifest, indent=1, sort_keys=True) + "\n"
+    )
 
-        if dry_run:
-            # In dry-run mode, just report what would be created
-            rel_path = os.path.relpath(out_path, Path.cwd())
-            if force or not os.path.exists(out_path):
-                print(f"  [DRY-RUN] Would create: {rel_path} ({len(part_cells)} cells)")
-            else:
-                print(
-                    f"  [DRY-RUN] Would skip existing: {rel_path} (use --force to regenerate)"
-                )
-            output_paths.append(rel_path)
-        else:
-            os.makedirs(output_dir, exist_ok=True)
-            if force or not os.path.exists(out_path):
-                with open(out_path, "w", encoding="utf-8") as f:
-                    json.dump(part_nb, f, indent=1)
-            else:
-                print(
-                    f"Skipping existing split notebook: {out_path} (use --force to regenerate)"
-                )
-            # Store path relative to repo root
-            rel_path = os.path.relpath(out_path, Path.cwd())
-            output_paths.append(rel_path)
-    return output_paths
+
+def remove_split_part(part_path):
+    """Delete a split notebook part and its converted HTML, if present."""
+    for path in (part_path, os.path.splitext(part_path)[0] + ".html"):
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"Removed orphaned output: {path}")
 
 
-def find_notebooks_by_course(root="courses", target_course=None):
+def default_job_count():
+    """Default number of worker processes: one per available CPU."""
+    return os.cpu_count() or 1
+
+
+def call_with_captured_output(func, *args, **kwargs):
     """
-    Find all .ipynb files organized by course folder, ignoring output/ dirs.
-    Supports both flat and nested course structures.
-    Optionally limit the search to a single course folder.
+    Call func and capture everything it prints, so output from pool workers can
+    be replayed in a fixed order. Exceptions are caught and returned instead of
+    raised so that one failing notebook does not abort the whole build.
+    Returns a (result, log, error) tuple; error is None on success.
+    """
+    buffer = io.StringIO()
+    result = None
+    error = None
+    with contextlib.redirect_stdout(buffer):
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return result, buffer.getvalue(), error
+
 
-    Course folders are identified as directories containing .ipynb files.
-    The course identifier is the path relative to the root (e.g., "course1" or "courses/course2").
+def run_tasks(func, tasks, jobs=1):
     """
-    courses = {}
+    Run func(*args) for every args tuple in tasks, either serially (jobs <= 1)
+    or across a process pool. Results are always returned in task order,
+    independent of the order in which workers finish.
+    """
+    if jobs <= 1 or len(tasks) <= 1:
+        return [func(*args) for args in tasks]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+        futures = [executor.submit(func, *args) for args in tasks]
+        return [future.result() for future in futures]
 
-    if not os.path.exists(root):
-        return courses
 
-    # Normalize root path
-    root = os.path.normpath(root)
+def report_failures(stage, failures):
+    """Print a per-notebook summary of failures collected during a build stage."""
+    if not failures:
+        return
+    print(f"\n✗ {stage} failed for {len(failures)} notebook(s):")
+    for path, error in failures:
+        print(f"  - {path}: {error}")
 
-    # If target_course is specified, construct the full path
-    if target_course:
-        target_path = os.path.join(root, target_course)
-        if not os.path.isdir(target_path):
-            return courses
-        search_paths = [target_path]
-    else:
-        search_paths = [root]
-
-    # Walk through all directories to find course folders
-    # Strategy:
-    # 1. Find all directories that contain notebooks directly
-    # 2. For directories with notebooks, check if their parent also has notebooks directly
-    #    - If parent has notebooks directly, parent is the course folder (category grouping)
-    #    - If parent doesn't have notebooks directly, check if parent has multiple subdirs with notebooks
-    #      - If yes, parent is the course folder (e.g., 02_Anyscale_Admin)
-    #      - If no, this directory is the course folder
-    # 3. Also identify directories that have subdirectories with notebooks but no notebooks directly
-
-    directories_with_direct_notebooks = (
-        set()
-    )  # Directories with notebooks directly in them
-
-    for search_path in search_paths:
-        for dirpath, dirnames, filenames in os.walk(search_path):
-            # Skip output directories, outputs, sources, and lesson folders
-            dirnames[:] = [
-                d
-                for d in dirnames
-                if d != "output"
-                and d != "outputs"
-                and d != "sources"
-                and not d.endswith("_lesson")
-            ]
 
-            # Check if this directory contains notebooks (directly)
-            has_notebooks = any(fname.endswith(".ipynb") for fname in filenames)
-
-            if has_notebooks:
-                # Get path relative to root
-                rel_path = os.path.relpath(dirpath, root)
-                # Normalize to use forward slashes for consistency (even on Windows)
-                course_id = rel_path.replace(os.sep, "/")
-                directories_with_direct_notebooks.add(course_id)
-
-    # Identify course folders by analyzing the structure
-    # Group directories by their immediate parent
-    parent_to_children = {}
-    for dir_with_nb in directories_with_direct_notebooks:
-        dir_parts = dir_with_nb.split("/")
-        if len(dir_parts) > 1:
-            parent_id = "/".join(dir_parts[:-1])
-            if parent_id not in parent_to_children:
-                parent_to_children[parent_id] = []
-            parent_to_children[parent_id].append(dir_with_nb)
-        else:
-            # Top-level directory (directly under courses/)
-            parent_to_children[None] = parent_to_children.get(None, []) + [dir_with_nb]
+DEFAULT_PROFILE_PATH = "split_profile.json"
 
-    course_folders = set()
 
-    # Process each parent and its children
-    for parent_id, children in parent_to_children.items():
-        if parent_id is None:
-            # Top-level directories - they are course folders
-            course_folders.update(children)
-            continue
+def peak_rss_mb(children=False):
+    """
+    Peak resident set size in MB of this process, or of its terminated child
+    processes (pool workers, nbconvert subprocesses) with children=True.
+    Returns None where the resource module is unavailable.
+    """
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(who).ru_maxrss * scale / (1 << 20), 1)
 
-        # Category directories (like "foundations", "workloads", "deprecated") should never be course folders
-        # Always use children as course folders for category structures
-        is_category_directory = parent_id in ["foundations", "workloads", "deprecated"]
-
-        if is_category_directory:
-            # Category directory - always use children as course folders, never the parent
-            course_folders.update(children)
-        elif parent_id in directories_with_direct_notebooks:
-            # Parent has notebooks directly - parent is the course folder
-            # (This handles cases where both parent and child have notebooks)
-            course_folders.add(parent_id)
-        else:
-            # Parent doesn't have notebooks directly
-            # Get immediate subdirectories (one level down from parent)
-            immediate_subdirs = set()
-            for child in children:
-                child_parts = child[len(parent_id) + 1 :].split("/")
-                if child_parts:
-                    immediate_subdirs.add(child_parts[0])
-
-            if len(immediate_subdirs) > 1:
-                # Parent has multiple immediate subdirectories with notebooks
-                # Parent is the course folder (e.g., 02_Anyscale_Admin)
-                course_folders.add(parent_id)
-            else:
-                # Parent has only one immediate subdirectory with notebooks
-                # Use the children as course folders
-                course_folders.update(children)
-
-    # Also add any directories that weren't processed (shouldn't happen, but safety check)
-    # But exclude category directories and deprecated
-    for dir_with_nb in directories_with_direct_notebooks:
-        # Skip category directories and deprecated - they should never be course folders
-        if dir_with_nb in ["foundations", "workloads", "deprecated"]:
-            continue
-        if not any(
-            dir_with_nb.startswith(cf + "/") or dir_with_nb == cf
-            for cf in course_folders
-            if cf
-        ):
-            # This directory is not under any identified course folder, so it's a course folder itself
-            course_folders.add(dir_with_nb)
-
-    # For each course folder, collect all notebooks in its tree (excluding output dirs)
-    # Preserve filesystem order (from os.listdir) to match original index.md order
-    # Note: _toc.yml will sort this later to match original behavior (sorted(courses_data.keys()))
-    course_folders_ordered = []
-    if not target_course:
-        # Discover courses in filesystem order (like original os.listdir - unsorted)
-        try:
-            for item in os.listdir(root):  # Use filesystem order, not sorted
-                item_path = os.path.join(root, item)
-                if os.path.isdir(item_path):
-                    # Check if this exact item is a course folder
-                    if item in course_folders:
-                        course_folders_ordered.append(item)
-                    # Check for nested course folders under this directory
-                    for course_id in course_folders:  # Preserve order, don't sort
-                        if (
-                            course_id.startswith(item + "/")
-                            and course_id not in course_folders_ordered
-                        ):
-                            course_folders_ordered.append(course_id)
-        except (FileNotFoundError, OSError):
-            pass
-
-    # Add any remaining course folders (preserve their discovery order)
-    for course_id in course_folders:
-        if course_id not in course_folders_ordered:
-            course_folders_ordered.append(course_id)
-
-    # Fallback to sorted if we couldn't determine order (e.g., target_course specified)
-    if not course_folders_ordered or target_course:
-        course_folders_ordered = sorted(course_folders)
-
-    for course_id in course_folders_ordered:
-        # Skip deprecated courses
-        if course_id.startswith("deprecated") or "deprecated" in course_id.split("/"):
-            continue
 
-        course_path = os.path.join(root, course_id)
-        all_notebooks = []
-
-        for dirpath, dirnames, filenames in os.walk(course_path):
-            # Skip output directories, outputs, sources, and lesson folders
-            dirnames[:] = [
-                d
-                for d in dirnames
-                if d != "output"
-                and d != "outputs"
-                and d != "sources"
-                and not d.endswith("_lesson")
-            ]
-            for fname in filenames:
-                if fname.endswith(".ipynb"):
-                    all_notebooks.append(os.path.join(dirpath, fname))
+@contextlib.contextmanager
+def profile_stage(profile, stage):
+    """
+    Record the wall time and peak RSS of a build stage in profile["stages"].
+    Does nothing when profile is None.
+    """
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile["stages"].append(
+            {
+                "stage": stage,
+                "wall_s": round(time.perf_counter() - start, 4),
+                "peak_rss_mb": peak_rss_mb(),
+                "children_peak_rss_mb": peak_rss_mb(children=True),
+            }
+        )
 
-        if all_notebooks:
-            courses[course_id] = sorted(all_notebooks)
 
-    return courses
+def record_notebook_timing(profile, stage, path, timing):
+    """Append a per-notebook timing returned by a pool task to profile["notebooks"]."""
+    if profile is None or not timing:
+        return
+    profile["notebooks"].append(
+        {
+            "stage": stage,
+            "path": manifest_key(path),
+            "wall_s": round(timing["wall_s"], 4),
+            "peak_rss_mb": timing.get("peak_rss_mb"),
+            "pid": timing.get("pid"),
+        }
+    )
 
 
-def load_course_display_names(config_path="_config.yml"):
-    """Load course display name mappings from config file."""
-    try:
-        with open(config_path, "r", encoding="utf-8") as f:
-            config = yaml.safe_load(f)
-        return config.get("course_display_names", {})
-    except (FileNotFoundError, yaml.YAMLError):
-        # Fallback to empty dict if config file is missing or invalid
-        return {}
+def merge_cprofile_dumps(dump_dir, stats_path):
+    """Merge the per-task cProfile dumps written to dump_dir into one stats file."""
+    dumps = sorted(
+        os.path.join(dump_dir, name)
+        for name in os.listdir(dump_dir)
+        if name.endswith(".prof")
+    )
+    if not dumps:
+        return False
+    pstats.Stats(*dumps).dump_stats(stats_path)
+    return True
 
 
-def strip_single_module_from_course_name(
-    course_base, course_folder_full, courses_root="courses"
-):
+def write_profile_report(profile, report_path=DEFAULT_PROFILE_PATH, top=10):
     """
-    If course_base contains a module (e.g., "Ray_Tune/00_Tune") and there's only one module,
-    strip the module part and return just the course name (e.g., "Ray_Tune").
+    Write the build profile as JSON and print per-stage timings followed by
+    the top slowest notebooks of every per-notebook stage.
 
-    Args:
-        course_base: The course name with optional module (e.g., "Ray_Tune/00_Tune")
-        course_folder_full: The full course folder path (e.g., "foundations/Ray_Tune/00_Tune")
-        courses_root: Root directory for courses (default: "courses")
+    Per-notebook peak RSS is the high-water mark of the process that handled
+    the notebook (a pool worker, or this process with --jobs 1) once it was done.
     """
-    if "/" not in course_base:
-        return course_base  # No module, return as-is
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+        f.write("\n")
 
-    parts = course_base.split("/")
-    if len(parts) < 2:
-        return course_base  # Invalid format, return as-is
+    def fmt_rss(value):
+        return f"{value:.1f}" if value is not None else "n/a"
 
-    # parts[0] is the course name, parts[1] is the module name
-    # We want to keep the course name (first part) and strip the module (second part)
-    course_name = parts[0]  # e.g., "Ray_Tune" from "Ray_Tune/00_Tune"
-    # Construct the full path to check: courses/{category}/{course_name} or courses/{course_name}
-    # Use the full course_folder to get the category if present
-    category, _ = extract_category(course_folder_full)
-    if category:
-        course_path = os.path.join(courses_root, category, course_name)
-    else:
-        course_path = os.path.join(courses_root, course_name)
+    print("\n" + "=" * 70)
+    print("Build profile")
+    print("=" * 70)
+    print(f"{'stage':<24} {'wall s':>10} {'peak RSS MB':>12} {'children MB':>12}")
+    for stage in profile["stages"]:
+        print(
+            f"{stage['stage']:<24} {stage['wall_s']:>10.3f} "
+            f"{fmt_rss(stage['peak_rss_mb']):>12} "
+            f"{fmt_rss(stage['children_peak_rss_mb']):>12}"
+        )
+    print(f"{'total':<24} {profile['total_wall_s']:>10.3f}")
 
-    if os.path.exists(course_path) and os.path.isdir(course_path):
-        # Count subdirectories (excluding output and other non-module dirs)
-        subdirs = [
-            d
-            for d in os.listdir(course_path)
-            if os.path.isdir(os.path.join(course_path, d)) and d != "output"
-        ]
-        if len(subdirs) == 1:
-            # Only one module, strip it from the name
-            return course_name
+    for stage in ("split", "html"):
+        records = [r for r in profile["notebooks"] if r["stage"] == stage]
+        if not records:
+            continue
+        records.sort(key=lambda r: r["wall_s"], reverse=True)
+        total = sum(r["wall_s"] for r in records)
+        print(
+            f"\nSlowest {min(top, len(records))} of {len(records)} notebooks "
+            f"({stage}, {total:.3f}s in total):"
+        )
+        print(f"{'wall s':>10} {'peak RSS MB':>12}  path")
+        for record in records[:top]:
+            print(
+                f"{record['wall_s']:>10.3f} {fmt_rss(record['peak_rss_mb']):>12}  "
+                f"{record['path']}"
+            )
+    print(f"\nProfile report written to {report_path}")
 
-    return course_base  # Multiple modules or can't determine, keep full name
 
+GITHUB_RAW_BASE = (
+    "https://raw.githubusercontent.com/ray-project/enablement-content/refs/heads/main"
+)
 
-def get_course_display_name(course_folder, display_names, courses_root="courses"):
-    """Get display name for course folder from config, with fallback logic."""
-    if course_folder in display_names:
-        return display_names[course_folder]
-    else:
-        # Fallback: Convert underscores to spaces and title case
-        # First, strip single modules if applicable
-        category, course_base = extract_category(course_folder)
-        course_name = strip_single_module_from_course_name(
-            course_base, course_folder, courses_root
-        )
-        return course_name.replace("_", " ").replace("-", " ").title()
+# Relative references in markdown cells that break once a part is moved into
+# output/, as (name, pattern) rules combined into a single alternation below.
+# Every rule must be matched by a handler in build_link_rewriter.
+LINK_REWRITE_RULES = (
+    # ![alt](./images/file.png), ![alt](images/file.png)
+    ("markdown_image", r"!\[(?P<alt>[^\]]*)\]\((?:\./)?images/(?P<image>[^)]+)\)"),
+    # <img src="./images/file.png", <video width="600" src='images/clip.mp4', <source ...
+    (
+        "html_media",
+        r"<(?P<tag>img|video|source)(?P<attrs>\s[^<>]*?)??\s+src="
+        r"(?P<quote>[\"'])(?:\./)?images/(?P<media>[^\"'<>]+)(?P=quote)",
+    ),
+    # [text](../other/notebook.ipynb#anchor)
+    (
+        "notebook_link",
+        r"\]\((?P<notebook>(?![a-zA-Z][\w+.-]*:|/|#)[^)\s#]+\.ipynb)"
+        r"(?P<anchor>#[^)\s]*)?\)",
+    ),
+)
+LINK_REWRITE_PATTERN = re.compile(
+    "|".join(f"(?P<{name}>{pattern})" for name, pattern in LINK_REWRITE_RULES)
+)
+# Substrings at least one rule needs, to skip cells without any references
+LINK_REWRITE_MARKERS = ("images/", ".ipynb")
 
 
-def extract_category(course_folder):
+# Markdown headings and explicit HTML anchors that a "#fragment" can target
+HEADING_PATTERN = re.compile(
+    r"^\s{0,3}#{1,6}\s+(?P<text>.+?)(?:\s+#+)?\s*$", re.MULTILINE
+)
+HTML_ANCHOR_PATTERN = re.compile(r"<a\s[^>]*\b(?:id|name)=[\"']([^\"']+)[\"']")
+
+_part_anchor_cache = {}
+
+
+def heading_anchors(text):
     """
-    Extract category from course folder path.
-    Returns (category, course_name) tuple.
-    For flat structures, category is None.
-    Examples:
-      "workloads/course_1" -> ("workloads", "course_1")
-      "foundations/course_x" -> ("foundations", "course_x")
-      "course_1" -> (None, "course_1")
+    Anchors a heading may be linked by: nbconvert's id (the text with spaces
+    replaced by '-') and the lowercase, punctuation-free slug of MyST and
+    GitHub.
     """
-    parts = course_folder.split("/")
-    if len(parts) > 1:
-        return (parts[0], "/".join(parts[1:]))
-    else:
-        return (None, course_folder)
+    slug = re.sub(r"[^\w\- ]", "", text.strip().lower()).replace(" ", "-")
+    return {text.strip().replace(" ", "-"), slug}
 
 
-def group_courses_by_category(courses_data):
+def notebook_part_anchors(notebook_path, sizing=None):
     """
-    Group courses by category.
-    Returns a dict mapping category (or None for uncategorized) to list of (course_folder, course_parts) tuples.
-    Preserves original order when there are no categories (backward compatibility).
+    Anchors (see heading_anchors, plus <a id/name> targets) of the markdown
+    cells of each part notebook_path splits into, in part order. The parts
+    are grouped as split_notebook_by_h2 does, so part N holds exactly the
+    anchors of <base>_<N>.ipynb. Cached per file state and sizing policy.
     """
-    categorized = {}
-    # Track insertion order to preserve it when no categories
-    insertion_order = []
-    # Track order of courses within each category to preserve original order
-    course_order_by_category = {}
+    stat = os.stat(notebook_path)
+    key = (
+        os.path.abspath(notebook_path),
+        stat.st_mtime_ns,
+        stat.st_size,
+        json.dumps(sizing, sort_keys=True),
+    )
+    if key not in _part_anchor_cache:
+        with open(notebook_path, "r", encoding="utf-8") as f:
+            cells = json.load(f).get("cells", [])
+        parts = []
+        for part_cells in apply_part_size_policy(
+            split_cells_by_h2(cells, None), sizing
+        ):
+            anchors = set()
+            for cell in part_cells:
+                if cell.get("cell_type") != "markdown":
+                    continue
+                source = cell.get("source", [])
+                source_str = "".join(source) if isinstance(source, list) else source
+                for match in HEADING_PATTERN.finditer(source_str):
+                    anchors |= heading_anchors(match["text"])
+                anchors.update(HTML_ANCHOR_PATTERN.findall(source_str))
+            parts.append(anchors)
+        _part_anchor_cache[key] = parts
+    return _part_anchor_cache[key]
 
-    for course_folder, course_parts in courses_data.items():
-        category, course_name = extract_category(course_folder)
-        if category not in categorized:
-            categorized[category] = []
-            insertion_order.append(category)
-            course_order_by_category[category] = []
-        categorized[category].append((course_folder, course_parts))
-        course_order_by_category[category].append(course_folder)
 
-    # Only sort if there are actual categories (not just uncategorized)
-    has_categories = any(cat is not None for cat in categorized.keys())
+def notebook_part_link(notebook_path, link, sizing=None):
+    """
+    Relative URL, from notebook_path's output/ directory, of the split part
+    of the notebook that the relative link points at, or None if the link
+    does not point at a notebook that gets split.
 
-    if has_categories:
-        # Sort categories: None (uncategorized) first, then alphabetically
-        sorted_categories = sorted(
-            categorized.keys(), key=lambda x: (x is not None, x or "")
-        )
-        # Sort courses within each category alphabetically
-        for category in sorted_categories:
-            categorized[category].sort(key=lambda x: x[0])
-        return categorized, sorted_categories
-    else:
-        # No categories - preserve original order from courses_data
-        # The courses are already in the right order in categorized[None]
-        # because we iterated over courses_data.items() which preserves dict order
-        return categorized, insertion_order
+    Without a #fragment this is the notebook's first part. A fragment is
+    kept on the part whose headings define that anchor (see
+    notebook_part_anchors, given the sizing policy the notebooks are split
+    with); if no part defines it, the link goes to the first part without
+    the fragment. Under a byte budget the part boundaries depend on the
+    rewritten cells, which the target's source can't reproduce, so there
+    fragments are always dropped.
+    """
+    path, _, anchor = link.partition("#")
+    notebook_dir = os.path.dirname(notebook_path)
+    target = os.path.normpath(os.path.join(notebook_dir, *path.split("/")))
+    target_dir = os.path.dirname(target)
+    if not os.path.isfile(target) or any(
+        part == "output" or is_excluded_dir(part) for part in target_dir.split(os.sep)
+    ):
+        return None  # Not a notebook that gets split
+    part_number = 1
+    fragment = ""
+    if (
+        anchor
+        and not (sizing or {}).get("max_bytes")
+        and not (sizing or {}).get("min_bytes")
+    ):
+        decoded = urllib.parse.unquote(anchor)
+        for idx, anchors in enumerate(notebook_part_anchors(target, sizing)):
+            if anchor in anchors or decoded in anchors:
+                part_number = idx + 1
+                fragment = "#" + anchor
+                break
+    base = os.path.splitext(os.path.basename(target))[0]
+    part = os.path.join(target_dir, "output", f"{base}_{part_number:02d}.ipynb")
+    url = os.path.relpath(part, os.path.join(notebook_dir, "output"))
+    return url.replace(os.sep, "/") + fragment
 
 
-def write_index_md_from_courses(
-    courses_data,
-    display_names,
-    index_path="index.md",
-    courses_root="courses",
-    dry_run=False,
+def build_link_rewriter(
+    notebook_path,
+    images=None,
+    stored_assets=None,
+    image_hashes=None,
+    image_variants=None,
+    link_targets=None,
+    sizing=None,
 ):
-    """Generate an index.md file with links organized by category and course."""
-    lines = [
-        "# Ray Enablement Content",
-        "",
-        "This collection contains multiple courses on Ray and Anyscale:",
-        "",
-    ]
-
-    # Group courses by category
-    categorized, sorted_categories = group_courses_by_category(courses_data)
+    """
+    Build a function that rewrites relative links in the markdown cells of
+    one notebook, or None if the notebook's course folder can't be determined.
+    Supports both flat and nested course structures.
 
-    # Check if there are any actual categories (not just uncategorized)
-    has_categories = any(cat is not None for cat in sorted_categories)
+    Image and media references (markdown images, <img>, <video> and <source>
+    tags) under images/ are pointed at GitHub raw content URLs. With images
+    given as {"dir": asset store directory}, the referenced files are instead
+    copied into the content-addressed asset store and linked by relative URL
+    (see publish_image); the stored paths are added to stored_assets and the
+    source files' content hashes to image_hashes, if given. Files that don't
+    exist keep their GitHub URL. Images with an entry in image_variants
+    (see optimize_image) are linked to their optimized fallback instead, and
+    markdown images become a <picture> offering the smaller formats.
 
-    # When there are no categories, use the same order as _toc.yml (backward compatibility)
-    if not has_categories:
-        # No categories - iterate in original order from courses_data (same as _toc.yml)
-        for course_folder, notebook_parts in courses_data.items():
-            course_name = get_course_display_name(
-                course_folder, display_names, courses_root
-            )
-            lines.append(f"## {course_name}")
-            lines.append("")
-            for part in notebook_parts:
-                # Use the filename (without extension) as the link text
-                name = os.path.splitext(os.path.basename(part))[0].replace("_", " ")
-                lines.append(f"- [{name}]({part})")
-            lines.append("")
-    else:
-        # Has categories - use categorized order
-        for category in sorted_categories:
-            courses_in_category = categorized[category]
+    Links to other source notebooks are pointed at the split part of that
+    notebook holding the linked anchor, or its first part, relative to this
+    notebook's output/ directory (see notebook_part_link, with the sizing
+    policy); each link and its resolved target (None if left as is) is
+    recorded in link_targets, if given. Cell attachments travel
+    with their cell and need no rewriting.
 
-            # Add category header if there are categories
+    URL prefixes are computed once per notebook, and cells that contain none
+    of LINK_REWRITE_MARKERS are returned without running the pattern.
+    """
+    # Extract course folder path from notebook path (relative to courses/)
+    # e.g., "courses/anyscale_101/file.ipynb" -> "anyscale_101"
+    # e.g., "courses/workloads/anyscale_101/file.ipynb" -> "workloads/anyscale_101"
+    # e.g., "courses/level1/level2/course/file.ipynb" -> "level1/level2/course"
+    path_parts = notebook_path.split(os.sep)
+    if "courses" not in path_parts:
+        return None  # Can't determine course folder
+    # Everything after 'courses' up to the filename (supports nested structures)
+    notebook_dir_parts = path_parts[path_parts.index("courses") + 1 : -1]
+    if not notebook_dir_parts:
+        return None  # Notebook is directly in courses/, can't determine course folder
+
+    # Use forward slashes for GitHub URLs (works on all platforms)
+    images_url = f"{GITHUB_RAW_BASE}/courses/{'/'.join(notebook_dir_parts)}/images/"
+    notebook_dir = os.path.dirname(notebook_path)
+    output_dir = os.path.join(notebook_dir, "output")
+
+    published = {}
+
+    def publish(target):
+        # (url, optimized variants record or None), publishing on first use
+        if target in published:
+            return published[target]
+        image_path = os.path.join(
+            notebook_dir, "images", *urllib.parse.unquote(target).split("/")
+        )
+        if not os.path.isfile(image_path):
+            print(f"Warning: image not found, linking to GitHub: {image_path}")
+            published[target] = (images_url + target, None)
+            return published[target]
+        record = (image_variants or {}).get(manifest_key(image_path))
+        if record is not None:
+            asset_path = record["fallback"][0]
+            image_hash = record["source_hash"]
+            stored = image_record_paths(record)
+        else:
+            asset_path, image_hash = publish_image(image_path, images["dir"])
+            stored = [manifest_key(asset_path)]
+        if stored_assets is not None:
+            stored_assets.update(stored)
+        if image_hashes is not None:
+            image_hashes[manifest_key(image_path)] = image_hash
+        published[target] = (asset_url(asset_path, output_dir), record)
+        return published[target]
+
+    def image_url(path):
+        if images is None:
+            return images_url + path, None
+        # Markdown image targets may be followed by a title: images/a.png "Title"
+        target = path.split(None, 1)[0]
+        url, record = publish(target)
+        return url + path[len(target) :], record
+
+    def replace(match):
+        rule = match.lastgroup
+        if rule == "markdown_image":
+            url, record = image_url(match["image"])
+            if record is not None and record["variants"]:
+                title = match["image"].split(None, 1)[1:]
+                return picture_html(
+                    record, output_dir, match["alt"], "".join(title).strip("\"' ")
+                )
+            return f"![{match['alt']}]({url})"
+        if rule == "html_media":
+            quote = match["quote"]
+            url, _ = image_url(match["media"])
+            return f"<{match['tag']}{match['attrs'] or ''} src={quote}{url}{quote}"
+        if rule == "notebook_link":
+            target = match["notebook"] + (match["anchor"] or "")
+            link = notebook_part_link(notebook_path, target, sizing)
+            if link_targets is not None:
+                link_targets[target] = link
+            if link is None:
+                return match.group(0)
+            return f"]({link})"
+        raise ValueError(f"No handler for link rewrite rule {rule!r}")
+
+    def rewrite(cell):
+        if cell.get("cell_type") != "markdown":
+            return cell
+        source = cell.get("source", [])
+        source_str = "".join(source) if isinstance(source, list) else source
+        if not any(marker in source_str for marker in LINK_REWRITE_MARKERS):
+            return cell
+        modified_source = LINK_REWRITE_PATTERN.sub(replace, source_str)
+        # Update the cell if changes were made
+        if modified_source != source_str:
+            if isinstance(source, list):
+                # Split back into list format if original was a list
+                cell["source"] = [modified_source]
+            else:
+                cell["source"] = modified_source
+        return cell
+
+    return rewrite
+
+
+def fix_image_paths_in_cell(cell, notebook_path):
+    """
+    Fix relative image paths and notebook links in a markdown cell.
+    Prefer build_link_rewriter when rewriting many cells of one notebook.
+    """
+    rewrite = build_link_rewriter(notebook_path)
+    return rewrite(cell) if rewrite is not None else cell
+
+
+DEFAULT_ASSET_DIR = os.path.join("_static", "_assets")
+DEFAULT_ASSET_THRESHOLD = 8192
+
+# File extensions for output MIME types that can be moved into the asset store
+ASSET_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/svg+xml": ".svg",
+    "text/html": ".html",
+}
+
+# Inline data URIs embedded in HTML outputs, e.g. <img src="data:image/png;base64,...">
+DATA_URI_PATTERN = re.compile(
+    r'(?P<attr>src|href)=(?P<quote>["\'])data:(?P<mime>image/(?:png|jpeg|gif|svg\+xml));base64,'
+    r"(?P<data>[A-Za-z0-9+/=\s]+)(?P=quote)"
+)
+
+
+def store_asset(data, extension, asset_dir=DEFAULT_ASSET_DIR):
+    """
+    Store bytes in the content-addressed asset store and return the file path.
+    Files are named by content hash, so identical outputs from any part or
+    course are stored once. Writes are atomic, so parallel workers storing
+    the same asset never see a partial file.
+    """
+    path = os.path.join(asset_dir, hash_bytes(data)[:16] + extension)
+    if not os.path.exists(path):
+        os.makedirs(asset_dir, exist_ok=True)
+        write_file_atomic(path, data)
+    return path
+
+
+def publish_image(image_path, asset_dir=DEFAULT_ASSET_DIR):
+    """
+    Copy an image into the content-addressed asset store.
+    Returns (stored path, content hash of the source file).
+    """
+    with open(image_path, "rb") as f:
+        data = f.read()
+    extension = os.path.splitext(image_path)[1].lower()
+    return store_asset(data, extension, asset_dir), hash_bytes(data)
+
+
+def prune_asset_store(manifest, asset_dir=DEFAULT_ASSET_DIR):
+    """
+    Delete stored assets no longer referenced by any notebook or HTML page in
+    the build manifest. Only meaningful after a run that processed every course.
+    """
+    referenced = set()
+    for nb_path, entry in manifest["notebooks"].items():
+        if os.path.exists(nb_path):
+            referenced.update(entry.get("assets", []))
+    for part_path, record in manifest["html"].items():
+        if os.path.exists(part_path):
+            referenced.update(record.get("assets", []))
+    if not os.path.isdir(asset_dir):
+        return
+    for fname in sorted(os.listdir(asset_dir)):
+        path = os.path.join(asset_dir, fname)
+        # Precompressed siblings (see precompress_file) follow their asset
+        source = os.path.splitext(path)[0] if fname.endswith((".gz", ".br")) else path
+        if os.path.isfile(path) and manifest_key(source) not in referenced:
+            os.remove(path)
+            print(f"Removed unreferenced asset: {path}")
+
+
+def asset_url(asset_path, output_dir):
+    """Relative URL of a stored asset as seen from a page in output_dir."""
+    return os.path.relpath(asset_path, output_dir).replace(os.sep, "/")
+
+
+def externalize_cell_outputs(cell, output_dir, assets, stored_assets=None):
+    """
+    Move large embedded outputs of a code cell into the asset store.
+
+    assets is {"dir": asset store directory, "threshold": minimum payload size
+    in characters}. image/png and image/jpeg payloads over the threshold are
+    replaced by an <img> tag referencing the stored file. Inline data URIs
+    in text/html outputs (including the HTML fallbacks of widgets) are
+    extracted the same way. HTML still over the threshold after that is
+    stored as its own page and embedded through a lazily loaded <iframe>.
+    Paths of stored assets are added to stored_assets, if given.
+    """
+    if cell.get("cell_type") != "code" or not cell.get("outputs"):
+        return cell
+    asset_dir = assets.get("dir", DEFAULT_ASSET_DIR)
+    threshold = assets.get("threshold", DEFAULT_ASSET_THRESHOLD)
+
+    def store(data, extension):
+        path = store_asset(data, extension, asset_dir)
+        if stored_assets is not None:
+            stored_assets.add(manifest_key(path))
+        return asset_url(path, output_dir)
+
+    def replace_data_uri(match):
+        if len(match.group("data")) < threshold:
+            return match.group(0)
+        data = base64.b64decode("".join(match.group("data").split()))
+        url = store(data, ASSET_EXTENSIONS[match.group("mime")])
+        return (
+            f'{match.group("attr")}={match.group("quote")}{url}{match.group("quote")}'
+        )
+
+    for output in cell["outputs"]:
+        bundle = output.get("data")
+        if not bundle:
+            continue
+        output_metadata = output.get("metadata", {})
+
+        html = bundle.get("text/html")
+        if html is not None:
+            html_str = "".join(html) if isinstance(html, list) else html
+            if len(html_str) >= threshold:
+                html_str = DATA_URI_PATTERN.sub(replace_data_uri, html_str)
+                if len(html_str) >= threshold:
+                    page = (
+                        '<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"></head>\n'
+                        f"<body>\n{html_str}\n</body>\n</html>\n"
+                    )
+                    url = store(page.encode("utf-8"), ".html")
+                    html_str = (
+                        f'<iframe src="{url}" loading="lazy" '
+                        'style="width: 100%; min-height: 400px; border: none;"></iframe>'
+                    )
+                bundle["text/html"] = html_str
+
+        for mime in ("image/png", "image/jpeg"):
+            payload = bundle.get(mime)
+            if payload is None:
+                continue
+            payload_str = "".join(payload) if isinstance(payload, list) else payload
+            if len(payload_str) < threshold:
+                continue
+            url = store(base64.b64decode(payload_str), ASSET_EXTENSIONS[mime])
+            del bundle[mime]
+            if "text/html" not in bundle:
+                size = output_metadata.get(mime, {})
+                attrs = "".join(
+                    f' {dim}="{size[dim]}"'
+                    for dim in ("width", "height")
+                    if dim in size
+                )
+                bundle["text/html"] = f'<img src="{url}" alt="Output image"{attrs}/>'
+    return cell
+
+
+DEFAULT_IMAGE_MAX_WIDTH = 1600
+
+# Image formats offered ahead of the fallback, most preferred first, as
+# (MIME type, Pillow format, extension, save parameters)
+OPTIMIZED_IMAGE_FORMATS = (
+    ("image/avif", "AVIF", ".avif", {"quality": 60}),
+    ("image/webp", "WEBP", ".webp", {"quality": 80, "method": 6}),
+)
+OPTIMIZABLE_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+_image_module = None
+
+
+def get_image_module():
+    """Return PIL.Image, or None if Pillow is not importable."""
+    global _image_module
+    if _image_module is None:
+        try:
+            from PIL import Image
+        except ImportError:
+            _image_module = False
+        else:
+            _image_module = Image
+    return _image_module or None
+
+
+def image_record_paths(record):
+    """Asset store paths of an optimized image record, including its cache entry."""
+    return [record["cache"], record["fallback"][0]] + [
+        path for _, path, _ in record["variants"]
+    ]
+
+
+def optimize_image(
+    image_path, asset_dir=DEFAULT_ASSET_DIR, max_width=DEFAULT_IMAGE_MAX_WIDTH
+):
+    """
+    Produce optimized variants of an image in the asset store.
+
+    The image is scaled down to max_width if wider, then encoded as every
+    format in OPTIMIZED_IMAGE_FORMATS this Pillow build supports, keeping only
+    variants smaller than the fallback. The fallback keeps the source format
+    (PNG or JPEG) and is the smaller of the re-encoded and the original file.
+
+    Results are cached in the asset store under the source content hash and
+    max_width, so unchanged images are never decoded again. Returns
+    (record, cached), where record holds "source_hash", "source_bytes",
+    "width", "height", "fallback" ([path, bytes]), "variants"
+    ([[mime, path, bytes], ...]) and "cache" (the cache entry's path).
+    """
+    with open(image_path, "rb") as f:
+        data = f.read()
+    source_hash = hash_bytes(data)
+    cache_path = os.path.join(asset_dir, f"{source_hash[:16]}-max{max_width}.json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            record = json.load(f)
+        if all(os.path.exists(path) for path in image_record_paths(record)):
+            return record, True
+
+    Image = get_image_module()
+    if Image is None:
+        raise RuntimeError("Pillow is not importable")
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        fallback_format = "JPEG" if source.format == "JPEG" else "PNG"
+        image = source
+        resized = image.width > max_width
+        if resized:
+            height = max(1, round(image.height * max_width / image.width))
+            image = image.resize((max_width, height), Image.LANCZOS)
+        if fallback_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+
+        def encode(image_format, **params):
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format, **params)
+            return buffer.getvalue()
+
+        if fallback_format == "JPEG":
+            fallback = encode("JPEG", quality=85, optimize=True, progressive=True)
+        else:
+            fallback = encode("PNG", optimize=True)
+        if not resized and len(data) <= len(fallback):
+            fallback = data
+        extension = ".jpg" if fallback_format == "JPEG" else ".png"
+        fallback_path = manifest_key(store_asset(fallback, extension, asset_dir))
+
+        variants = []
+        for mime, image_format, extension, params in OPTIMIZED_IMAGE_FORMATS:
+            try:
+                encoded = encode(image_format, **params)
+            except (KeyError, OSError, ValueError):
+                continue  # Format not supported by this Pillow build
+            if len(encoded) < len(fallback):
+                path = manifest_key(store_asset(encoded, extension, asset_dir))
+                variants.append([mime, path, len(encoded)])
+        width, height = image.size
+
+    record = {
+        "source_hash": source_hash,
+        "source_bytes": len(data),
+        "width": width,
+        "height": height,
+        "fallback": [fallback_path, len(fallback)],
+        "variants": variants,
+        "cache": manifest_key(cache_path),
+    }
+    write_file_atomic(cache_path, json.dumps(record, indent=1).encode("utf-8"))
+    return record, False
+
+
+def optimize_image_task(image_path, asset_dir, max_width):
+    """
+    Process-pool entry point wrapping optimize_image.
+    Returns ((record, cached), log, error).
+    """
+    return call_with_captured_output(optimize_image, image_path, asset_dir, max_width)
+
+
+def find_referenced_images(notebook_path):
+    """
+    Local images under images/ referenced from the markdown cells of a
+    notebook (markdown images and <img> tags) that optimize_image can handle.
+    """
+    with open(notebook_path, "r", encoding="utf-8") as f:
+        nb = json.load(f)
+    notebook_dir = os.path.dirname(notebook_path)
+    found = []
+    for cell in nb.get("cells", []):
+        if cell.get("cell_type") != "markdown":
+            continue
+        source = cell.get("source", [])
+        source_str = "".join(source) if isinstance(source, list) else source
+        if "images/" not in source_str:
+            continue
+        for match in LINK_REWRITE_PATTERN.finditer(source_str):
+            if match.lastgroup == "markdown_image":
+                target = match["image"].split(None, 1)[0]
+            elif match.lastgroup == "html_media" and match["tag"] == "img":
+                target = match["media"]
+            else:
+                continue
+            image_path = os.path.join(
+                notebook_dir, "images", *urllib.parse.unquote(target).split("/")
+            )
+            if (
+                os.path.splitext(image_path)[1].lower() in OPTIMIZABLE_IMAGE_EXTENSIONS
+                and os.path.isfile(image_path)
+                and image_path not in found
+            ):
+                found.append(image_path)
+    return found
+
+
+def optimize_referenced_images(
+    courses,
+    asset_dir=DEFAULT_ASSET_DIR,
+    max_width=DEFAULT_IMAGE_MAX_WIDTH,
+    jobs=1,
+    failed=None,
+):
+    """
+    Optimize every image referenced by the given courses' notebooks across a
+    process pool and print a per-course size report.
+
+    courses is a list of (course_folder, notebook paths) pairs. Returns a
+    dict mapping each optimized image (by manifest key) to its record, for
+    use as image_variants when splitting, or None if Pillow is missing.
+    failed, if given, is extended with the (path, error) pairs reported for
+    notebooks that could not be scanned and images that failed to encode.
+    """
+    if get_image_module() is None:
+        print(
+            "✗ Pillow is not importable; skipping image optimization. "
+            "Install Pillow to use --optimize-images."
+        )
+        return None
+
+    course_images = {}
+    failures = []
+    for course_folder, notebooks in courses:
+        images = []
+        for nb_path in notebooks:
+            try:
+                images.extend(find_referenced_images(nb_path))
+            except (OSError, ValueError) as e:
+                print(f"✗ Failed to scan {nb_path} for images: {e}")
+                failures.append((nb_path, f"{type(e).__name__}: {e}"))
+        course_images[course_folder] = list(dict.fromkeys(images))
+
+    image_paths = list(
+        dict.fromkeys(path for images in course_images.values() for path in images)
+    )
+    if not image_paths:
+        print("No local images referenced by the notebooks.")
+        report_failures("Image optimization", failures)
+        if failed is not None:
+            failed.extend(failures)
+        return {}
+    print(f"Optimizing {len(image_paths)} referenced image(s)...")
+
+    tasks = [(path, asset_dir, max_width) for path in image_paths]
+    records = {}
+    cached = 0
+    for image_path, (result, log, error) in zip(
+        image_paths, run_tasks(optimize_image_task, tasks, jobs)
+    ):
+        print(log, end="")
+        if error is not None:
+            failures.append((image_path, error))
+            continue
+        record, was_cached = result
+        cached += was_cached
+        records[manifest_key(image_path)] = record
+    print(
+        f"Optimized {len(records)} image(s): {len(records) - cached} encoded, "
+        f"{cached} cached"
+    )
+    report_failures("Image optimization", failures)
+    if failed is not None:
+        failed.extend(failures)
+    print_image_size_report(course_images, records)
+    return records
+
+
+def print_image_size_report(course_images, records):
+    """
+    Print before/after image bytes per course. "served" counts the smallest
+    variant of every image, i.e. what a browser supporting all formats loads.
+    """
+    print(
+        f"\n{'images':>6} {'original KB':>12} {'fallback KB':>12} "
+        f"{'served KB':>10} {'saved':>6}  course"
+    )
+    totals = [0, 0, 0, 0]
+    for course_folder, images in course_images.items():
+        course_records = [
+            records[manifest_key(path)]
+            for path in images
+            if manifest_key(path) in records
+        ]
+        if not course_records:
+            continue
+        row = [
+            len(course_records),
+            sum(r["source_bytes"] for r in course_records),
+            sum(r["fallback"][1] for r in course_records),
+            sum(
+                min([r["fallback"][1]] + [size for _, _, size in r["variants"]])
+                for r in course_records
+            ),
+        ]
+        totals = [total + value for total, value in zip(totals, row)]
+        print(image_size_report_row(row, course_folder))
+    print(image_size_report_row(totals, "total"))
+
+
+def image_size_report_row(row, label):
+    count, original, fallback, served = row
+    saved = 1 - served / original if original else 0
+    return (
+        f"{count:>6} {original / 1024:>12.1f} {fallback / 1024:>12.1f} "
+        f"{served / 1024:>10.1f} {saved:>6.0%}  {label}"
+    )
+
+
+def picture_html(record, output_dir, alt, title=""):
+    """
+    <picture> element serving an optimized image record from a page in
+    output_dir: one <source> per smaller format and the fallback as <img>.
+    """
+    sources = "".join(
+        f'<source type="{mime}" srcset="{asset_url(path, output_dir)}">'
+        for mime, path, _ in record["variants"]
+    )
+    title_attr = f' title="{html.escape(title)}"' if title else ""
+    return (
+        f"<picture>{sources}"
+        f'<img src="{asset_url(record["fallback"][0], output_dir)}" '
+        f'alt="{html.escape(alt)}"{title_attr} '
+        f'width="{record["width"]}" height="{record["height"]}">'
+        "</picture>"
+    )
+
+
+def is_header_cell(cell, level=2):
+    """Return True if the cell is a markdown cell starting with a header of the given level."""
+    if cell.get("cell_type") != "markdown":
+        return False
+    src = cell.get("source", [])
+    if isinstance(src, list):
+        src_str = "".join(src)
+    else:
+        src_str = src
+    return src_str.lstrip().startswith("#" * level + " ")
+
+
+def part_over_budget(cell_count, size, sizing):
+    """Return True if a part exceeds the byte or cell budget of the sizing policy."""
+    max_bytes = sizing.get("max_bytes")
+    max_cells = sizing.get("max_cells")
+    return bool(
+        (max_bytes and size > max_bytes) or (max_cells and cell_count > max_cells)
+    )
+
+
+def part_under_minimum(cell_count, size, sizing):
+    """Return True if a part is below the minimum size of the sizing policy."""
+    min_bytes = sizing.get("min_bytes")
+    min_cells = sizing.get("min_cells")
+    return bool(
+        (min_bytes and size < min_bytes) or (min_cells and cell_count < min_cells)
+    )
+
+
+def split_oversized_part(cells, sizes, sizing):
+    """
+    Split an over-budget part at its '###' headers, packing consecutive
+    subsections greedily up to the budget. Yields (cells, size) tuples.
+    A part without '###' headers is yielded unchanged. The cells before the
+    first '###' (the '##' header and its lead-in) always stay with the first
+    subsection, even if that chunk goes over budget, so no page holds just
+    the header.
+    """
+    sections = []
+    seen_subsection = False
+    for cell, size in zip(cells, sizes):
+        starts_subsection = is_header_cell(cell, level=3)
+        # The lead-in before the first '###' is part of the first subsection
+        if not sections or (starts_subsection and seen_subsection):
+            sections.append(([], 0))
+        seen_subsection = seen_subsection or starts_subsection
+        section_cells, section_size = sections[-1]
+        section_cells.append(cell)
+        sections[-1] = (section_cells, section_size + size)
+
+    chunk, chunk_size = [], 0
+    for section_cells, section_size in sections:
+        if chunk and part_over_budget(
+            len(chunk) + len(section_cells), chunk_size + section_size, sizing
+        ):
+            yield chunk, chunk_size
+            chunk, chunk_size = [], 0
+        chunk = chunk + section_cells
+        chunk_size += section_size
+    if chunk:
+        yield chunk, chunk_size
+
+
+def apply_part_size_policy(parts, sizing):
+    """
+    Even out part sizes according to a sizing policy, given as a dict with
+    optional "max_bytes", "max_cells", "min_bytes" and "min_cells" keys.
+
+    Parts over the byte or cell budget are split further at '###' boundaries.
+    Adjacent parts are merged while one of them is under the minimum and the
+    merged part stays within the budget, e.g. a title-only intro is merged
+    into the first section. A part starting with a '##' header is never
+    appended to a part that already holds another '##' section. Sizes are measured on the compact JSON of each
+    cell. Only one part is held back at a time, so streamed input stays
+    bounded, and the result depends only on the notebook's content.
+    """
+    if not sizing:
+        yield from parts
+        return
+
+    def measured_parts():
+        for cells in parts:
+            sizes = [len(json.dumps(cell)) for cell in cells]
+            if part_over_budget(len(cells), sum(sizes), sizing):
+                yield from split_oversized_part(cells, sizes, sizing)
+            else:
+                yield cells, sum(sizes)
+
+    pending = None
+    for cells, size in measured_parts():
+        if pending is None:
+            pending = (cells, size)
+            continue
+        pending_cells, pending_size = pending
+        merged_count = len(pending_cells) + len(cells)
+        merged_size = pending_size + size
+        if (
+            (
+                part_under_minimum(len(pending_cells), pending_size, sizing)
+                or part_under_minimum(len(cells), size, sizing)
+            )
+            and not part_over_budget(merged_count, merged_size, sizing)
+            and not (
+                is_header_cell(cells[0], level=2)
+                and any(is_header_cell(cell, level=2) for cell in pending_cells)
+            )
+        ):
+            pending = (pending_cells + cells, merged_size)
+        else:
+            yield pending_cells
+            pending = (cells, size)
+    if pending is not None:
+        yield pending[0]
+
+
+def split_cells_by_h2(
+    cells,
+    notebook_path,
+    images=None,
+    stored_assets=None,
+    image_hashes=None,
+    image_variants=None,
+    link_targets=None,
+    sizing=None,
+):
+    """
+    Group an iterable of cells into parts at each '##' header, fixing image
+    paths and notebook links along the way (see build_link_rewriter for
+    images, stored_assets, image_hashes, image_variants, link_targets and
+    sizing). Yields each part's list of cells as soon as the next header
+    closes it, so cells can be streamed in.
+    With notebook_path None the cells are grouped without any rewriting.
+    """
+    rewrite_links = None
+    if notebook_path is not None:
+        rewrite_links = build_link_rewriter(
+            notebook_path,
+            images,
+            stored_assets,
+            image_hashes,
+            image_variants,
+            link_targets,
+            sizing,
+        )
+    current_part = []
+    for cell in cells:
+        # Fix image paths and notebook links in the cell
+        if rewrite_links is not None:
+            cell = rewrite_links(cell)
+
+        if is_header_cell(cell, level=2):
+            # Start a new part at each '##', but keep the first part from the top
+            if current_part:
+                yield current_part
+                current_part = []
+        current_part.append(cell)
+    if current_part:
+        yield current_part
+
+
+def iter_notebook_cells(notebook_path, top_level, chunk_size=1 << 16):
+    """
+    Incrementally parse a notebook file, yielding the cells of its top-level
+    "cells" array one at a time without loading the whole document.
+
+    Every other top-level key is stored in top_level in file order, with a
+    None placeholder recording the position of "cells"; top_level is complete
+    once the generator is exhausted. Only the cell being decoded is held in
+    memory, so huge embedded outputs in other cells do not add up.
+    """
+    decoder = json.JSONDecoder()
+    with open(notebook_path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def read_more():
+            # Grow the read size with the pending data so that re-decoding a
+            # large value after each read stays linear overall
+            nonlocal buf, pos, eof
+            data = f.read(max(chunk_size, len(buf) - pos))
+            if not data:
+                eof = True
+            buf = buf[pos:] + data
+            pos = 0
+
+        def peek():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\n\r":
+                    pos += 1
+                if pos < len(buf):
+                    return buf[pos]
+                if eof:
+                    raise json.JSONDecodeError("Unexpected end of data", buf, pos)
+                read_more()
+
+        def expect(char):
+            nonlocal pos
+            if peek() != char:
+                raise json.JSONDecodeError(f"Expecting '{char}'", buf, pos)
+            pos += 1
+
+        def decode_value():
+            nonlocal pos
+            while True:
+                peek()
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    read_more()
+                    continue
+                # A number at the end of the buffer may continue in the next chunk
+                if end == len(buf) and not eof:
+                    read_more()
+                    continue
+                pos = end
+                return value
+
+        expect("{")
+        if peek() == "}":
+            return
+        while True:
+            key = decode_value()
+            expect(":")
+            if key == "cells":
+                top_level[key] = None
+                expect("[")
+                if peek() == "]":
+                    pos += 1
+                else:
+                    while True:
+                        yield decode_value()
+                        if peek() == ",":
+                            pos += 1
+                        else:
+                            expect("]")
+                            break
+            else:
+                top_level[key] = decode_value()
+            if peek() == ",":
+                pos += 1
+            else:
+                expect("}")
+                break
+
+
+def serialize_streamed_part(part_template, cells_text):
+    """
+    Serialize a split part exactly like json.dumps(part_nb, indent=1), where
+    part_template holds the part's top-level keys in order and cells_text is
+    the already serialized, comma-joined body of its "cells" array.
+    """
+    items = []
+    for key, value in part_template.items():
+        if key == "cells":
+            text = "[\n  " + cells_text + "\n ]"
+        else:
+            text = json.dumps(value, indent=1).replace("\n", "\n ")
+        items.append(f"{json.dumps(key)}: {text}")
+    return "{\n " + ",\n ".join(items) + "\n}"
+
+
+def split_notebook_by_h2(
+    notebook_path,
+    output_dir,
+    force=False,
+    dry_run=False,
+    manifest=None,
+    part_callback=None,
+    stream=False,
+    assets=None,
+    sizing=None,
+    images=None,
+    image_variants=None,
+    search=False,
+):
+    """
+    Splits a notebook into parts at each '##' (second-level markdown header).
+    Returns a list of output notebook paths (relative to repo root).
+
+    When a build manifest is given, the notebook is skipped entirely if its
+    content hash is unchanged since the last run, only parts whose content
+    changed are rewritten, and parts left over from a previous split are removed.
+
+    With stream=True, cells are parsed incrementally and each part is spooled
+    to a temporary file as soon as the next '##' closes it. Peak memory is then
+    bounded by the largest section rather than the whole notebook. The final
+    part files are assembled once the trailing notebook metadata has been read.
+
+    sizing, if given, is a part-sizing policy that splits oversized sections
+    further at '###' headers and merges tiny adjacent parts (see
+    apply_part_size_policy). Parts are numbered after the policy is applied.
+
+    assets, if given, enables moving large embedded outputs into a shared
+    content-addressed asset store (see externalize_cell_outputs).
+
+    images, if given as {"dir": asset store directory}, publishes images
+    referenced from markdown cells into that store instead of linking to
+    GitHub (see build_link_rewriter). The content hashes of the published
+    source images are recorded in the manifest, so changing an image
+    re-splits the notebooks that reference it. Likewise the resolved target
+    of every cross-notebook link is recorded, so a linked notebook appearing
+    or disappearing re-splits the notebooks linking to it. image_variants maps source
+    images to their optimized variants (see optimize_referenced_images);
+    images["max_width"] records the optimization setting in the manifest.
+
+    With search=True, the search document (title and weighted terms, see
+    search_document) of every part is extracted from the cells already in
+    memory and recorded in the manifest for write_search_index.
+
+    part_callback, if given, is called as part_callback(rel_path, part_nb, part_hash)
+    for every part produced, with the in-memory notebook dict of that part
+    (None in streaming mode).
+    """
+    if stream:
+        raw = None
+        source_hash = hash_file(notebook_path)
+    else:
+        with open(notebook_path, "rb") as f:
+            raw = f.read()
+        source_hash = hash_bytes(raw)
+
+    nb_key = manifest_key(notebook_path)
+    entry = manifest["notebooks"].get(nb_key) if manifest is not None else None
+    # Parts are stored as an ordered list of [path, hash] pairs
+    previous_parts = dict(entry.get("parts", [])) if entry else {}
+
+    # Options that change the content of the parts
+    split_options = {"assets": assets, "sizing": sizing, "images": images}
+
+    if (
+        entry
+        and not force
+        and not dry_run
+        and entry.get("source_hash") == source_hash
+        and entry.get("output_dir") == manifest_key(output_dir)
+        and entry.get("options") == split_options
+        and (not search or "search" in entry)
+        and all(os.path.exists(path) for path in previous_parts)
+        and all(os.path.exists(path) for path in entry.get("assets", []))
+        and all(
+            os.path.exists(path) and hash_file(path) == image_hash
+            for path, image_hash in entry.get("images", [])
+        )
+        and all(
+            notebook_part_link(notebook_path, link, sizing) == target
+            for link, target in entry.get("links", [])
+        )
+    ):
+        print(f"Up to date: {notebook_path} ({len(previous_parts)} parts)")
+        return [os.path.normpath(path) for path in previous_parts]
+
+    stored_assets = set()
+    image_hashes = {}
+    link_targets = {}
+    search_documents = []
+    if dry_run:
+        search = False
+        images = None  # Don't copy anything into the asset store
+
+    def prepare_cells(cells):
+        # Externalize large outputs cell by cell, so streaming stays bounded
+        if not assets or dry_run:
+            return cells
+        return (
+            externalize_cell_outputs(cell, output_dir, assets, stored_assets)
+            for cell in cells
+        )
+
+    if stream:
+        top_level = {}
+        parts = []
+        for part_cells in apply_part_size_policy(
+            split_cells_by_h2(
+                prepare_cells(iter_notebook_cells(notebook_path, top_level)),
+                notebook_path,
+                images,
+                stored_assets,
+                image_hashes,
+                image_variants,
+                link_targets,
+                sizing,
+            ),
+            sizing,
+        ):
+            if search:
+                search_documents.append(search_document(part_cells))
+            spool = tempfile.TemporaryFile("w+", encoding="utf-8")
+            spool.write(
+                ",\n  ".join(
+                    json.dumps(cell, indent=1).replace("\n", "\n  ")
+                    for cell in part_cells
+                )
+            )
+            parts.append((len(part_cells), spool))
+        # Same top-level layout as the in-memory part_nb below
+        part_template = dict(top_level)
+        part_template["cells"] = None
+        part_template["metadata"] = top_level.get("metadata", {})
+        part_template["nbformat"] = top_level.get("nbformat", 4)
+        part_template["nbformat_minor"] = top_level.get("nbformat_minor", 2)
+    else:
+        nb = json.loads(raw)
+        parts = [
+            (len(part_cells), part_cells)
+            for part_cells in apply_part_size_policy(
+                split_cells_by_h2(
+                    prepare_cells(nb.get("cells", [])),
+                    notebook_path,
+                    images,
+                    stored_assets,
+                    image_hashes,
+                    image_variants,
+                    link_targets,
+                    sizing,
+                ),
+                sizing,
+            )
+        ]
+        if search:
+            search_documents = [search_document(cells) for _, cells in parts]
+
+    def render_part(part):
+        # Returns (content, part_nb); part_nb is None for streamed parts
+        if stream:
+            spool = part
+            spool.seek(0)
+            return serialize_streamed_part(part_template, spool.read()), None
+        part_nb = dict(nb)  # shallow copy
+        part_nb["cells"] = part
+        part_nb["metadata"] = nb.get("metadata", {})
+        part_nb["nbformat"] = nb.get("nbformat", 4)
+        part_nb["nbformat_minor"] = nb.get("nbformat_minor", 2)
+        return json.dumps(part_nb, indent=1), part_nb
+
+    # Write each part as a new notebook
+    output_paths = []
+    part_hashes = []
+    base = os.path.splitext(os.path.basename(notebook_path))[0]
+    try:
+        for idx, (cell_count, part) in enumerate(parts):
+            out_name = f"{base}_{idx + 1:02d}.ipynb"
+            out_path = os.path.join(output_dir, out_name)
+
+            if dry_run:
+                # In dry-run mode, just report what would be created
+                rel_path = os.path.relpath(out_path, Path.cwd())
+                if force or not os.path.exists(out_path):
+                    print(f"  [DRY-RUN] Would create: {rel_path} ({cell_count} cells)")
+                else:
+                    print(
+                        f"  [DRY-RUN] Would skip existing: {rel_path} (use --force to regenerate)"
+                    )
+                output_paths.append(rel_path)
+                continue
+
+            os.makedirs(output_dir, exist_ok=True)
+            # Store path relative to repo root
+            rel_path = os.path.relpath(out_path, Path.cwd())
+            content, part_nb = render_part(part)
+            part_hash = hash_bytes(content)
+            part_hashes.append([manifest_key(rel_path), part_hash])
+
+            if manifest is not None:
+                # Rewrite only parts whose content differs from the last recorded build
+                needs_write = (
+                    force
+                    or not os.path.exists(out_path)
+                    or previous_parts.get(manifest_key(rel_path)) != part_hash
+                )
+            else:
+                needs_write = force or not os.path.exists(out_path)
+
+            if needs_write:
+                write_if_changed(out_path, content)
+            elif manifest is None:
+                print(
+                    f"Skipping existing split notebook: {out_path} (use --force to regenerate)"
+                )
+            output_paths.append(rel_path)
+            del content
+            if part_callback is not None:
+                part_callback(rel_path, part_nb, part_hash)
+    finally:
+        if stream:
+            for _, spool in parts:
+                spool.close()
+
+    if manifest is not None and not dry_run:
+        # Drop parts from a previous split of this notebook that no longer exist,
+        # e.g. after an '##' section was removed from the source
+        stale_parts = set(previous_parts)
+        part_pattern = re.compile(rf"^{re.escape(base)}_\d{{2,}}\.ipynb$")
+        if os.path.isdir(output_dir):
+            for fname in os.listdir(output_dir):
+                if part_pattern.match(fname):
+                    stale_parts.add(
+                        manifest_key(
+                            os.path.relpath(os.path.join(output_dir, fname), Path.cwd())
+                        )
+                    )
+        current_parts = {path for path, _ in part_hashes}
+        for stale_part in sorted(stale_parts - current_parts):
+            remove_split_part(stale_part)
+            manifest["html"].pop(stale_part, None)
+
+        manifest["notebooks"][nb_key] = {
+            "source_hash": source_hash,
+            "output_dir": manifest_key(output_dir),
+            "options": split_options,
+            "parts": part_hashes,
+            "assets": sorted(stored_assets),
+            "images": sorted(image_hashes.items()),
+            "links": sorted(link_targets.items()),
+        }
+        if search:
+            manifest["notebooks"][nb_key]["search"] = [
+                [path, title, terms]
+                for (path, _), (title, terms) in zip(part_hashes, search_documents)
+            ]
+    return output_paths
+
+
+def split_notebook_task(
+    nb_path, output_dir, options, manifest_entry=False, html_records=None
+):
+    """
+    Process-pool entry point wrapping split_notebook_by_h2.
+
+    options holds the build flags ("force", "dry_run", "stream", "assets",
+    "sizing", "images", "image_variants", "convert_html", "html_engine",
+    "html_template", "search", "cprofile_dir"). manifest_entry is the notebook's record from the build
+    manifest, False when the manifest is disabled; html_records holds the
+    manifest's HTML records for the notebook's previous parts.
+
+    With "convert_html" set and nbconvert importable, each written part is
+    converted to HTML straight from the in-memory notebook, so the HTML stage
+    does not have to read it back from disk.
+    Returns (split_paths, new_manifest_entry, html_results, log, error, timing),
+    where html_results maps each converted part to its new HTML manifest record
+    and timing holds the wall time and peak RSS of the split, excluding the
+    per-part HTML conversions listed under timing["html"]. With "cprofile_dir"
+    set, a cProfile dump of the split is written to that directory.
+    """
+    force = options.get("force", False)
+    dry_run = options.get("dry_run", False)
+    manifest = None
+    if manifest_entry is not False:
+        manifest = {"notebooks": {}, "html": dict(html_records or {}), "outputs": {}}
+        if manifest_entry:
+            manifest["notebooks"][manifest_key(nb_path)] = manifest_entry
+
+    html_results = {}
+    html_timings = {}
+    profiler = cProfile.Profile() if options.get("cprofile_dir") else None
+    part_callback = None
+    if (
+        options.get("convert_html")
+        and not dry_run
+        and options.get("html_engine", "auto") != "cli"
+        and get_html_exporter() is not None
+    ):
+
+        def part_callback(part_path, part_nb, part_hash):
+            # HTML conversion is timed (and profiled) separately from splitting
+            if profiler is not None:
+                profiler.disable()
+            start = time.perf_counter()
+            converted = convert_notebook_to_html(
+                part_path,
+                force=force,
+                manifest=manifest,
+                notebook=part_nb,
+                part_hash=part_hash,
+                template=options.get("html_template"),
+            )
+            html_timings[manifest_key(part_path)] = {
+                "wall_s": time.perf_counter() - start,
+                "peak_rss_mb": peak_rss_mb(),
+                "pid": os.getpid(),
+            }
+            if profiler is not None:
+                profiler.enable()
+            if converted:
+                record = None
+                if manifest is not None:
+                    record = manifest["html"].get(manifest_key(part_path))
+                html_results[manifest_key(part_path)] = record
+
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    split_paths, log, error = call_with_captured_output(
+        split_notebook_by_h2,
+        nb_path,
+        output_dir,
+        force=force,
+        dry_run=dry_run,
+        manifest=manifest,
+        part_callback=part_callback,
+        stream=options.get("stream", False),
+        assets=options.get("assets"),
+        sizing=options.get("sizing"),
+        images=options.get("images"),
+        image_variants=options.get("image_variants"),
+        search=options.get("search", False),
+    )
+    if profiler is not None:
+        profiler.disable()
+        fd, dump_path = tempfile.mkstemp(suffix=".prof", dir=options["cprofile_dir"])
+        os.close(fd)
+        profiler.dump_stats(dump_path)
+    timing = {
+        "wall_s": time.perf_counter()
+        - start
+        - sum(t["wall_s"] for t in html_timings.values()),
+        "peak_rss_mb": peak_rss_mb(),
+        "pid": os.getpid(),
+        "html": html_timings,
+    }
+    new_entry = None
+    if manifest is not None and error is None:
+        new_entry = manifest["notebooks"].get(manifest_key(nb_path))
+    return split_paths or [], new_entry, html_results, log, error, timing
+
+
+def merge_split_manifest_entry(manifest, nb_path, new_entry):
+    """Store a worker's manifest entry and drop HTML records of removed parts."""
+    key = manifest_key(nb_path)
+    old_entry = manifest["notebooks"].get(key) or {}
+    new_parts = {path for path, _ in new_entry.get("parts", [])}
+    for path, _ in old_entry.get("parts", []):
+        if path not in new_parts:
+            manifest["html"].pop(path, None)
+    manifest["notebooks"][key] = new_entry
+
+
+def is_excluded_dir(name):
+    """Directories never scanned for notebooks: build outputs, sources and lesson folders."""
+    return name in ("outputs", "sources") or name.endswith("_lesson")
+
+
+def build_tree_index(root="courses"):
+    """
+    Build an in-memory index of the courses tree from a single os.scandir traversal.
+
+    The index maps each directory path relative to root ("" for root itself,
+    forward slashes otherwise) to {"subdirs": [...], "files": {name: (size, mtime)}},
+    with entries in filesystem order. Subdirectories excluded by is_excluded_dir()
+    and symlinked directories are listed but not descended into, matching os.walk.
+    All discovery, naming and HTML stages query this index instead of walking
+    or stat-ing the filesystem again.
+    """
+    index = {"root": os.path.normpath(root), "dirs": {}}
+    if os.path.isdir(root):
+        scan_index_dir(index, "")
+    return index
+
+
+def scan_index_dir(index, rel_dir):
+    """(Re)scan one indexed directory and, recursively, its non-excluded subdirectories."""
+    stack = [rel_dir]
+    while stack:
+        current = stack.pop()
+        dir_path = index_abs_path(index, current)
+        subdirs = []
+        files = {}
+        to_visit = []
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        subdirs.append(entry.name)
+                        if not is_excluded_dir(entry.name) and not entry.is_symlink():
+                            to_visit.append(
+                                f"{current}/{entry.name}" if current else entry.name
+                            )
+                    else:
+                        try:
+                            stat = entry.stat()
+                            files[entry.name] = (stat.st_size, stat.st_mtime)
+                        except OSError:
+                            files[entry.name] = (None, None)
+        except OSError:
+            index["dirs"].pop(current, None)
+            continue
+        index["dirs"][current] = {"subdirs": subdirs, "files": files}
+        stack.extend(reversed(to_visit))
+
+
+def index_abs_path(index, rel_dir):
+    """Filesystem path of an indexed directory."""
+    if not rel_dir:
+        return index["root"]
+    return os.path.join(index["root"], *rel_dir.split("/"))
+
+
+def index_rel_path(index, path):
+    """Index key for a filesystem path under the index root, or None if outside it."""
+    rel = os.path.relpath(os.path.normpath(path), index["root"])
+    if rel == os.curdir:
+        return ""
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        return None
+    return rel.replace(os.sep, "/")
+
+
+def refresh_tree_index(index, path):
+    """
+    Rescan a directory (e.g. an output directory the build just wrote) so the
+    index reflects files created or removed since it was built.
+    """
+    rel_dir = index_rel_path(index, path)
+    if rel_dir is None:
+        return
+    # Drop stale entries for the subtree before rescanning it
+    prefix = rel_dir + "/"
+    for key in [k for k in index["dirs"] if k == rel_dir or k.startswith(prefix)]:
+        del index["dirs"][key]
+    if not os.path.isdir(path):
+        return
+    scan_index_dir(index, rel_dir)
+    if rel_dir:
+        parent, _, name = rel_dir.rpartition("/")
+        parent_entry = index["dirs"].get(parent)
+        if parent_entry is not None and name not in parent_entry["subdirs"]:
+            parent_entry["subdirs"].append(name)
+
+
+def walk_tree_index(index, rel_dir="", skip_output=True):
+    """
+    Yield (rel_dir, entry) for an indexed directory and its indexed descendants,
+    top-down in filesystem order like os.walk. With skip_output, 'output'
+    directories (split notebooks) are not descended into.
+    """
+    stack = [rel_dir]
+    while stack:
+        current = stack.pop()
+        entry = index["dirs"].get(current)
+        if entry is None:
+            continue
+        yield current, entry
+        children = [
+            f"{current}/{name}" if current else name
+            for name in entry["subdirs"]
+            if not is_excluded_dir(name) and not (skip_output and name == "output")
+        ]
+        stack.extend(reversed(children))
+
+
+# Category directories group courses and are never course folders themselves
+CATEGORY_DIRS = ("foundations", "workloads", "deprecated")
+
+
+def build_path_trie(paths):
+    """
+    Build a trie of forward-slash relative paths, preserving insertion order.
+    Each node is {"children": {name: node}, "terminal": bool}; terminal marks
+    inserted paths as opposed to intermediate directories. The path "." maps
+    to the root node.
+    """
+    trie = {"children": {}, "terminal": False}
+    for path in paths:
+        node = trie
+        if path != os.curdir:
+            for part in path.split("/"):
+                node = node["children"].setdefault(
+                    part, {"children": {}, "terminal": False}
+                )
+        node["terminal"] = True
+    return trie
+
+
+def resolve_course_folders(directories_with_direct_notebooks):
+    """
+    Identify course folders from the directories that directly contain notebooks.
+
+    Rules, applied to every directory that has child directories with notebooks:
+    - Top-level directories and children of category directories are course folders.
+    - If the parent has notebooks directly, the parent is the course folder.
+    - If the parent has multiple child directories with notebooks, the parent is
+      the course folder (e.g., 02_Anyscale_Admin); otherwise the children are.
+    Any directory with notebooks that is not inside a course folder found this
+    way becomes a course folder itself.
+
+    Works in a single pre-order pass over a path trie, so it is linear in the
+    number of directories. Returns course ids in pre-order, i.e. filesystem
+    order when the input is in filesystem order, with "." (notebooks directly
+    under the root) last.
+    """
+    trie = build_path_trie(directories_with_direct_notebooks)
+    course_folders = set()
+    ordered = []
+
+    # Stack of (path, node, inside_course); children are pushed reversed so
+    # they are visited in insertion order
+    stack = [("", trie, False)]
+    while stack:
+        path, node, inside_course = stack.pop()
+        children = list(node["children"].items())
+        child_paths = [f"{path}/{name}" if path else name for name, _ in children]
+        children_with_notebooks = [
+            child_path
+            for child_path, (_, child) in zip(child_paths, children)
+            if child["terminal"]
+        ]
+
+        if children_with_notebooks:
+            if not path or path in CATEGORY_DIRS:
+                # Top-level directories and category children are course folders
+                course_folders.update(children_with_notebooks)
+            elif node["terminal"]:
+                # Parent has notebooks directly - parent is the course folder
+                course_folders.add(path)
+            elif len(children_with_notebooks) > 1:
+                # Parent has multiple immediate subdirectories with notebooks
+                course_folders.add(path)
+            else:
+                # Parent has only one immediate subdirectory with notebooks
+                course_folders.update(children_with_notebooks)
+
+        if path:
+            # A directory with notebooks outside every course folder is a course itself
+            if (
+                node["terminal"]
+                and path not in CATEGORY_DIRS
+                and not inside_course
+                and path not in course_folders
+            ):
+                course_folders.add(path)
+            if path in course_folders:
+                ordered.append(path)
+                inside_course = True
+
+        for child_path, (_, child) in reversed(list(zip(child_paths, children))):
+            stack.append((child_path, child, inside_course))
+
+    if trie["terminal"]:
+        # Notebooks directly under the root form a top-level course of their own
+        ordered.append(os.curdir)
+    return ordered
+
+
+def find_notebooks_by_course(root="courses", target_course=None, index=None):
+    """
+    Find all .ipynb files organized by course folder, ignoring output/ dirs.
+    Supports both flat and nested course structures.
+    Optionally limit the search to a single course folder.
+
+    Course folders are identified as directories containing .ipynb files
+    (see resolve_course_folders). The course identifier is the path relative
+    to the root (e.g., "course1" or "courses/course2").
+
+    The tree is read from index (see build_tree_index), which is built here if not given.
+    """
+    courses = {}
+
+    # Normalize root path
+    root = os.path.normpath(root)
+
+    if index is None or index["root"] != root:
+        index = build_tree_index(root)
+    if "" not in index["dirs"]:
+        return courses
+
+    # If target_course is specified, construct the full path
+    if target_course:
+        search_path = index_rel_path(index, os.path.join(root, target_course))
+        if search_path is None or search_path not in index["dirs"]:
+            return courses
+    else:
+        search_path = ""
+
+    # Directories with notebooks directly in them, in filesystem order
+    # (a dict is used as an ordered set). Output directories, outputs, sources,
+    # and lesson folders are skipped.
+    directories_with_direct_notebooks = {}
+    for rel_dir, entry in walk_tree_index(index, search_path):
+        if any(fname.endswith(".ipynb") for fname in entry["files"]):
+            # Index paths are relative to root and always use forward slashes
+            directories_with_direct_notebooks[rel_dir or os.curdir] = None
+
+    # Courses are listed in filesystem order to match the original index.md order
+    # Note: _toc.yml sorts this later (sorted(courses_data.keys()) or by category)
+    course_folders_ordered = resolve_course_folders(directories_with_direct_notebooks)
+    if target_course:
+        course_folders_ordered = sorted(course_folders_ordered)
+
+    # Skip deprecated courses
+    notebooks_by_course = {
+        course_id: []
+        for course_id in course_folders_ordered
+        if not (
+            course_id.startswith("deprecated") or "deprecated" in course_id.split("/")
+        )
+    }
+    collects_everything = os.curdir in notebooks_by_course
+
+    # Assign each notebook directory to every course folder that encloses it
+    for rel_dir in directories_with_direct_notebooks:
+        owners = []
+        if rel_dir != os.curdir:
+            parts = rel_dir.split("/")
+            prefix = ""
+            for part in parts:
+                prefix = f"{prefix}/{part}" if prefix else part
+                if prefix in notebooks_by_course:
+                    owners.append(prefix)
+        dir_rel = "" if rel_dir == os.curdir else rel_dir
+        fnames = [
+            fname
+            for fname in index["dirs"][dir_rel]["files"]
+            if fname.endswith(".ipynb")
+        ]
+        dirpath = index_abs_path(index, dir_rel)
+        for course_id in owners:
+            notebooks_by_course[course_id].extend(
+                os.path.join(dirpath, fname) for fname in fnames
+            )
+        if collects_everything:
+            # The root course's paths keep the "./" segment of its walk root
+            dirpath = os.path.join(root, os.curdir, *dir_rel.split("/"))
+            notebooks_by_course[os.curdir].extend(
+                os.path.join(dirpath, fname) for fname in fnames
+            )
+
+    for course_id, all_notebooks in notebooks_by_course.items():
+        if all_notebooks:
+            courses[course_id] = sorted(all_notebooks)
+
+    return courses
+
+
+def load_course_display_names(config_path="_config.yml"):
+    """Load course display name mappings from config file."""
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        return config.get("course_display_names", {})
+    except (FileNotFoundError, yaml.YAMLError):
+        # Fallback to empty dict if config file is missing or invalid
+        return {}
+
+
+def strip_single_module_from_course_name(
+    course_base, course_folder_full, courses_root="courses", index=None
+):
+    """
+    If course_base contains a module (e.g., "Ray_Tune/00_Tune") and there's only one module,
+    strip the module part and return just the course name (e.g., "Ray_Tune").
+
+    Args:
+        course_base: The course name with optional module (e.g., "Ray_Tune/00_Tune")
+        course_folder_full: The full course folder path (e.g., "foundations/Ray_Tune/00_Tune")
+        courses_root: Root directory for courses (default: "courses")
+        index: Optional tree index of courses_root (see build_tree_index) used
+            instead of listing the course directory
+    """
+    if "/" not in course_base:
+        return course_base  # No module, return as-is
+
+    parts = course_base.split("/")
+    if len(parts) < 2:
+        return course_base  # Invalid format, return as-is
+
+    # parts[0] is the course name, parts[1] is the module name
+    # We want to keep the course name (first part) and strip the module (second part)
+    course_name = parts[0]  # e.g., "Ray_Tune" from "Ray_Tune/00_Tune"
+    # Construct the full path to check: courses/{category}/{course_name} or courses/{course_name}
+    # Use the full course_folder to get the category if present
+    category, _ = extract_category(course_folder_full)
+    if category:
+        course_path = os.path.join(courses_root, category, course_name)
+    else:
+        course_path = os.path.join(courses_root, course_name)
+
+    subdirs = None
+    if index is not None and os.path.normpath(courses_root) == index["root"]:
+        entry = index["dirs"].get(index_rel_path(index, course_path))
+        if entry is not None:
+            subdirs = entry["subdirs"]
+    if subdirs is None and os.path.isdir(course_path):
+        subdirs = [
+            d
+            for d in os.listdir(course_path)
+            if os.path.isdir(os.path.join(course_path, d))
+        ]
+
+    if subdirs is not None:
+        # Count subdirectories (excluding output and other non-module dirs)
+        subdirs = [d for d in subdirs if d != "output"]
+        if len(subdirs) == 1:
+            # Only one module, strip it from the name
+            return course_name
+
+    return course_base  # Multiple modules or can't determine, keep full name
+
+
+def get_course_display_name(
+    course_folder, display_names, courses_root="courses", index=None
+):
+    """Get display name for course folder from config, with fallback logic."""
+    if course_folder in display_names:
+        return display_names[course_folder]
+    else:
+        # Fallback: Convert underscores to spaces and title case
+        # First, strip single modules if applicable
+        category, course_base = extract_category(course_folder)
+        course_name = strip_single_module_from_course_name(
+            course_base, course_folder, courses_root, index
+        )
+        return course_name.replace("_", " ").replace("-", " ").title()
+
+
+def extract_category(course_folder):
+    """
+    Extract category from course folder path.
+    Returns (category, course_name) tuple.
+    For flat structures, category is None.
+    Examples:
+      "workloads/course_1" -> ("workloads", "course_1")
+      "foundations/course_x" -> ("foundations", "course_x")
+      "course_1" -> (None, "course_1")
+    """
+    parts = course_folder.split("/")
+    if len(parts) > 1:
+        return (parts[0], "/".join(parts[1:]))
+    else:
+        return (None, course_folder)
+
+
+def group_courses_by_category(courses_data):
+    """
+    Group courses by category.
+    Returns a dict mapping category (or None for uncategorized) to list of (course_folder, course_parts) tuples.
+    Preserves original order when there are no categories (backward compatibility).
+    """
+    categorized = {}
+    # Track insertion order to preserve it when no categories
+    insertion_order = []
+    # Track order of courses within each category to preserve original order
+    course_order_by_category = {}
+
+    for course_folder, course_parts in courses_data.items():
+        category, course_name = extract_category(course_folder)
+        if category not in categorized:
+            categorized[category] = []
+            insertion_order.append(category)
+            course_order_by_category[category] = []
+        categorized[category].append((course_folder, course_parts))
+        course_order_by_category[category].append(course_folder)
+
+    # Only sort if there are actual categories (not just uncategorized)
+    has_categories = any(cat is not None for cat in categorized.keys())
+
+    if has_categories:
+        # Sort categories: None (uncategorized) first, then alphabetically
+        sorted_categories = sorted(
+            categorized.keys(), key=lambda x: (x is not None, x or "")
+        )
+        # Sort courses within each category alphabetically
+        for category in sorted_categories:
+            categorized[category].sort(key=lambda x: x[0])
+        return categorized, sorted_categories
+    else:
+        # No categories - preserve original order from courses_data
+        # The courses are already in the right order in categorized[None]
+        # because we iterated over courses_data.items() which preserves dict order
+        return categorized, insertion_order
+
+
+def write_index_md_from_courses(
+    courses_data,
+    display_names,
+    index_path="index.md",
+    courses_root="courses",
+    dry_run=False,
+    manifest=None,
+    index=None,
+):
+    """Generate an index.md file with links organized by category and course."""
+    lines = [
+        "# Ray Enablement Content",
+        "",
+        "This collection contains multiple courses on Ray and Anyscale:",
+        "",
+    ]
+
+    # Group courses by category
+    categorized, sorted_categories = group_courses_by_category(courses_data)
+
+    # Check if there are any actual categories (not just uncategorized)
+    has_categories = any(cat is not None for cat in sorted_categories)
+
+    # When there are no categories, use the same order as _toc.yml (backward compatibility)
+    if not has_categories:
+        # No categories - iterate in original order from courses_data (same as _toc.yml)
+        for course_folder, notebook_parts in courses_data.items():
+            course_name = get_course_display_name(
+                course_folder, display_names, courses_root, index
+            )
+            lines.append(f"## {course_name}")
+            lines.append("")
+            for part in notebook_parts:
+                # Use the filename (without extension) as the link text
+                name = os.path.splitext(os.path.basename(part))[0].replace("_", " ")
+                lines.append(f"- [{name}]({part})")
+            lines.append("")
+    else:
+        # Has categories - use categorized order
+        for category in sorted_categories:
+            courses_in_category = categorized[category]
+
+            # Add category header if there are categories
             if category is not None:
                 category_display = category.replace("_", " ").replace("-", " ").title()
                 lines.append(f"## {category_display}")
                 lines.append("")
 
-            # Add courses in this category
-            for course_folder, notebook_parts in courses_in_category:
-                # Always pass full course_folder to preserve category info for path checking
-                # The function will extract the category internally and return the appropriate display name
-                course_display = get_course_display_name(
-                    course_folder, display_names, courses_root
+            # Add courses in this category
+            for course_folder, notebook_parts in courses_in_category:
+                # Always pass full course_folder to preserve category info for path checking
+                # The function will extract the category internally and return the appropriate display name
+                course_display = get_course_display_name(
+                    course_folder, display_names, courses_root, index
+                )
+
+                # Use H3 for courses when there are categories
+                lines.append(f"### {course_display}")
+                lines.append("")
+                for part in notebook_parts:
+                    # Use the filename (without extension) as the link text
+                    name = os.path.splitext(os.path.basename(part))[0].replace("_", " ")
+                    lines.append(f"- [{name}]({part})")
+                lines.append("")
+
+    if dry_run:
+        total_notebooks = sum(
+            len(notebook_parts) for notebook_parts in courses_data.values()
+        )
+        print(
+            f"  [DRY-RUN] Would write index.md ({len(lines)} lines, {len(courses_data)} courses, {total_notebooks} notebook parts)"
+        )
+    else:
+        write_generated_file(index_path, "\n".join(lines), manifest)
+
+
+def write_generated_file(path, content, manifest=None):
+    """
+    Write a generated navigation file (_toc.yml, index.md) if its content changed.
+    With a build manifest, the content hash is recorded for the file.
+    Returns True if the file was written.
+    """
+    written = write_if_changed(path, content)
+    if manifest is not None:
+        if not written:
+            print(f"Up to date: {path}")
+        manifest["outputs"][manifest_key(path)] = hash_bytes(content)
+    return written
+
+
+def write_toc_yml_from_courses(
+    courses_data,
+    display_names,
+    toc_path="_toc.yml",
+    courses_root="courses",
+    dry_run=False,
+    manifest=None,
+    index=None,
+    root="index.md",
+):
+    """
+    Generate a _toc.yml file organized by category and course using the 'parts' format.
+    root is the book's landing page (see build_course_preview for another root).
+    """
+    toc_data = {"format": "jb-book", "root": root, "parts": []}
+
+    # Group courses by category
+    categorized, sorted_categories = group_courses_by_category(courses_data)
+
+    # Check if there are any actual categories (not just uncategorized)
+    has_categories = any(cat is not None for cat in sorted_categories)
+
+    # Add courses organized by category
+    # Each course remains a separate part for Jupyter Book compatibility
+    # When there are no categories, use sorted order to match original _toc.yml behavior
+    if not has_categories:
+        # No categories - sort to match original behavior (original used sorted(courses_data.keys()))
+        sorted_courses = sorted(courses_data.keys())
+        for course_folder in sorted_courses:
+            course_parts = courses_data[course_folder]
+            course_name = get_course_display_name(
+                course_folder, display_names, courses_root, index
+            )
+
+            # Add course part with chapters
+            course_part = {"caption": course_name, "chapters": []}
+
+            for part in course_parts:
+                course_part["chapters"].append({"file": part})
+
+            toc_data["parts"].append(course_part)
+    else:
+        # Has categories - use categorized order
+        for category in sorted_categories:
+            courses_in_category = categorized[category]
+
+            for course_folder, course_parts in courses_in_category:
+                # Get display name - pass full course_folder to preserve category info for path checking
+                course_name = get_course_display_name(
+                    course_folder, display_names, courses_root, index
+                )
+
+                # Add course part with chapters
+                course_part = {"caption": course_name, "chapters": []}
+
+                for part in course_parts:
+                    course_part["chapters"].append({"file": part})
+
+                toc_data["parts"].append(course_part)
+
+    # Write _toc.yml with blank lines between courses for readability
+    if dry_run:
+        print(
+            f"  [DRY-RUN] Would write _toc.yml ({len(toc_data['parts'])} course parts)"
+        )
+        return
+
+    # Write header
+    chunks = ["format: jb-book\n", f"root: {root}\n", "parts:\n"]
+
+    # Write each course part with a blank line between them
+    for i, part in enumerate(toc_data["parts"]):
+        if i > 0:
+            chunks.append("\n")  # Blank line between courses
+        # Use yaml.dump to format each part as a list item
+        # The output will be "- caption: ...\n  chapters:\n  - file: ..."
+        # yaml.dump already produces the correct relative indentation
+        chunks.append(
+            yaml.dump(
+                [part],
+                default_flow_style=False,
+                sort_keys=False,
+                allow_unicode=True,
+            )
+        )
+    write_generated_file(toc_path, "".join(chunks), manifest)
+
+
+DEFAULT_PREVIEW_DIR = os.path.join("_build", "preview")
+
+
+def path_slug(name):
+    """File name for a course or category path, e.g. "foundations--Ray_Core"."""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", name.replace("/", "--"))
+
+
+def build_course_preview(
+    courses_data,
+    display_names,
+    course,
+    preview_dir=DEFAULT_PREVIEW_DIR,
+    courses_root="courses",
+    index=None,
+    config_path="_config.yml",
+):
+    """
+    Run jupyter-book on just the given courses (the split results of a
+    --course run), writing the book to preview_dir/<course>/_build/html.
+
+    The build uses a temporary TOC that lists only these courses, rooted at
+    their first part, and a temporary copy of config_path with
+    only_build_toc_files set, so Sphinx does not read the rest of the
+    repository. The global _toc.yml, index.md and _config.yml are left
+    untouched. Returns the built HTML directory, or None if the build failed.
+
+    A course whose only part is the root page has no chapters left for the
+    TOC; if no course has any, the preview is a root-only book titled after
+    the course.
+    """
+    if not courses_data:
+        print("No split notebooks to preview.")
+        return None
+    root_part = next(iter(courses_data.values()))[0]
+    toc_courses = {}
+    for course_folder, parts in courses_data.items():
+        chapters = [part for part in parts if part != root_part]
+        if chapters:
+            toc_courses[course_folder] = chapters
+        else:
+            print(
+                f"{course_folder} has a single page; it is the preview's root "
+                "page and gets no course entry in the navigation"
+            )
+
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        config = {}
+    course_title = get_course_display_name(course, display_names, courses_root, index)
+    config["title"] = f"{config.get('title', 'Preview')}: {course_title}"
+    config["only_build_toc_files"] = True
+
+    output_dir = os.path.join(preview_dir, path_slug(course))
+    with tempfile.TemporaryDirectory(prefix="split_preview_") as tmp_dir:
+        toc_path = os.path.join(tmp_dir, "_toc.yml")
+        config_copy = os.path.join(tmp_dir, "_config.yml")
+        if toc_courses:
+            write_toc_yml_from_courses(
+                toc_courses,
+                display_names,
+                toc_path,
+                courses_root,
+                index=index,
+                root=root_part,
+            )
+        else:
+            # An empty "parts:" is not a valid jb-book TOC
+            write_if_changed(toc_path, f"format: jb-book\nroot: {root_part}\n")
+        with open(config_copy, "w", encoding="utf-8") as f:
+            yaml.safe_dump(config, f, sort_keys=False, allow_unicode=True)
+        cmd = [
+            "jupyter-book",
+            "build",
+            ".",
+            "--toc",
+            toc_path,
+            "--config",
+            config_copy,
+            "--path-output",
+            output_dir,
+        ]
+        print(f"Running: {' '.join(cmd)}")
+        try:
+            result = subprocess.run(cmd)
+        except FileNotFoundError:
+            print(
+                "✗ jupyter-book is not installed. Install it with: "
+                "pip install 'jupyter-book<2.0'"
+            )
+            return None
+    if result.returncode != 0:
+        print(f"✗ Preview build of {course} failed")
+        return None
+    html_dir = os.path.join(output_dir, "_build", "html")
+    print(f"✓ Built preview of {course}: {os.path.join(html_dir, 'index.html')}")
+    return html_dir
+
+
+DEFAULT_SEARCH_INDEX_DIR = os.path.join("_static", "search")
+SEARCH_TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9_]*")
+# Markup that carries no searchable text: HTML tags, link targets, URLs
+SEARCH_MARKUP_PATTERN = re.compile(r"<[^>]*>|\]\([^)]*\)|(?:https?|data):\S+")
+SEARCH_STOP_WORDS = frozenset(
+    "an and are as at be but by can do for from has have if in into is it its "
+    "not of on or so than that the then there these this to was we were will "
+    "with you your".split()
+)
+# Term weight per occurrence in headers, markdown text and code
+SEARCH_WEIGHTS = {"header": 5, "markdown": 1, "code": 1}
+SEARCH_MAX_TERM_LENGTH = 40
+# Self-contained prefix-search client for the shards; see search_document
+SEARCH_CLIENT_JS = """\
+// Prefix search over the shards written by split_notebooks.py --search-index.
+// import { search } from "./search.js";
+// await search("map_bat", { shards: ["foundations"] });
+const base = new URL(".", import.meta.url);
+let indexPromise = null;
+const shardPromises = new Map();
+
+export function loadIndex() {
+  indexPromise ??= fetch(new URL("index.json", base)).then((r) => r.json());
+  return indexPromise;
+}
+
+function loadShard(index, name) {
+  if (!shardPromises.has(name)) {
+    const url = new URL(index.shards[name].file, base);
+    shardPromises.set(name, fetch(url).then((r) => r.json()));
+  }
+  return shardPromises.get(name);
+}
+
+function lowerBound(terms, value) {
+  let lo = 0;
+  let hi = terms.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1;
+    if (terms[mid] < value) lo = mid + 1;
+    else hi = mid;
+  }
+  return lo;
+}
+
+function prefixScores(shard, prefix) {
+  const scores = new Map();
+  const end = lowerBound(shard.terms, prefix + "\\uffff");
+  for (let t = lowerBound(shard.terms, prefix); t < end; t++) {
+    const postings = shard.postings[t];
+    for (let i = 0; i < postings.length; i += 2) {
+      scores.set(postings[i], (scores.get(postings[i]) || 0) + postings[i + 1]);
+    }
+  }
+  return scores;
+}
+
+// Pages matching every word of the query (each as a prefix), best first.
+// shards limits the search to the named shards (see index.json).
+export async function search(query, { shards = null, limit = 20 } = {}) {
+  const index = await loadIndex();
+  const words = query.toLowerCase().match(/[a-z0-9][a-z0-9_]*/g) || [];
+  if (!words.length) return [];
+  const results = [];
+  for (const name of shards || Object.keys(index.shards)) {
+    const shard = await loadShard(index, name);
+    let scores = null;
+    for (const word of words) {
+      const wordScores = prefixScores(shard, word);
+      if (scores === null) {
+        scores = wordScores;
+        continue;
+      }
+      for (const [doc, score] of scores) {
+        if (wordScores.has(doc)) scores.set(doc, score + wordScores.get(doc));
+        else scores.delete(doc);
+      }
+    }
+    for (const [doc, score] of scores) {
+      const [path, title, course] = shard.docs[doc];
+      const url = new URL(index.root + path, base).href;
+      results.push({ url, title, course, shard: name, score });
+    }
+  }
+  return results.sort((a, b) => b.score - a.score).slice(0, limit);
+}
+"""
+
+
+def search_terms(text, weight, terms):
+    """Add the searchable words of text to a {term: weight} dict."""
+    for token in SEARCH_TOKEN_PATTERN.findall(
+        SEARCH_MARKUP_PATTERN.sub(" ", text.lower())
+    ):
+        if (
+            len(token) < 2
+            or len(token) > SEARCH_MAX_TERM_LENGTH
+            or token.isdigit()
+            or token in SEARCH_STOP_WORDS
+        ):
+            continue
+        terms[token] = terms.get(token, 0) + weight
+        if "_" in token:
+            # map_batches is also found by "batches"
+            for piece in token.split("_"):
+                if len(piece) > 1 and not piece.isdigit():
+                    terms[piece] = terms.get(piece, 0) + weight
+
+
+def search_document(cells):
+    """
+    Search document of a split part from its cells: (title, {term: weight}).
+    Headers, markdown text and code are weighted by SEARCH_WEIGHTS; outputs
+    are not indexed. The title is the part's first markdown header.
+    """
+    title = None
+    terms = {}
+    for cell in cells:
+        source = cell.get("source", "")
+        if isinstance(source, list):
+            source = "".join(source)
+        if cell.get("cell_type") == "code":
+            search_terms(source, SEARCH_WEIGHTS["code"], terms)
+            continue
+        if cell.get("cell_type") != "markdown":
+            continue
+        for line in source.splitlines():
+            if line.startswith("#"):
+                header = SEARCH_MARKUP_PATTERN.sub("", line.lstrip("#")).strip()
+                if title is None and header:
+                    title = header
+                search_terms(line, SEARCH_WEIGHTS["header"], terms)
+            else:
+                search_terms(line, SEARCH_WEIGHTS["markdown"], terms)
+    return title, dict(sorted(terms.items()))
+
+
+def search_shard_name(course_folder, shard_by="category"):
+    """Shard of a course: its category (or the course itself), or the course."""
+    category, _ = extract_category(course_folder)
+    if shard_by == "category" and category is not None:
+        return category
+    return course_folder
+
+
+def build_search_shard(docs):
+    """
+    Compact inverted index over docs, a list of (path, title, course, terms).
+    Terms are sorted for prefix range lookups by binary search; postings[i]
+    holds flat [doc, weight, doc, weight, ...] pairs for terms[i].
+    """
+    postings = {}
+    for doc_id, (_, _, _, terms) in enumerate(docs):
+        for term, weight in terms.items():
+            postings.setdefault(term, []).extend((doc_id, weight))
+    sorted_terms = sorted(postings)
+    return {
+        "docs": [[path, title, course] for path, title, course, _ in docs],
+        "terms": sorted_terms,
+        "postings": [postings[term] for term in sorted_terms],
+    }
+
+
+def write_search_index(
+    courses_data,
+    manifest,
+    display_names=None,
+    index_dir=DEFAULT_SEARCH_INDEX_DIR,
+    shard_by="category",
+    courses_root="courses",
+    index=None,
+):
+    """
+    Write a sharded full-text search index of all split parts to index_dir.
+
+    Documents are the per-part (title, terms) recorded in the manifest by
+    split_notebook_by_h2(search=True), so no notebook is parsed again. Each
+    shard (one per category, or per course with shard_by="course") is a
+    self-contained JSON file with a content-hash name; index.json lists the
+    shards with their courses, and search.js queries them by prefix.
+    Returns {shard: {"docs", "terms", "bytes"}} for reporting.
+    """
+    documents = {}
+    for entry in manifest["notebooks"].values():
+        for part_path, title, terms in entry.get("search", []):
+            documents[part_path] = (title, terms)
+
+    shards = {}
+    for course_folder, parts in courses_data.items():
+        course_title = get_course_display_name(
+            course_folder, display_names or {}, courses_root, index
+        )
+        shard = shards.setdefault(
+            search_shard_name(course_folder, shard_by), {"courses": {}, "docs": []}
+        )
+        shard["courses"][course_folder] = course_title
+        for part_path in parts:
+            key = manifest_key(part_path)
+            if key not in documents:
+                continue
+            title, terms = documents[key]
+            page = os.path.splitext(key)[0] + ".html"
+            shard["docs"].append(
+                (page, title or os.path.basename(page), course_folder, terms)
+            )
+
+    os.makedirs(index_dir, exist_ok=True)
+    index = {
+        "root": os.path.relpath(os.curdir, index_dir).replace(os.sep, "/") + "/",
+        "shards": {},
+    }
+    stats = {}
+    written = {"index.json", "search.js"}
+    for name, shard in sorted(shards.items()):
+        content = json.dumps(build_search_shard(shard["docs"]), separators=(",", ":"))
+        fname = f"{path_slug(name)}.{hash_bytes(content)[:16]}.json"
+        write_if_changed(os.path.join(index_dir, fname), content)
+        written.add(fname)
+        index["shards"][name] = {"file": fname, "courses": shard["courses"]}
+        stats[name] = {
+            "docs": len(shard["docs"]),
+            "terms": len({term for *_, terms in shard["docs"] for term in terms}),
+            "bytes": len(content.encode("utf-8")),
+        }
+    write_if_changed(
+        os.path.join(index_dir, "index.json"),
+        json.dumps(index, indent=1, sort_keys=True) + "\n",
+    )
+    write_if_changed(os.path.join(index_dir, "search.js"), SEARCH_CLIENT_JS)
+    for fname in sorted(os.listdir(index_dir)):
+        if fname.endswith(".json") and fname not in written:
+            os.remove(os.path.join(index_dir, fname))
+    return stats
+
+
+def print_search_index_report(stats, elapsed):
+    """Print documents, terms and size per search index shard."""
+    print(f"\n{'pages':>6} {'terms':>8} {'KB':>8}  shard")
+    for name, shard in stats.items():
+        print(
+            f"{shard['docs']:>6} {shard['terms']:>8} {shard['bytes'] / 1024:>8.1f}  {name}"
+        )
+    total_kb = sum(shard["bytes"] for shard in stats.values()) / 1024
+    print(
+        f"Built search index: {len(stats)} shard(s), {total_kb:.1f} KB in {elapsed:.2f}s"
+    )
+
+
+# Per-process nbconvert HTMLExporters by template name, created lazily by
+# get_html_exporter(). None records that nbconvert could not be imported.
+_html_exporters = {}
+
+# Variant of the lab template that links the shared stylesheet and script
+# bundle (see build_shared_html_bundle) instead of inlining them in every page
+SHARED_HTML_TEMPLATE = """\
+{%- extends 'index.html.j2' -%}
+{%- block notebook_css -%}
+<link rel="stylesheet" href="{{ resources.shared_css_url }}">
+{%- endblock notebook_css -%}
+{%- block html_head_js_mermaidjs -%}
+<script type="module" src="{{ resources.shared_js_url }}"></script>
+{%- endblock html_head_js_mermaidjs -%}
+"""
+# Site stylesheets folded into the shared bundle
+SHARED_HTML_EXTRA_CSS = (os.path.join("_static", "custom_hide.css"),)
+
+MODULE_SCRIPT_PATTERN = re.compile(
+    r'<script type="module">(?P<js>.*?)</script>', re.DOTALL
+)
+
+
+def get_html_exporter(template="inline"):
+    """
+    Return this process's nbconvert HTMLExporter for the given template
+    ("inline": nbconvert's lab template, "shared": SHARED_HTML_TEMPLATE),
+    creating it on first use.
+    The exporter keeps its Jinja templates compiled, so reusing it for every
+    notebook avoids paying interpreter, Jupyter and template startup per part.
+    Returns None if nbconvert is not importable.
+    """
+    if template not in _html_exporters:
+        try:
+            from nbconvert import HTMLExporter
+        except ImportError:
+            _html_exporters[template] = None
+        else:
+            if template == "shared":
+                from jinja2 import DictLoader
+                from traitlets.config import Config
+
+                config = Config()
+                # The Pygments stylesheet is part of the shared bundle too
+                config.CSSHTMLHeaderPreprocessor.enabled = False
+                _html_exporters[template] = HTMLExporter(
+                    config=config,
+                    extra_loaders=[
+                        DictLoader({"shared_assets.html.j2": SHARED_HTML_TEMPLATE})
+                    ],
+                    template_file="shared_assets.html.j2",
                 )
+            else:
+                _html_exporters[template] = HTMLExporter()
+    return _html_exporters[template]
 
-                # Use H3 for courses when there are categories
-                lines.append(f"### {course_display}")
-                lines.append("")
-                for part in notebook_parts:
-                    # Use the filename (without extension) as the link text
-                    name = os.path.splitext(os.path.basename(part))[0].replace("_", " ")
-                    lines.append(f"- [{name}]({part})")
-                lines.append("")
 
-    if dry_run:
-        total_notebooks = sum(
-            len(notebook_parts) for notebook_parts in courses_data.values()
+def build_shared_html_bundle(asset_dir=DEFAULT_ASSET_DIR):
+    """
+    Write the stylesheet and script bundle linked by the "shared" HTML
+    template into the asset store, under content-hash (fingerprinted) names.
+
+    The bundle holds exactly what nbconvert's lab template would inline in
+    every page (notebook and theme CSS, Pygments styles, the Mermaid loader),
+    taken from rendering an empty notebook, plus SHARED_HTML_EXTRA_CSS.
+    Returns {"name": "shared", "css": path, "js": path}, or None if nbconvert
+    is not importable.
+    """
+    exporter = get_html_exporter()
+    if exporter is None:
+        return None
+    import nbformat
+
+    page, _ = exporter.from_notebook_node(nbformat.v4.new_notebook())
+    head = page.split("</head>", 1)[0]
+    css = [
+        textwrap.dedent(block).strip() for block in STYLE_BLOCK_PATTERN.findall(head)
+    ]
+    for path in SHARED_HTML_EXTRA_CSS:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                css.append(f.read().strip())
+    js = [
+        textwrap.dedent(block).strip() for block in MODULE_SCRIPT_PATTERN.findall(head)
+    ]
+    css_path = store_asset(("\n\n".join(css) + "\n").encode("utf-8"), ".css", asset_dir)
+    js_path = store_asset(("\n\n".join(js) + "\n").encode("utf-8"), ".js", asset_dir)
+    return {
+        "name": "shared",
+        "css": manifest_key(css_path),
+        "js": manifest_key(js_path),
+    }
+
+
+def export_notebook_html(
+    exporter, notebook_path, html_path, notebook=None, template=None
+):
+    """
+    Render a notebook to HTML with an in-process exporter and write it to html_path.
+    If notebook (a parsed notebook dict) is given, it is used instead of
+    reading notebook_path from disk. template is the shared bundle record
+    (see build_shared_html_bundle) when rendering with the shared template.
+    """
+    import nbformat
+
+    if notebook is None or notebook.get("nbformat") != 4:
+        node = nbformat.read(notebook_path, as_version=4)
+    else:
+        # Same conversion nbformat.read applies after parsing JSON: build
+        # NotebookNodes and rejoin multi-line "source"/output strings
+        node = nbformat.v4.to_notebook(notebook)
+    resources = {
+        "metadata": {
+            "name": os.path.splitext(os.path.basename(notebook_path))[0],
+            "path": os.path.dirname(notebook_path),
+        }
+    }
+    if template is not None:
+        html_dir = os.path.dirname(html_path)
+        resources["shared_css_url"] = asset_url(template["css"], html_dir)
+        resources["shared_js_url"] = asset_url(template["js"], html_dir)
+    body, _ = exporter.from_notebook_node(node, resources=resources)
+    write_if_changed(html_path, body)
+
+
+def export_notebook_html_cli(notebook_path):
+    """
+    Convert a notebook to HTML by running `jupyter nbconvert` in a subprocess.
+    Fallback for environments where nbconvert cannot be imported.
+    Returns True if successful, False otherwise.
+    """
+    try:
+        subprocess.run(
+            ["jupyter", "nbconvert", "--to", "html", notebook_path],
+            capture_output=True,
+            text=True,
+            check=True,
         )
+        return True
+    except subprocess.CalledProcessError as e:
+        print(f"✗ Failed to convert {notebook_path} to HTML: {e.stderr}")
+        return False
+    except FileNotFoundError:
         print(
-            f"  [DRY-RUN] Would write index.md ({len(lines)} lines, {len(courses_data)} courses, {total_notebooks} notebook parts)"
+            "✗ jupyter command not found. Please ensure jupyter is installed and in PATH."
+        )
+        return False
+
+
+def html_converter_available(engine="auto", template=None):
+    """
+    Return True if convert_notebook_to_html has a backend for this engine and
+    template: the in-process exporter, or for engine "cli" (or "auto"
+    without a shared template) a `jupyter` command on PATH.
+    """
+    if engine != "cli" and get_html_exporter(
+        template["name"] if template else "inline"
+    ):
+        return True
+    return engine != "exporter" and not template and shutil.which("jupyter") is not None
+
+
+def convert_notebook_to_html(
+    notebook_path,
+    force=False,
+    manifest=None,
+    notebook=None,
+    part_hash=None,
+    engine="auto",
+    template=None,
+):
+    """
+    Convert a notebook to HTML with nbconvert.
+    Returns True if successful, False otherwise.
+
+    engine selects the conversion backend: "exporter" uses this process's
+    cached HTMLExporter, "cli" runs `jupyter nbconvert` in a subprocess and
+    "auto" uses the exporter when nbconvert is importable, otherwise the CLI.
+    notebook and part_hash may carry the already-parsed part and its content
+    hash to avoid reading the file again.
+
+    template, if given, is the shared bundle record from
+    build_shared_html_bundle: pages then link the bundle instead of inlining
+    nbconvert's CSS and scripts. It requires the exporter engine.
+
+    With a build manifest, conversion is skipped only when the HTML was built
+    from a split part with the same content hash as the current one, using
+    the same template and bundle.
+    """
+    html_path = os.path.splitext(notebook_path)[0] + ".html"
+    if manifest is not None:
+        key = manifest_key(notebook_path)
+        if part_hash is None:
+            part_hash = hash_file(notebook_path)
+        record = manifest["html"].get(key)
+        if (
+            not force
+            and record
+            and record.get("source_hash") == part_hash
+            and record.get("template") == template
+            and os.path.exists(html_path)
+        ):
+            print(f"Up to date: {html_path}")
+            return True
+    elif not force and os.path.exists(html_path):
+        print(f"Skipping existing HTML: {html_path} (use --force to regenerate)")
+        return True
+
+    template_name = template["name"] if template else "inline"
+    exporter = get_html_exporter(template_name) if engine != "cli" else None
+    if exporter is None and (engine == "exporter" or template):
+        print(
+            "✗ nbconvert is not importable. Install nbconvert or use --html-engine cli."
+        )
+        return False
+
+    if exporter is not None:
+        try:
+            export_notebook_html(exporter, notebook_path, html_path, notebook, template)
+        except Exception as e:
+            print(f"✗ Failed to convert {notebook_path} to HTML: {e}")
+            return False
+    elif not export_notebook_html_cli(notebook_path):
+        return False
+
+    print(f"✓ Converted {notebook_path} to HTML")
+    if manifest is not None:
+        manifest["html"][key] = {
+            "source_hash": part_hash,
+            "hash": hash_file(html_path),
+        }
+        if template:
+            manifest["html"][key]["template"] = template
+            manifest["html"][key]["assets"] = [template["css"], template["js"]]
+    return True
+
+
+def convert_notebook_task(
+    notebook_path, force, html_record=None, engine="auto", template=None
+):
+    """
+    Process-pool entry point wrapping convert_notebook_to_html.
+    html_record is the part's record from the build manifest, False when the
+    manifest is disabled. Returns (success, new_html_record, log, timing).
+    """
+    start = time.perf_counter()
+    manifest = None
+    if html_record is not False:
+        manifest = {"notebooks": {}, "html": {}, "outputs": {}}
+        if html_record:
+            manifest["html"][manifest_key(notebook_path)] = html_record
+    success, log, error = call_with_captured_output(
+        convert_notebook_to_html,
+        notebook_path,
+        force=force,
+        manifest=manifest,
+        engine=engine,
+        template=template,
+    )
+    if error is not None:
+        log += f"✗ Failed to convert {notebook_path} to HTML: {error}\n"
+        success = False
+    new_record = None
+    if manifest is not None and success:
+        new_record = manifest["html"].get(manifest_key(notebook_path))
+    timing = {
+        "wall_s": time.perf_counter() - start,
+        "peak_rss_mb": peak_rss_mb(),
+        "pid": os.getpid(),
+    }
+    return bool(success), new_record, log, timing
+
+
+def find_all_split_notebooks(root="courses", index=None):
+    """
+    Find all split notebooks in output directories across all courses.
+    Recursively searches for output directories at any level.
+    Returns a list of absolute paths to split notebooks.
+
+    root may be the index root or a directory below it; without a usable
+    index, one is built for root.
+    """
+    rel_root = index_rel_path(index, root) if index is not None else None
+    if rel_root is None:
+        index = build_tree_index(root)
+        rel_root = ""
+
+    split_notebooks = []
+    # Outputs, sources, and lesson folders are skipped
+    for rel_dir, entry in walk_tree_index(index, rel_root, skip_output=False):
+        # Check if this directory is named 'output'
+        suffix = rel_dir[len(rel_root) :].lstrip("/")
+        root_dir = os.path.join(root, *suffix.split("/")) if suffix else root
+        if os.path.basename(root_dir) == "output":
+            for filename in entry["files"]:
+                if filename.endswith(".ipynb"):
+                    split_notebooks.append(os.path.join(root_dir, filename))
+    return split_notebooks
+
+
+def convert_all_split_notebooks_to_html(
+    root="courses",
+    force=False,
+    manifest=None,
+    jobs=1,
+    engine="auto",
+    already_converted=(),
+    index=None,
+    profile=None,
+    template=None,
+    failed=None,
+):
+    """
+    Convert all split notebooks in output directories to HTML.
+    With jobs > 1 the conversions run across a process pool.
+    Parts listed in already_converted (e.g. converted in-process right after
+    splitting) are counted as successful without being converted again.
+    Per-notebook timings are added to profile, if given.
+    failed, if given, is extended with the (path, error) pairs reported.
+    Without any usable converter (see html_converter_available) the stage
+    is skipped with a warning rather than failing every notebook.
+    Returns the number of successfully converted notebooks.
+    """
+    split_notebooks = find_all_split_notebooks(root, index)
+    if manifest is not None:
+        # Forget HTML records whose split part no longer exists
+        for key in list(manifest["html"]):
+            if not os.path.exists(key):
+                html_path = os.path.splitext(key)[0] + ".html"
+                if os.path.exists(html_path):
+                    os.remove(html_path)
+                    print(f"Removed orphaned output: {html_path}")
+                del manifest["html"][key]
+
+    if not split_notebooks:
+        print("No split notebooks found in output directories.")
+        return 0
+
+    print(f"Found {len(split_notebooks)} split notebooks to convert to HTML...")
+    already_converted = set(already_converted)
+    if not html_converter_available(engine, template) and any(
+        manifest_key(path) not in already_converted for path in split_notebooks
+    ):
+        print(
+            "⚠ No HTML converter available (nbconvert is not importable and "
+            "no usable `jupyter nbconvert`); skipping HTML conversion."
+        )
+        return len(already_converted)
+    failures = []
+
+    pending = [
+        path for path in split_notebooks if manifest_key(path) not in already_converted
+    ]
+    successful_conversions = len(split_notebooks) - len(pending)
+
+    tasks = []
+    for notebook_path in pending:
+        html_record = False
+        if manifest is not None:
+            html_record = manifest["html"].get(manifest_key(notebook_path))
+        tasks.append((notebook_path, force, html_record, engine, template))
+
+    results = run_tasks(convert_notebook_task, tasks, jobs)
+    for notebook_path, (success, new_record, log, timing) in zip(pending, results):
+        print(log, end="")
+        record_notebook_timing(profile, "html", notebook_path, timing)
+        if success:
+            successful_conversions += 1
+            if manifest is not None and new_record:
+                manifest["html"][manifest_key(notebook_path)] = new_record
+        else:
+            lines = log.strip().splitlines()
+            failures.append((notebook_path, lines[-1] if lines else "unknown error"))
+
+    print(
+        f"Successfully converted {successful_conversions}/{len(split_notebooks)} notebooks to HTML"
+    )
+    report_failures("HTML conversion", failures)
+    if failed is not None:
+        failed.extend(failures)
+    return successful_conversions
+
+
+# Inline <style> blocks moved into a shared stylesheet: the sticky video
+# component from assets/embed_snippet.html
+SHARED_STYLE_MARKERS = ("sticky-video",)
+# Embedded players replaced by a click-to-load facade
+VIDEO_EMBED_HOSTS = (
+    "videoproxy",
+    "youtube.com/embed/",
+    "youtube-nocookie.com/embed/",
+    "player.vimeo.com/video/",
+)
+
+STYLE_BLOCK_PATTERN = re.compile(
+    r"<style\b[^>]*>(?P<css>.*?)</style>", re.IGNORECASE | re.DOTALL
+)
+IFRAME_PATTERN = re.compile(
+    r"<iframe\b(?P<attrs>[^>]*)>\s*</iframe>", re.IGNORECASE | re.DOTALL
+)
+IMG_TAG_PATTERN = re.compile(r"<img\b(?P<attrs>[^>]*)>", re.IGNORECASE)
+HTML_ATTR_PATTERN = re.compile(
+    r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))"""
+)
+
+VIDEO_FACADE_CSS = """\
+.video-facade {
+    display: flex;
+    flex-direction: column;
+    align-items: center;
+    justify-content: center;
+    gap: 12px;
+    width: 100%;
+    aspect-ratio: 16 / 9;
+    padding: 16px;
+    border: none;
+    background: #000;
+    color: #fff;
+    font: inherit;
+    cursor: pointer;
+}
+.sticky-video-wrapper .video-facade {
+    position: absolute;
+    top: 0;
+    left: 0;
+    height: 100%;
+    aspect-ratio: auto;
+}
+.video-facade-play {
+    width: 64px;
+    height: 64px;
+    border-radius: 50%;
+    background: rgba(255, 255, 255, 0.2);
+    font-size: 28px;
+    line-height: 64px;
+}
+.video-facade:hover .video-facade-play {
+    background: rgba(255, 255, 255, 0.35);
+}
+"""
+
+VIDEO_FACADE_JS = """\
+// Replace a click-to-load video facade with the player it stands for
+document.addEventListener("click", function (event) {
+    var facade = event.target.closest(".video-facade");
+    if (!facade) {
+        return;
+    }
+    var template = document.createElement("template");
+    template.innerHTML = facade.getAttribute("data-embed");
+    facade.replaceWith(template.content);
+});
+"""
+
+
+def parse_html_attrs(attrs):
+    """Parse an HTML tag's attribute string into a dict with lowercase names."""
+    return {
+        match.group(1).lower(): next(
+            (value for value in match.groups()[1:] if value is not None), ""
+        )
+        for match in HTML_ATTR_PATTERN.finditer(attrs)
+    }
+
+
+def image_dimensions(src, html_dir):
+    """
+    (width, height) of an image given by a data URI or a local path relative
+    to html_dir, or None if unknown (remote URLs, SVG, unreadable files).
+    PNG and GIF sizes are read from the file header; other formats need Pillow.
+    """
+    if src.startswith("data:"):
+        header, _, payload = src.partition(",")
+        if not header.endswith(";base64") or "svg" in header:
+            return None
+        try:
+            head = base64.b64decode(payload[:64])
+        except ValueError:
+            return None
+        path = None
+    else:
+        if re.match(r"^[a-zA-Z][\w+.-]*:|^//|^/", src):
+            return None
+        path = os.path.join(
+            html_dir, *urllib.parse.unquote(src.split("#")[0].split("?")[0]).split("/")
+        )
+        if not os.path.isfile(path) or path.lower().endswith(".svg"):
+            return None
+        with open(path, "rb") as f:
+            head = f.read(64)
+    if head[:8] == b"\x89PNG\r\n\x1a\n" and len(head) >= 24:
+        return struct.unpack(">II", head[16:24])
+    if head[:6] in (b"GIF87a", b"GIF89a") and len(head) >= 10:
+        return struct.unpack("<HH", head[6:10])
+    Image = get_image_module()
+    if Image is None:
+        return None
+    try:
+        source = path or io.BytesIO(base64.b64decode(src.partition(",")[2]))
+        with Image.open(source) as image:
+            return image.size
+    except (OSError, ValueError, SyntaxError):
+        return None
+
+
+def postprocess_html(content, html_dir, asset_dir=DEFAULT_ASSET_DIR):
+    """
+    Rewrite a generated HTML page for faster loading. Idempotent, so pages
+    that were already processed come back unchanged.
+
+    - Inline <style> blocks of shared components (SHARED_STYLE_MARKERS) are
+      moved into content-addressed stylesheets in the asset store, so every
+      page shares one cached copy.
+    - Embedded video players (VIDEO_EMBED_HOSTS) become a click-to-load
+      facade holding the original <iframe> in a data attribute; the facade
+      stylesheet and script are added to the page once.
+    - Images get loading="lazy" (except the first one on the page, which is
+      likely above the fold), decoding="async", and width/height when the
+      size can be determined locally and no size is set.
+    """
+
+    def store(data, extension):
+        path = store_asset(data.encode("utf-8"), extension, asset_dir)
+        return html.escape(asset_url(path, html_dir))
+
+    def replace_style(match):
+        css = match.group("css")
+        if not any(marker in css for marker in SHARED_STYLE_MARKERS):
+            return match.group(0)
+        url = store(textwrap.dedent(css).strip() + "\n", ".css")
+        return f'<link rel="stylesheet" href="{url}">'
+
+    facades = []
+
+    def replace_iframe(match):
+        attrs = parse_html_attrs(match.group("attrs"))
+        if not any(host in attrs.get("src", "") for host in VIDEO_EMBED_HOSTS):
+            return match.group(0)
+        facades.append(match)
+        title = attrs.get("title") or "Play video"
+        size = "".join(
+            f"{dim}: {attrs[dim]}{'px' if attrs[dim].isdigit() else ''}; "
+            for dim in ("width", "height")
+            if dim in attrs
+        )
+        style = f' style="{size.strip()}"' if size else ""
+        return (
+            f'<button type="button" class="video-facade" '
+            f'data-embed="{html.escape(match.group(0))}" '
+            f'aria-label="{html.escape(title)}"{style}>'
+            '<span class="video-facade-play" aria-hidden="true">&#9654;</span>'
+            f'<span class="video-facade-title">{html.escape(title)}</span>'
+            "</button>"
+        )
+
+    first_image = True
+
+    def replace_img(match):
+        nonlocal first_image
+        attrs = parse_html_attrs(match.group("attrs"))
+        added = []
+        if "loading" not in attrs and not first_image:
+            added.append('loading="lazy"')
+        first_image = False
+        if "decoding" not in attrs:
+            added.append('decoding="async"')
+        sized = "width" in attrs or "height" in attrs
+        styled = re.search(r"\b(?:width|height)\s*:", attrs.get("style", ""))
+        if not sized and not styled:
+            dimensions = image_dimensions(html.unescape(attrs.get("src", "")), html_dir)
+            if dimensions:
+                added.append(f'width="{dimensions[0]}" height="{dimensions[1]}"')
+        if not added:
+            return match.group(0)
+        return f"<img {' '.join(added)}{match.group('attrs')}>"
+
+    content = STYLE_BLOCK_PATTERN.sub(replace_style, content)
+    content = IFRAME_PATTERN.sub(replace_iframe, content)
+    content = IMG_TAG_PATTERN.sub(replace_img, content)
+
+    if 'class="video-facade"' in content:
+        css_url = store(VIDEO_FACADE_CSS, ".css")
+        js_url = store(VIDEO_FACADE_JS, ".js")
+        if js_url not in content:
+            tags = (
+                f'<link rel="stylesheet" href="{css_url}">\n'
+                f'<script src="{js_url}" defer></script>\n'
+            )
+            if "</head>" in content:
+                content = content.replace("</head>", tags + "</head>", 1)
+            else:
+                content = tags + content
+    return content
+
+
+def postprocess_html_file(html_path, asset_dir=DEFAULT_ASSET_DIR):
+    """
+    Post-process one generated HTML file in place (see postprocess_html).
+    Returns the sorted list of asset store paths the page references,
+    including those added by earlier runs.
+    """
+    with open(html_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    html_dir = os.path.dirname(html_path)
+    processed = postprocess_html(content, html_dir, asset_dir)
+    if write_if_changed(html_path, processed):
+        print(f"✓ Post-processed {html_path}")
+    prefix = asset_url(asset_dir, html_dir) + "/"
+    return sorted(
+        {
+            manifest_key(os.path.join(asset_dir, url[len(prefix) :]))
+            for url in re.findall(r'(?:href|src|srcset)="([^"]+)"', processed)
+            if url.startswith(prefix)
+        }
+    )
+
+
+def postprocess_html_task(html_path, asset_dir):
+    """
+    Process-pool entry point wrapping postprocess_html_file.
+    Returns (assets, log, error).
+    """
+    return call_with_captured_output(postprocess_html_file, html_path, asset_dir)
+
+
+def postprocess_all_html(
+    root="courses",
+    asset_dir=DEFAULT_ASSET_DIR,
+    manifest=None,
+    jobs=1,
+    index=None,
+    failed=None,
+):
+    """
+    Post-process the HTML files of all split notebooks under root across a
+    process pool. The assets each page references are recorded on its HTML
+    manifest record so the asset store keeps them.
+    failed, if given, is extended with the (path, error) pairs reported.
+    """
+    split_notebooks = find_all_split_notebooks(root, index)
+    html_paths = []
+    for notebook_path in split_notebooks:
+        html_path = os.path.splitext(notebook_path)[0] + ".html"
+        if os.path.exists(html_path):
+            html_paths.append((notebook_path, html_path))
+    if not html_paths:
+        return
+    print(f"Post-processing {len(html_paths)} HTML file(s)...")
+
+    tasks = [(html_path, asset_dir) for _, html_path in html_paths]
+    failures = []
+    for (notebook_path, html_path), (assets, log, error) in zip(
+        html_paths, run_tasks(postprocess_html_task, tasks, jobs)
+    ):
+        print(log, end="")
+        if error is not None:
+            failures.append((html_path, error))
+            continue
+        if manifest is not None:
+            record = manifest["html"].get(manifest_key(notebook_path))
+            if record is not None:
+                record["assets"] = assets
+    report_failures("HTML post-processing", failures)
+    if failed is not None:
+        failed.extend(failures)
+
+
+DEFAULT_COMPRESS_THRESHOLD = 1024
+DEFAULT_COMPRESSION_MANIFEST_PATH = "compression_manifest.json"
+COMPRESSIBLE_EXTENSIONS = (".html", ".css", ".js", ".json", ".svg")
+# Precompressed siblings written next to each file, by encoding
+COMPRESSED_SIBLINGS = (("gzip", ".gz"), ("brotli", ".br"))
+
+_brotli_module = None
+
+
+def get_brotli_module():
+    """Return the brotli module, or None if it is not importable."""
+    global _brotli_module
+    if _brotli_module is None:
+        try:
+            import brotli
+        except ImportError:
+            _brotli_module = False
+        else:
+            _brotli_module = brotli
+    return _brotli_module or None
+
+
+def find_compressible_files(dirs, threshold=DEFAULT_COMPRESS_THRESHOLD, written=()):
+    """
+    Find COMPRESSIBLE_EXTENSIONS files of at least threshold bytes under dirs.
+    Compressed siblings listed in written (manifest keys of the siblings an
+    earlier run wrote) whose source file is gone or no longer qualifies are
+    deleted, so the static host never serves stale content; .gz/.br files
+    this tool did not write are left alone. Returns sorted paths.
+    """
+    files = set()
+    siblings = []
+    for top in dirs:
+        for dirpath, _, filenames in os.walk(top):
+            for fname in filenames:
+                path = os.path.join(dirpath, fname)
+                if fname.endswith(tuple(ext for _, ext in COMPRESSED_SIBLINGS)):
+                    siblings.append(path)
+                elif (
+                    fname.lower().endswith(COMPRESSIBLE_EXTENSIONS)
+                    and os.path.getsize(path) >= threshold
+                ):
+                    files.add(path)
+    written = set(written)
+    for path in siblings:
+        if os.path.splitext(path)[0] not in files and manifest_key(path) in written:
+            os.remove(path)
+            print(f"Removed stale compressed file: {path}")
+    return sorted(files)
+
+
+def precompress_file(path, record=None):
+    """
+    Write a gzip (.gz) and, if brotli is importable, a brotli (.br) sibling of
+    path at maximum compression. Siblings that are not smaller than the file
+    are removed instead of written.
+
+    record is the file's entry from the previous compression manifest; if its
+    content hash matches and its siblings still exist, nothing is compressed.
+    Returns (record, cached), where record holds the content hash and the
+    original and compressed sizes (None for siblings not written).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    content_hash = hash_bytes(data)
+    if (
+        record is not None
+        and record.get("hash") == content_hash
+        and all(
+            os.path.exists(path + extension)
+            for encoding, extension in COMPRESSED_SIBLINGS
+            if record.get(f"{encoding}_bytes") is not None
+        )
+    ):
+        return record, True
+
+    encoded = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    brotli = get_brotli_module()
+    if brotli is not None:
+        encoded["brotli"] = brotli.compress(data, quality=11)
+    record = {"hash": content_hash, "bytes": len(data)}
+    for encoding, extension in COMPRESSED_SIBLINGS:
+        payload = encoded.get(encoding)
+        if payload is not None and len(payload) < len(data):
+            write_if_changed(path + extension, payload)
+            record[f"{encoding}_bytes"] = len(payload)
+        else:
+            if os.path.exists(path + extension):
+                os.remove(path + extension)
+            record[f"{encoding}_bytes"] = None
+    return record, False
+
+
+def precompress_task(path, record):
+    """
+    Process-pool entry point wrapping precompress_file.
+    Returns ((record, cached), log, error).
+    """
+    return call_with_captured_output(precompress_file, path, record)
+
+
+def compressed_size_totals(records):
+    """
+    Sum a list of compression records into file count, original bytes and
+    the bytes served to clients accepting gzip and brotli respectively.
+    """
+    totals = {"files": 0, "bytes": 0, "gzip_bytes": 0, "brotli_bytes": 0}
+    for record in records:
+        gzip_served = record["gzip_bytes"] or record["bytes"]
+        totals["files"] += 1
+        totals["bytes"] += record["bytes"]
+        totals["gzip_bytes"] += gzip_served
+        totals["brotli_bytes"] += record["brotli_bytes"] or gzip_served
+    return totals
+
+
+def course_of_path(path, course_folders, courses_root="courses"):
+    """
+    Course folder a file belongs to, for files under courses_root or under a
+    build directory mirroring it (e.g. _build/html/courses/...); else None.
+    """
+    key = manifest_key(path)
+    prefix = manifest_key(courses_root) + "/"
+    if not key.startswith(prefix):
+        if "/" + prefix not in key:
+            return None
+        key = prefix + key.split("/" + prefix, 1)[1]
+    rel = key[len(prefix) :]
+    for course_folder in course_folders:
+        if rel.startswith(course_folder + "/"):
+            return course_folder
+    return None
+
+
+def precompress_dirs(
+    root="courses", asset_dir=DEFAULT_ASSET_DIR, extra_dirs=(), index=None
+):
+    """
+    Directories precompressed by --precompress: the output directories of
+    the split notebooks under root, the asset store and extra_dirs.
+    """
+    output_dirs = {
+        os.path.dirname(path) for path in find_all_split_notebooks(root, index)
+    }
+    dirs = sorted(output_dirs)
+    for directory in (asset_dir,) + tuple(extra_dirs):
+        if os.path.isdir(directory):
+            dirs.append(directory)
+        elif directory != asset_dir:
+            print(f"Warning: {directory} does not exist, not precompressing it")
+    return dirs
+
+
+def precompress_outputs(
+    dirs,
+    course_folders=(),
+    threshold=DEFAULT_COMPRESS_THRESHOLD,
+    jobs=1,
+    report_path=DEFAULT_COMPRESSION_MANIFEST_PATH,
+    courses_root="courses",
+    failed=None,
+):
+    """
+    Precompress every file under dirs that the static host serves as text
+    (see find_compressible_files and precompress_file) across a process pool.
+
+    The compression manifest at report_path records, per file, the content
+    hash and original and compressed sizes, plus totals per course folder
+    (from course_folders) and overall, so page weight can be tracked across
+    builds. It doubles as the cache: unchanged files are not recompressed.
+    failed, if given, is extended with the (path, error) pairs reported.
+    """
+    previous = {}
+    try:
+        with open(report_path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        report = None
+    encodings = [
+        encoding
+        for encoding, _ in COMPRESSED_SIBLINGS
+        if encoding != "brotli" or get_brotli_module() is not None
+    ]
+    # Records made with another set of encoders would keep stale siblings
+    if isinstance(report, dict) and report.get("encodings") == encodings:
+        previous = report.get("files", {})
+    if "brotli" not in encodings:
+        print("brotli is not importable; writing gzip files only.")
+    # Siblings the previous run wrote, whatever its encoders; only these
+    # are ever deleted as stale
+    written = set()
+    if isinstance(report, dict):
+        for key, record in report.get("files", {}).items():
+            for encoding, extension in COMPRESSED_SIBLINGS:
+                if record.get(f"{encoding}_bytes") is not None:
+                    written.add(key + extension)
+
+    paths = find_compressible_files(dirs, threshold, written)
+    if not paths:
+        print("No files to precompress.")
+        return
+    print(f"Precompressing {len(paths)} file(s)...")
+
+    tasks = [(path, previous.get(manifest_key(path))) for path in paths]
+    records = {}
+    cached = 0
+    failures = []
+    for path, (result, log, error) in zip(
+        paths, run_tasks(precompress_task, tasks, jobs)
+    ):
+        print(log, end="")
+        if error is not None:
+            failures.append((path, error))
+            continue
+        record, was_cached = result
+        cached += was_cached
+        records[manifest_key(path)] = record
+    print(
+        f"Precompressed {len(records)} file(s): {len(records) - cached} compressed, "
+        f"{cached} unchanged"
+    )
+    report_failures("Precompression", failures)
+    if failed is not None:
+        failed.extend(failures)
+
+    # Longest folder first, so nested course folders win over their parents
+    course_folders = sorted(course_folders, key=len, reverse=True)
+    by_course = {}
+    for key, record in records.items():
+        course_folder = course_of_path(key, course_folders, courses_root)
+        by_course.setdefault(course_folder or "(shared)", []).append(record)
+    report = {
+        "threshold": threshold,
+        "encodings": encodings,
+        "total": compressed_size_totals(records.values()),
+        "courses": {
+            course_folder: compressed_size_totals(course_records)
+            for course_folder, course_records in sorted(by_course.items())
+        },
+        "files": records,
+    }
+    write_if_changed(report_path, json.dumps(report, indent=1, sort_keys=True) + "\n")
+    print_compression_report(report)
+
+
+def print_compression_report(report):
+    """Print original vs served bytes per course from a compression manifest."""
+    print(
+        f"\n{'files':>6} {'original KB':>12} {'gzip KB':>10} {'brotli KB':>10}  course"
+    )
+    for label, totals in list(report["courses"].items()) + [("total", report["total"])]:
+        print(
+            f"{totals['files']:>6} {totals['bytes'] / 1024:>12.1f} "
+            f"{totals['gzip_bytes'] / 1024:>10.1f} "
+            f"{totals['brotli_bytes'] / 1024:>10.1f}  {label}"
+        )
+
+
+DEFAULT_WATCH_DEBOUNCE = 0.5
+DEFAULT_WATCH_INTERVAL = 1.0
+WATCH_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp")
+
+# inotify(7) event flags
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+INOTIFY_WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+# struct inotify_event header: wd, mask, cookie, len (followed by the name)
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def is_watched_dir(name):
+    """Directories watched for source changes: not split output, excluded or hidden."""
+    return name != "output" and not is_excluded_dir(name) and not name.startswith(".")
+
+
+def is_watched_source(path):
+    """True for source notebooks and images (not split parts or temp files)."""
+    parts = manifest_key(path).split("/")
+    name = parts[-1]
+    if name.startswith(".") or not all(is_watched_dir(part) for part in parts[:-1]):
+        return False
+    return name.endswith(".ipynb") or name.lower().endswith(WATCH_IMAGE_EXTENSIONS)
+
+
+def open_inotify_watcher(root):
+    """
+    Watch every source directory under root with inotify. Returns a watcher
+    dict, or None where inotify is unavailable (e.g. not Linux), in which
+    case watch_and_rebuild falls back to polling.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    import ctypes
+    import ctypes.util
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    watcher = {"fd": fd, "libc": libc, "dirs": {}}
+    add_inotify_watches(watcher, root)
+    return watcher
+
+
+def add_inotify_watches(watcher, top):
+    """Add a watch for top and every watched directory below it."""
+    for dirpath, dirnames, _ in os.walk(top):
+        dirnames[:] = [name for name in dirnames if is_watched_dir(name)]
+        wd = watcher["libc"].inotify_add_watch(
+            watcher["fd"], os.fsencode(dirpath), INOTIFY_WATCH_MASK
         )
-    else:
-        with open(index_path, "w", encoding="utf-8") as f:
-            f.write("\n".join(lines))
+        if wd >= 0:
+            watcher["dirs"][wd] = dirpath
 
 
-def convert_notebook_to_html(notebook_path, force=False):
+def read_inotify_changes(watcher, timeout):
     """
-    Convert a notebook to HTML using jupyter nbconvert.
-    Returns True if successful, False otherwise.
+    Wait up to timeout seconds for inotify events and return the changed
+    paths. New directories are watched and their sources reported. Returns
+    None if the kernel queue overflowed and events were lost.
     """
-    html_path = os.path.splitext(notebook_path)[0] + ".html"
-    if not force and os.path.exists(html_path):
-        print(f"Skipping existing HTML: {html_path} (use --force to regenerate)")
-        return True
-
+    ready, _, _ = select.select([watcher["fd"]], [], [], timeout)
+    if not ready:
+        return set()
     try:
-        subprocess.run(
-            ["jupyter", "nbconvert", "--to", "html", notebook_path],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-        print(f"✓ Converted {notebook_path} to HTML")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"✗ Failed to convert {notebook_path} to HTML: {e.stderr}")
-        return False
-    except FileNotFoundError:
-        print(
-            "✗ jupyter command not found. Please ensure jupyter is installed and in PATH."
-        )
-        return False
+        data = os.read(watcher["fd"], 1 << 16)
+    except BlockingIOError:
+        return set()
+    changed = set()
+    offset = 0
+    while offset < len(data):
+        wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+        offset += INOTIFY_EVENT.size
+        name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+        offset += length
+        if mask & IN_Q_OVERFLOW:
+            return None
+        if mask & IN_IGNORED:
+            watcher["dirs"].pop(wd, None)
+            continue
+        directory = watcher["dirs"].get(wd)
+        if directory is None or not name:
+            continue
+        path = os.path.join(directory, name)
+        if not mask & IN_ISDIR:
+            if is_watched_source(path):
+                changed.add(path)
+        elif is_watched_dir(name):
+            changed.add(path)
+            if mask & (IN_CREATE | IN_MOVED_TO) and os.path.isdir(path):
+                # Files may have landed before the watch was added
+                add_inotify_watches(watcher, path)
+                for dirpath, dirnames, filenames in os.walk(path):
+                    dirnames[:] = [d for d in dirnames if is_watched_dir(d)]
+                    changed.update(
+                        os.path.join(dirpath, f)
+                        for f in filenames
+                        if is_watched_source(os.path.join(dirpath, f))
+                    )
+    return changed
 
 
-def find_all_split_notebooks(root="courses"):
+def poll_tree_changes(index):
     """
-    Find all split notebooks in output directories across all courses.
-    Recursively searches for output directories at any level.
-    Returns a list of absolute paths to split notebooks.
+    Rescan the courses tree and compare it with index. Returns (new index,
+    paths of source files that appeared, disappeared or changed size or mtime).
     """
-    split_notebooks = []
-    for root_dir, dirs, files in os.walk(root):
-        # Skip outputs, sources, and lesson folders
-        dirs[:] = [
-            d
-            for d in dirs
-            if d != "outputs" and d != "sources" and not d.endswith("_lesson")
-        ]
-        # Check if this directory is named 'output'
-        if os.path.basename(root_dir) == "output":
-            for filename in files:
-                if filename.endswith(".ipynb"):
-                    split_notebooks.append(os.path.join(root_dir, filename))
-    return split_notebooks
+    new_index = build_tree_index(index["root"])
+
+    def tree_files(tree):
+        return {
+            os.path.join(index_abs_path(tree, rel_dir), name): stat
+            for rel_dir, entry in walk_tree_index(tree)
+            for name, stat in entry["files"].items()
+        }
+
+    old_files = tree_files(index)
+    new_files = tree_files(new_index)
+    changed = {
+        path
+        for path in old_files.keys() | new_files.keys()
+        if old_files.get(path) != new_files.get(path) and is_watched_source(path)
+    }
+    return new_index, changed
 
 
-def convert_all_split_notebooks_to_html(root="courses", force=False):
+def wait_for_source_changes(
+    watcher, build, debounce=DEFAULT_WATCH_DEBOUNCE, interval=DEFAULT_WATCH_INTERVAL
+):
     """
-    Convert all split notebooks in output directories to HTML.
-    Returns the number of successfully converted notebooks.
+    Block until source notebooks or images change, then keep collecting
+    until no event arrived for debounce seconds, so a burst of saves causes
+    one rebuild. Returns the changed paths, or None to request a full rescan.
+    Without an inotify watcher, the tree is polled every interval seconds.
     """
-    split_notebooks = find_all_split_notebooks(root)
-    if not split_notebooks:
-        print("No split notebooks found in output directories.")
-        return 0
+    changed = set()
+    while True:
+        timeout = debounce if changed else interval
+        if watcher is not None:
+            batch = read_inotify_changes(watcher, timeout)
+        else:
+            time.sleep(timeout)
+            build["index"], batch = poll_tree_changes(build["index"])
+        if batch is None:
+            return None
+        if batch:
+            changed |= batch
+        elif changed:
+            return changed
 
-    print(f"Found {len(split_notebooks)} split notebooks to convert to HTML...")
-    successful_conversions = 0
 
-    for notebook_path in split_notebooks:
-        if convert_notebook_to_html(notebook_path, force=force):
-            successful_conversions += 1
+def active_course_items(courses_notebooks):
+    """(course_folder, notebooks) pairs of courses_notebooks, skipping deprecated courses."""
+    return [
+        (course_folder, notebooks)
+        for course_folder, notebooks in courses_notebooks.items()
+        if not (
+            course_folder.startswith("deprecated")
+            or "deprecated" in course_folder.split("/")
+        )
+    ]
 
-    print(
-        f"Successfully converted {successful_conversions}/{len(split_notebooks)} notebooks to HTML"
+
+def notebooks_using_image(image_path, notebooks, manifest):
+    """
+    Notebooks that published image_path into the asset store in their last
+    split, or that sit next to its images/ directory and reference it.
+    """
+    key = manifest_key(image_path)
+    course_dir = os.path.dirname(os.path.dirname(image_path))
+    affected = []
+    for nb_path in notebooks:
+        entry = (manifest or {"notebooks": {}})["notebooks"].get(manifest_key(nb_path))
+        if entry and any(path == key for path, _ in entry.get("images", [])):
+            affected.append(nb_path)
+        elif os.path.dirname(nb_path) == course_dir:
+            try:
+                references = find_referenced_images(nb_path)
+            except (OSError, ValueError):
+                continue
+            if key in {manifest_key(path) for path in references}:
+                affected.append(nb_path)
+    return affected
+
+
+def rebuild_changed_sources(changed, build):
+    """
+    Incrementally rebuild after a watch event: re-split the changed, added
+    and image-affected notebooks, drop the parts of removed ones, rewrite
+    _toc.yml/index.md (unchanged content is not written) and convert only
+    the parts whose content changed. changed is None after lost events, in
+    which case every notebook is checked against the manifest.
+
+    build holds the state kept in memory between rebuilds: "args", "index",
+    "manifest", "split_options", "display_names", "courses_root" and
+    "notebook_parts" (split paths per source notebook, in discovery order).
+    """
+    args = build["args"]
+    manifest = build["manifest"]
+    courses_root = build["courses_root"]
+    split_options = dict(build["split_options"], force=False)
+
+    if changed is None:
+        build["index"] = build_tree_index(courses_root)
+        changed = set()
+        rescan = True
+    else:
+        rescan = False
+        for path in sorted(changed):
+            directory = path if os.path.isdir(path) else os.path.dirname(path)
+            if not os.path.isdir(directory):
+                directory = os.path.dirname(directory)
+            refresh_tree_index(build["index"], directory)
+    index = build["index"]
+    courses_notebooks = find_notebooks_by_course(
+        root=courses_root, target_course=args.course, index=index
     )
-    return successful_conversions
+    active_courses = active_course_items(courses_notebooks)
+    notebooks = [nb_path for _, nbs in active_courses for nb_path in nbs]
+    previous = build["notebook_parts"]
+    changed_keys = {manifest_key(path) for path in changed}
+
+    # Parts of notebooks that no longer exist
+    current = set(notebooks)
+    for nb_path in [nb for nb in previous if nb not in current]:
+        print(f"Removed notebook: {nb_path}")
+        entry = None
+        if manifest is not None:
+            entry = manifest["notebooks"].pop(manifest_key(nb_path), None)
+        parts = [path for path, _ in entry["parts"]] if entry else previous[nb_path]
+        for part_path in parts:
+            remove_split_part(part_path)
+            if manifest is not None:
+                manifest["html"].pop(manifest_key(part_path), None)
+        del previous[nb_path]
+
+    to_split = [
+        nb_path
+        for nb_path in notebooks
+        if rescan or nb_path not in previous or manifest_key(nb_path) in changed_keys
+    ]
+    # Notebooks to re-split regardless of their manifest entry
+    forget_entry = set()
+    images = [
+        path
+        for path in sorted(changed)
+        if path.lower().endswith(WATCH_IMAGE_EXTENSIONS)
+    ]
+    if images and split_options.get("images"):
+        variants = split_options.get("image_variants")
+        image_failures = []
+        for image_path in images:
+            if variants is not None:
+                if os.path.isfile(image_path) and (
+                    os.path.splitext(image_path)[1].lower()
+                    in OPTIMIZABLE_IMAGE_EXTENSIONS
+                ):
+                    # A corrupt or half-written image must not stop the watcher;
+                    # skip it until the next change to the file
+                    result, log, error = optimize_image_task(
+                        image_path,
+                        split_options["images"]["dir"],
+                        split_options["images"]["max_width"],
+                    )
+                    print(log, end="")
+                    if error is not None:
+                        image_failures.append((image_path, error))
+                        continue
+                    variants[manifest_key(image_path)], _ = result
+                else:
+                    variants.pop(manifest_key(image_path), None)
+            for nb_path in notebooks_using_image(image_path, notebooks, manifest):
+                forget_entry.add(nb_path)
+                if nb_path not in to_split:
+                    to_split.append(nb_path)
+        report_failures("Image optimization", image_failures)
+    elif images:
+        print("Images changed; parts link to them on GitHub, nothing to rebuild.")
+
+    html_records = {}
+    tasks = []
+    for nb_path in to_split:
+        output_dir = os.path.join(os.path.dirname(nb_path), "output")
+        manifest_entry = False
+        records = None
+        if manifest is not None:
+            manifest_entry = manifest["notebooks"].get(manifest_key(nb_path))
+            records = {
+                path: manifest["html"][path]
+                for path, _ in (manifest_entry or {}).get("parts", [])
+                if path in manifest["html"]
+            }
+            if nb_path in forget_entry:
+                manifest_entry = None
+        tasks.append((nb_path, output_dir, split_options, manifest_entry, records))
+    failures = []
+    new_parts = []
+    for task, (split_paths, new_entry, html_results, log, error, _) in zip(
+        tasks, run_tasks(split_notebook_task, tasks, args.jobs)
+    ):
+        nb_path = task[0]
+        print(log, end="")
+        if error is not None:
+            failures.append((nb_path, error))
+            continue
+        if manifest is not None and new_entry:
+            merge_split_manifest_entry(manifest, nb_path, new_entry)
+        html_records.update(html_results)
+        previous[nb_path] = split_paths
+        new_parts.extend(split_paths)
+        refresh_tree_index(index, task[1])
+    report_failures("Splitting", failures)
+
+    # Rebuild notebook_parts in discovery order for the navigation files
+    build["notebook_parts"] = {nb: previous[nb] for nb in notebooks if nb in previous}
+    courses_data = {}
+    for course_folder, nbs in active_courses:
+        parts = [part for nb in nbs for part in build["notebook_parts"].get(nb, [])]
+        if parts:
+            courses_data[course_folder] = parts
+    if not args.preview:
+        write_toc_yml_from_courses(
+            courses_data,
+            build["display_names"],
+            "_toc.yml",
+            courses_root,
+            manifest=manifest,
+            index=index,
+        )
+        write_index_md_from_courses(
+            courses_data,
+            build["display_names"],
+            "index.md",
+            courses_root,
+            manifest=manifest,
+            index=index,
+        )
+    if args.search_index and not args.course:
+        write_search_index(
+            courses_data,
+            manifest,
+            build["display_names"],
+            args.search_index_dir,
+            args.search_shard_by,
+            courses_root,
+            index,
+        )
+
+    if not args.no_html:
+        for part_key, html_record in html_records.items():
+            if manifest is not None and html_record:
+                manifest["html"][part_key] = html_record
+        for part_path in new_parts:
+            if manifest_key(part_path) in html_records:
+                continue
+            convert_notebook_to_html(
+                part_path,
+                manifest=manifest,
+                engine=args.html_engine,
+                template=split_options["html_template"],
+            )
+        if args.postprocess_html:
+            # A page that fails to post-process is reported, not raised, so
+            # the watcher keeps running
+            failures = []
+            for part_path in new_parts:
+                html_path = os.path.splitext(part_path)[0] + ".html"
+                if not os.path.exists(html_path):
+                    continue
+                assets, log, error = postprocess_html_task(html_path, args.asset_dir)
+                print(log, end="")
+                if error is not None:
+                    failures.append((html_path, error))
+                    continue
+                record = (manifest or {"html": {}})["html"].get(manifest_key(part_path))
+                if record is not None:
+                    record["assets"] = assets
+            report_failures("HTML post-processing", failures)
+    if manifest is not None:
+        save_build_manifest(manifest, args.manifest)
+    if args.precompress:
+        precompress_outputs(
+            precompress_dirs(
+                (
+                    os.path.join(courses_root, args.course)
+                    if args.course
+                    else courses_root
+                ),
+                args.asset_dir,
+                args.precompress_dir,
+                index,
+            ),
+            courses_notebooks,
+            args.compress_threshold,
+            args.jobs,
+            args.compression_manifest,
+            courses_root,
+        )
+    if args.preview:
+        build_course_preview(
+            courses_data,
+            build["display_names"],
+            args.course,
+            args.preview_dir,
+            courses_root,
+            index,
+        )
+
+
+def watch_and_rebuild(build):
+    """
+    Watch the courses tree and rebuild incrementally on every change (see
+    rebuild_changed_sources) until interrupted. Uses inotify where available
+    and polling otherwise.
+    """
+    args = build["args"]
+    watcher = None if args.watch_poll else open_inotify_watcher(build["courses_root"])
+    if watcher is not None:
+        print(f"\nWatching {build['courses_root']} for changes (inotify)...")
+    else:
+        print(
+            f"\nWatching {build['courses_root']} for changes "
+            f"(polling every {args.watch_interval}s)..."
+        )
+    print("Press Ctrl+C to stop.")
+    try:
+        while True:
+            changed = wait_for_source_changes(
+                watcher, build, args.watch_debounce, args.watch_interval
+            )
+            start = time.perf_counter()
+            if changed is None:
+                print("\nEvents were lost; checking every notebook...")
+            else:
+                print(f"\nChanged: {', '.join(sorted(changed))}")
+            rebuild_changed_sources(changed, build)
+            print(f"Rebuilt in {time.perf_counter() - start:.2f}s; watching...")
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        if watcher is not None:
+            os.close(watcher["fd"])
+    return 0
 
 
 def main():
@@ -638,11 +3998,244 @@ def main():
         action="store_true",
         help="Show what would be processed and generated without making any changes",
     )
+    parser.add_argument(
+        "--manifest",
+        default=DEFAULT_MANIFEST_PATH,
+        help="Path of the content-hash build manifest used for incremental rebuilds "
+        f"(default: {DEFAULT_MANIFEST_PATH})",
+    )
+    parser.add_argument(
+        "--no-manifest",
+        action="store_true",
+        help="Disable the build manifest and only skip outputs that already exist",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=default_job_count(),
+        help="Number of worker processes for splitting and HTML conversion "
+        "(default: number of CPUs; 1 runs serially)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Parse notebooks incrementally and spool each part as soon as it "
+        "closes, bounding memory by the largest section instead of the whole notebook",
+    )
+    parser.add_argument(
+        "--externalize-assets",
+        action="store_true",
+        help="Move large embedded image/HTML outputs into a shared content-addressed "
+        "asset store and reference them by URL",
+    )
+    parser.add_argument(
+        "--asset-dir",
+        default=DEFAULT_ASSET_DIR,
+        help=f"Asset store directory (default: {DEFAULT_ASSET_DIR})",
+    )
+    parser.add_argument(
+        "--asset-threshold",
+        type=int,
+        default=DEFAULT_ASSET_THRESHOLD,
+        help="Minimum size in characters of an embedded output to externalize "
+        f"(default: {DEFAULT_ASSET_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--local-images",
+        action="store_true",
+        help="Copy images referenced from markdown cells into the asset store under "
+        "content-hash names and link them locally instead of via raw.githubusercontent.com",
+    )
+    parser.add_argument(
+        "--optimize-images",
+        action="store_true",
+        help="Also produce resized AVIF/WebP variants of referenced images (requires "
+        "Pillow; implies --local-images)",
+    )
+    parser.add_argument(
+        "--image-max-width",
+        type=int,
+        default=DEFAULT_IMAGE_MAX_WIDTH,
+        help="Scale optimized images down to at most this width in pixels "
+        f"(default: {DEFAULT_IMAGE_MAX_WIDTH})",
+    )
+    parser.add_argument(
+        "--max-part-bytes",
+        type=int,
+        help="Split sections larger than this many bytes further at '###' headers",
+    )
+    parser.add_argument(
+        "--max-part-cells",
+        type=int,
+        help="Split sections with more cells than this further at '###' headers",
+    )
+    parser.add_argument(
+        "--min-part-bytes",
+        type=int,
+        help="Merge parts smaller than this many bytes into an adjacent part",
+    )
+    parser.add_argument(
+        "--min-part-cells",
+        type=int,
+        help="Merge parts with fewer cells than this into an adjacent part",
+    )
+    parser.add_argument(
+        "--html-engine",
+        choices=["auto", "exporter", "cli"],
+        default="auto",
+        help="HTML conversion backend: in-process nbconvert exporter, "
+        "'jupyter nbconvert' subprocess, or auto (exporter if importable)",
+    )
+    parser.add_argument(
+        "--html-template",
+        choices=["inline", "shared"],
+        default="inline",
+        help="HTML page template: nbconvert's default with CSS and scripts inlined "
+        "in every page, or pages linking one shared, fingerprinted bundle "
+        "(requires the exporter engine)",
+    )
+    parser.add_argument(
+        "--postprocess-html",
+        action="store_true",
+        help="Post-process generated HTML: lazy images with sizes, click-to-load "
+        "video facades and shared stylesheets for embedded components",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After the build, keep running and rebuild incrementally whenever "
+        "a source notebook or image changes",
+    )
+    parser.add_argument(
+        "--watch-debounce",
+        type=float,
+        default=DEFAULT_WATCH_DEBOUNCE,
+        help="Seconds without changes before a --watch rebuild starts "
+        f"(default: {DEFAULT_WATCH_DEBOUNCE})",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=DEFAULT_WATCH_INTERVAL,
+        help="Polling interval in seconds where inotify is unavailable "
+        f"(default: {DEFAULT_WATCH_INTERVAL})",
+    )
+    parser.add_argument(
+        "--watch-poll",
+        action="store_true",
+        help="Poll for changes in --watch mode even where inotify is available",
+    )
+    parser.add_argument(
+        "--preview",
+        action="store_true",
+        help="With --course: leave _toc.yml and index.md untouched and build "
+        "a jupyter-book of just that course into --preview-dir",
+    )
+    parser.add_argument(
+        "--preview-dir",
+        default=DEFAULT_PREVIEW_DIR,
+        help=f"Where to build course previews (default: {DEFAULT_PREVIEW_DIR})",
+    )
+    parser.add_argument(
+        "--search-index",
+        action="store_true",
+        help="Build a sharded full-text search index of all split parts "
+        "while splitting (requires the build manifest)",
+    )
+    parser.add_argument(
+        "--search-index-dir",
+        default=DEFAULT_SEARCH_INDEX_DIR,
+        help=f"Where to write the search index (default: {DEFAULT_SEARCH_INDEX_DIR})",
+    )
+    parser.add_argument(
+        "--search-shard-by",
+        choices=["category", "course"],
+        default="category",
+        help="Write one search index shard per category or per course "
+        "(default: category)",
+    )
+    parser.add_argument(
+        "--precompress",
+        action="store_true",
+        help="Finish the build by writing .gz (and .br, if brotli is installed) "
+        "files next to generated HTML/CSS/JS/JSON/SVG files",
+    )
+    parser.add_argument(
+        "--precompress-only",
+        action="store_true",
+        help="Only run the --precompress stage (e.g. after jupyter-book build)",
+    )
+    parser.add_argument(
+        "--precompress-dir",
+        action="append",
+        default=[],
+        metavar="DIR",
+        help="Also precompress files under DIR, e.g. _build/html (repeatable)",
+    )
+    parser.add_argument(
+        "--compress-threshold",
+        type=int,
+        default=DEFAULT_COMPRESS_THRESHOLD,
+        help="Minimum file size in bytes to precompress "
+        f"(default: {DEFAULT_COMPRESS_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--compression-manifest",
+        default=DEFAULT_COMPRESSION_MANIFEST_PATH,
+        help="Where to write per-file and per-course compressed sizes "
+        f"(default: {DEFAULT_COMPRESSION_MANIFEST_PATH})",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=DEFAULT_PROFILE_PATH,
+        metavar="REPORT",
+        help="Record wall time and peak RSS per stage and per notebook and write "
+        f"a JSON report (default path: {DEFAULT_PROFILE_PATH})",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=10,
+        help="Number of slowest notebooks listed per stage with --profile (default: 10)",
+    )
+    parser.add_argument(
+        "--profile-split-stats",
+        metavar="PATH",
+        help="Write a cProfile stats dump of the split stage (all workers merged), "
+        "readable with pstats or snakeviz",
+    )
     args = parser.parse_args()
+    if args.html_template == "shared" and args.html_engine == "cli":
+        parser.error("--html-template shared requires --html-engine auto or exporter")
+    if args.watch and (args.dry_run or args.precompress_only):
+        parser.error("--watch cannot be combined with --dry-run or --precompress-only")
+    if args.preview and not args.course:
+        parser.error("--preview requires --course")
+    if args.search_index and args.no_manifest:
+        parser.error("--search-index requires the build manifest")
+    if args.precompress_only and args.dry_run:
+        parser.error("--precompress-only cannot be combined with --dry-run")
+
+    build_start = time.perf_counter()
+    profile = None
+    if args.profile:
+        profile = {
+            "argv": sys.argv[1:],
+            "jobs": args.jobs,
+            "stages": [],
+            "notebooks": [],
+        }
 
     # Load course display names from config
     display_names = load_course_display_names()
 
+    # The manifest is neither consulted nor updated in dry-run mode
+    manifest = None
+    if not args.no_manifest and not args.dry_run:
+        manifest = load_build_manifest(args.manifest)
+
     if args.dry_run:
         print("=" * 70)
         print("DRY-RUN MODE: No files will be created or modified")
@@ -650,9 +4243,35 @@ def main():
         print()
 
     courses_root = "courses"
-    courses_notebooks = find_notebooks_by_course(
-        root=courses_root, target_course=args.course
-    )
+    # Walk the courses tree once; discovery, naming and HTML stages query this index
+    with profile_stage(profile, "discovery"):
+        index = build_tree_index(courses_root)
+        courses_notebooks = find_notebooks_by_course(
+            root=courses_root, target_course=args.course, index=index
+        )
+    html_root = os.path.join(courses_root, args.course) if args.course else courses_root
+
+    # (path, error) pairs reported by the stages after splitting; any of
+    # them makes the build exit non-zero so CI does not publish a partial site
+    stage_failures = []
+
+    if args.precompress_only:
+        with profile_stage(profile, "precompress"):
+            precompress_outputs(
+                precompress_dirs(
+                    html_root, args.asset_dir, args.precompress_dir, index
+                ),
+                courses_notebooks,
+                args.compress_threshold,
+                args.jobs,
+                args.compression_manifest,
+                courses_root,
+                failed=stage_failures,
+            )
+        if profile is not None:
+            profile["total_wall_s"] = round(time.perf_counter() - build_start, 4)
+            write_profile_report(profile, args.profile, args.profile_top)
+        return 1 if stage_failures else 0
 
     if args.dry_run:
         print(f"Found {len(courses_notebooks)} course(s) to process:")
@@ -691,25 +4310,121 @@ def main():
         print("Notebooks that would be split:")
         print()
 
-    for course_folder, notebooks in courses_notebooks.items():
-        # Skip deprecated courses
-        if course_folder.startswith(
-            "deprecated"
-        ) or "deprecated" in course_folder.split("/"):
-            continue
+    # Skip deprecated courses
+    active_courses = active_course_items(courses_notebooks)
 
+    # Split every notebook (possibly in parallel), then consume the results in
+    # discovery order so _toc.yml and index.md match a serial run exactly
+    split_options = {
+        "force": args.force,
+        "dry_run": args.dry_run,
+        "stream": args.stream,
+        "assets": (
+            {"dir": args.asset_dir, "threshold": args.asset_threshold}
+            if args.externalize_assets
+            else None
+        ),
+        "sizing": {
+            key: value
+            for key, value in (
+                ("max_bytes", args.max_part_bytes),
+                ("max_cells", args.max_part_cells),
+                ("min_bytes", args.min_part_bytes),
+                ("min_cells", args.min_part_cells),
+            )
+            if value
+        }
+        or None,
+        "images": (
+            {"dir": args.asset_dir}
+            if args.local_images or args.optimize_images
+            else None
+        ),
+        # Convert parts to HTML while their parsed notebook is still in memory
+        "convert_html": not args.no_html,
+        "html_engine": args.html_engine,
+        "html_template": None,
+        "search": args.search_index,
+    }
+    if args.html_template == "shared" and not args.no_html and not args.dry_run:
+        # Written once here; every worker links the same fingerprinted files
+        split_options["html_template"] = build_shared_html_bundle(args.asset_dir)
+        if split_options["html_template"] is None:
+            print(
+                "✗ nbconvert is not importable; the shared HTML template is "
+                "unavailable, using --html-template inline."
+            )
+    if args.optimize_images and not args.dry_run:
+        # Optimized variants are looked up while splitting, so this runs first
+        with profile_stage(profile, "images"):
+            image_variants = optimize_referenced_images(
+                active_courses,
+                args.asset_dir,
+                args.image_max_width,
+                args.jobs,
+                failed=stage_failures,
+            )
+        if image_variants is not None:
+            split_options["images"]["max_width"] = args.image_max_width
+            split_options["image_variants"] = image_variants
+
+    split_tasks = []
+    for course_folder, notebooks in active_courses:
+        for nb_path in notebooks:
+            output_dir = os.path.join(os.path.dirname(nb_path), "output")
+            manifest_entry = False
+            html_records = None
+            if manifest is not None:
+                manifest_entry = manifest["notebooks"].get(manifest_key(nb_path))
+                html_records = {
+                    path: manifest["html"][path]
+                    for path, _ in (manifest_entry or {}).get("parts", [])
+                    if path in manifest["html"]
+                }
+            split_tasks.append(
+                (nb_path, output_dir, split_options, manifest_entry, html_records)
+            )
+    cprofile_dir = None
+    if args.profile_split_stats:
+        cprofile_dir = tempfile.mkdtemp(prefix="split_cprofile_")
+        split_options["cprofile_dir"] = cprofile_dir
+    with profile_stage(profile, "split"):
+        split_results = iter(run_tasks(split_notebook_task, split_tasks, args.jobs))
+    if cprofile_dir is not None:
+        if merge_cprofile_dumps(cprofile_dir, args.profile_split_stats):
+            print(f"Split stage cProfile stats written to {args.profile_split_stats}")
+        shutil.rmtree(cprofile_dir, ignore_errors=True)
+    split_failures = []
+    converted_parts = set()
+    # Split paths per source notebook, kept for --watch rebuilds
+    notebook_parts = {}
+
+    for course_folder, notebooks in active_courses:
         if args.dry_run:
             print(f"Course: {course_folder}")
 
         course_parts = []
         for nb_path in notebooks:
-            nb_dir = os.path.dirname(nb_path)
-            output_dir = os.path.join(nb_dir, "output")
             if args.dry_run:
                 print(f"  Processing: {nb_path}")
-            split_paths = split_notebook_by_h2(
-                nb_path, output_dir, force=args.force, dry_run=args.dry_run
+            split_paths, new_entry, html_results, log, error, timing = next(
+                split_results
             )
+            print(log, end="")
+            record_notebook_timing(profile, "split", nb_path, timing)
+            for part_key, html_timing in timing["html"].items():
+                record_notebook_timing(profile, "html", part_key, html_timing)
+            if error is not None:
+                print(f"✗ Failed to split {nb_path}: {error}")
+                split_failures.append((nb_path, error))
+                continue
+            if manifest is not None and new_entry:
+                merge_split_manifest_entry(manifest, nb_path, new_entry)
+            for part_key, html_record in html_results.items():
+                converted_parts.add(part_key)
+                if manifest is not None and html_record:
+                    manifest["html"][part_key] = html_record
+            notebook_parts[nb_path] = split_paths
             if split_paths:
                 course_parts.extend(split_paths)
                 if first_notebook is None:
@@ -722,94 +4437,63 @@ def main():
         if course_parts:
             courses_data[course_folder] = course_parts
 
-    # Write new _toc.yml organized by category and course using 'parts' format
-    toc_data = {"format": "jb-book", "root": "index.md", "parts": []}
-
-    # Group courses by category
-    categorized, sorted_categories = group_courses_by_category(courses_data)
-
-    # Check if there are any actual categories (not just uncategorized)
-    has_categories = any(cat is not None for cat in sorted_categories)
+    # Pick up split parts written (and orphans removed) since the index was built
+    if not args.dry_run:
+        for output_dir in sorted({task[1] for task in split_tasks}):
+            refresh_tree_index(index, output_dir)
 
-    # Add courses organized by category
-    # Each course remains a separate part for Jupyter Book compatibility
-    # When there are no categories, use sorted order to match original _toc.yml behavior
-    if not has_categories:
-        # No categories - sort to match original behavior (original used sorted(courses_data.keys()))
-        sorted_courses = sorted(courses_data.keys())
-        for course_folder in sorted_courses:
-            course_parts = courses_data[course_folder]
-            course_name = get_course_display_name(
-                course_folder, display_names, courses_root
+    if args.preview:
+        print("\nLeaving _toc.yml and index.md untouched (--preview)")
+    else:
+        # Write new _toc.yml organized by category and course using 'parts' format
+        with profile_stage(profile, "toc"):
+            write_toc_yml_from_courses(
+                courses_data,
+                display_names,
+                "_toc.yml",
+                courses_root,
+                args.dry_run,
+                manifest,
+                index,
             )
 
-            # Add course part with chapters
-            course_part = {"caption": course_name, "chapters": []}
-
-            for part in course_parts:
-                course_part["chapters"].append({"file": part})
-
-            toc_data["parts"].append(course_part)
-    else:
-        # Has categories - use categorized order
-        for category in sorted_categories:
-            courses_in_category = categorized[category]
+        # Generate index.md with links organized by course
+        with profile_stage(profile, "index"):
+            write_index_md_from_courses(
+                courses_data,
+                display_names,
+                "index.md",
+                courses_root,
+                args.dry_run,
+                manifest,
+                index,
+            )
 
-            for course_folder, course_parts in courses_in_category:
-                # Get display name - pass full course_folder to preserve category info for path checking
-                course_name = get_course_display_name(
-                    course_folder, display_names, courses_root
+    if args.search_index and not args.dry_run:
+        if args.course:
+            print("\nSkipping search index (only built on runs over all courses)")
+        else:
+            with profile_stage(profile, "search"):
+                search_start = time.perf_counter()
+                search_stats = write_search_index(
+                    courses_data,
+                    manifest,
+                    display_names,
+                    args.search_index_dir,
+                    args.search_shard_by,
+                    courses_root,
+                    index,
                 )
-
-                # Add course part with chapters
-                course_part = {"caption": course_name, "chapters": []}
-
-                for part in course_parts:
-                    course_part["chapters"].append({"file": part})
-
-                toc_data["parts"].append(course_part)
-
-    # Write _toc.yml with blank lines between courses for readability
-    if args.dry_run:
-        print(
-            f"  [DRY-RUN] Would write _toc.yml ({len(toc_data['parts'])} course parts)"
-        )
-    else:
-        with open("_toc.yml", "w", encoding="utf-8") as f:
-            # Write header
-            f.write("format: jb-book\n")
-            f.write("root: index.md\n")
-            f.write("parts:\n")
-
-            # Write each course part with a blank line between them
-            for i, part in enumerate(toc_data["parts"]):
-                if i > 0:
-                    f.write("\n")  # Blank line between courses
-                # Use yaml.dump to format each part as a list item
-                part_yaml = yaml.dump(
-                    [part],
-                    default_flow_style=False,
-                    sort_keys=False,
-                    allow_unicode=True,
+                print_search_index_report(
+                    search_stats, time.perf_counter() - search_start
                 )
-                # The output will be "- caption: ...\n  chapters:\n  - file: ..."
-                # Write it directly - yaml.dump already produces the correct relative indentation
-                f.write(part_yaml)
-
-    # Generate index.md with links organized by course
-    write_index_md_from_courses(
-        courses_data, display_names, "index.md", courses_root, args.dry_run
-    )
 
     # Convert all split notebooks to HTML (unless disabled)
     if args.dry_run:
         print("\n" + "=" * 70)
         print("HTML Conversion Summary:")
         print("=" * 70)
-        html_root = (
-            os.path.join(courses_root, args.course) if args.course else courses_root
-        )
-        split_notebooks = find_all_split_notebooks(html_root)
+        split_notebooks = find_all_split_notebooks(html_root, index)
         if split_notebooks:
             print(f"  Would convert {len(split_notebooks)} split notebook(s) to HTML")
             if args.force:
@@ -820,18 +4504,109 @@ def main():
         print("\n" + "=" * 50)
         print("Converting split notebooks to HTML...")
         print("=" * 50)
-        html_root = (
-            os.path.join(courses_root, args.course) if args.course else courses_root
-        )
-        convert_all_split_notebooks_to_html(root=html_root, force=args.force)
+        with profile_stage(profile, "html"):
+            convert_all_split_notebooks_to_html(
+                root=html_root,
+                force=args.force,
+                manifest=manifest,
+                jobs=args.jobs,
+                engine=args.html_engine,
+                already_converted=converted_parts,
+                index=index,
+                profile=profile,
+                template=split_options["html_template"],
+                failed=stage_failures,
+            )
+        if args.postprocess_html:
+            with profile_stage(profile, "postprocess"):
+                postprocess_all_html(
+                    html_root,
+                    args.asset_dir,
+                    manifest,
+                    args.jobs,
+                    index,
+                    failed=stage_failures,
+                )
     else:
         print("\nSkipping HTML conversion (--no-html flag provided)")
 
+    if manifest is not None:
+        with profile_stage(profile, "manifest"):
+            if (
+                (
+                    args.externalize_assets
+                    or args.local_images
+                    or args.optimize_images
+                    or args.postprocess_html
+                    or args.html_template == "shared"
+                )
+                and not args.course
+                and not split_failures
+            ):
+                prune_asset_store(manifest, args.asset_dir)
+            save_build_manifest(manifest, args.manifest)
+
+    if args.precompress and not args.dry_run:
+        print("\n" + "=" * 50)
+        print("Precompressing static output...")
+        print("=" * 50)
+        with profile_stage(profile, "precompress"):
+            precompress_outputs(
+                precompress_dirs(
+                    html_root, args.asset_dir, args.precompress_dir, index
+                ),
+                courses_notebooks,
+                args.compress_threshold,
+                args.jobs,
+                args.compression_manifest,
+                courses_root,
+                failed=stage_failures,
+            )
+
+    preview_failed = False
+    if args.preview and not args.dry_run:
+        print("\n" + "=" * 50)
+        print(f"Building preview of {args.course}...")
+        print("=" * 50)
+        with profile_stage(profile, "preview"):
+            preview_failed = (
+                build_course_preview(
+                    courses_data,
+                    display_names,
+                    args.course,
+                    args.preview_dir,
+                    courses_root,
+                    index,
+                )
+                is None
+            )
+
+    report_failures("Splitting", split_failures)
+
+    if profile is not None:
+        profile["total_wall_s"] = round(time.perf_counter() - build_start, 4)
+        write_profile_report(profile, args.profile, args.profile_top)
+
+    if args.watch:
+        return watch_and_rebuild(
+            {
+                "args": args,
+                "index": index,
+                "manifest": manifest,
+                "split_options": split_options,
+                "display_names": display_names,
+                "courses_root": courses_root,
+                "notebook_parts": notebook_parts,
+            }
+        )
+
     if args.dry_run:
         print("\n" + "=" * 70)
         print("DRY-RUN COMPLETE: No files were created or modified")
         print("=" * 70)
 
+    return 1 if split_failures or stage_failures or preview_failed else 0
+
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())